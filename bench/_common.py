@@ -0,0 +1,19 @@
+"""
+Helpers shared by the benchmarks.
+"""
+import os
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+def import_server(workdir: str):
+    # tm_sf_server writes server.log into the working directory on import
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import tm_sf_server
+    finally:
+        os.chdir(cwd)
+    return tm_sf_server
@@ -0,0 +1,182 @@
+"""
+Load test for the case-notification HTTP front end.
+
+Starts the legacy single-threaded socketserver front end and the asyncio
+front end in separate processes and drives each with an open-loop stream of
+case-change POSTs at a fixed rate, reporting p50/p99 latency (measured from
+each request's scheduled send time) and errors. Optional slow clients open a
+connection, send half a request and stall, like a half-open browser tab.
+
+Usage:
+    python bench/bench_http.py [--rate 1000] [--duration 5] [--clients 32] [--slow-clients 2]
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+def serve(kind: str, port: int):
+    """
+    Run one front end in this process until killed.
+    """
+    workdir = tempfile.mkdtemp(prefix='scdo_bench_http_')
+    os.chdir(workdir)
+    import tm_sf_server as server
+    server.settings = server.build_config_snapshot({"downloads_dir": workdir, "server_port": port})
+
+    if kind == 'legacy':
+        import http.server
+        import socketserver
+
+        class LegacyHandler(http.server.SimpleHTTPRequestHandler):
+            # The original do_POST, kept here as the baseline
+            def do_POST(self):
+                try:
+                    content_length = int(self.headers.get('Content-Length', 0))
+                    data = json.loads(self.rfile.read(content_length))
+                    case_number = data.get('case_number')
+                    company_name = data.get('company_name')
+                    if case_number is None or company_name is None:
+                        self.send_response(400)
+                        self.end_headers()
+                        self.wfile.write(b'Both "case_number" and "company_name" must be provided.')
+                        return
+                    server.logging.info(f"Received Case Number: {case_number}, Company Name: {company_name}")
+                    with server.assignments_lock:
+                        server.current_case_number = case_number
+                        server.current_company_name = company_name
+                        server.logging.info(f"Updated current_case_number to {case_number} and current_company_name to {company_name}.")
+                    self.send_response(200)
+                    self.end_headers()
+                    self.wfile.write(b'Case information received successfully.')
+                except Exception:
+                    self.send_response(500)
+                    self.end_headers()
+
+            def log_message(self, format, *args):
+                return
+
+        httpd = socketserver.TCPServer(("127.0.0.1", port), LegacyHandler)
+    else:
+        httpd = server.AsyncHTTPServer(("127.0.0.1", port), server.Handler())
+
+    print("READY", flush=True)
+    httpd.serve_forever()
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def open_slow_clients(port: int, count: int) -> list:
+    sockets = []
+    for _ in range(count):
+        s = socket.create_connection(("127.0.0.1", port))
+        s.sendall(b'POST / HTTP/1.1\r\nHost: localhost\r\nContent-Length: 64\r\n\r\n{"case_n')
+        sockets.append(s)
+    return sockets
+
+def run_load(port: int, rate: float, duration: float, clients: int) -> tuple:
+    total = int(rate * duration)
+    counter = itertools.count()
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    start = time.perf_counter() + 0.2
+    # Requests that can't be sent within this grace period count as errors
+    give_up = start + duration + 5
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        local = []
+        while True:
+            i = next(counter)
+            if i >= total:
+                break
+            scheduled = start + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if time.perf_counter() > give_up:
+                with lock:
+                    errors[0] += 1
+                continue
+            body = json.dumps({"case_number": f"0{i % 7}", "company_name": "Acme"})
+            try:
+                conn.request('POST', '/', body=body, headers={'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    raise RuntimeError(response.status)
+                local.append((time.perf_counter() - scheduled) * 1000)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return latencies, errors[0], total, elapsed
+
+def bench(kind: str, args) -> None:
+    port = free_port()
+    proc = subprocess.Popen([sys.executable, __file__, '--serve', kind, '--port', str(port)],
+                            stdout=subprocess.PIPE, text=True)
+    try:
+        if proc.stdout.readline().strip() != "READY":
+            raise RuntimeError(f"{kind} server failed to start")
+        slow = open_slow_clients(port, args.slow_clients)
+        latencies, errors, total, elapsed = run_load(port, args.rate, args.duration, args.clients)
+        for s in slow:
+            s.close()
+    finally:
+        proc.kill()
+        proc.wait()
+
+    if latencies:
+        latencies.sort()
+        p50 = statistics.median(latencies)
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"{kind:<7} {len(latencies):6d}/{total} ok  {errors:5d} errors  "
+              f"{len(latencies) / elapsed:7.0f} req/s  p50 {p50:8.2f} ms  p99 {p99:8.2f} ms")
+    else:
+        print(f"{kind:<7} 0/{total} ok  {errors:5d} errors")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rate', type=float, default=1000)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--slow-clients', type=int, default=0)
+    parser.add_argument('--serve', choices=['legacy', 'async'], help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+
+    for kind in ('legacy', 'async'):
+        bench(kind, args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Replay time of the job journal.
+
+Writes a journal of --entries lines (detected / assigned / finished
+transitions, with --live of the jobs left unfinished, as after a crash
+that skipped compaction) and times JobJournal replaying and compacting it.
+Exits with status 1 if replay takes longer than --budget-ms.
+
+Usage:
+    python bench/bench_journal.py [--entries 100000] [--live 50] [--budget-ms 100] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+def write_journal(server, path: Path, entries: int, live: int):
+    """
+    Write `entries` lines: each job is detected, reassigned and finished,
+    except the last `live` jobs, which are never finished.
+    """
+    jobs = entries // 3
+    lines = []
+    for job_id in range(1, jobs + 1):
+        entry = server.JournalEntry(f"case_export_{job_id:06d}_logs.tar.gz", 1_000_000 + job_id,
+                                    1_760_000_000.0 + job_id, "Example Company Ltd", "01234567")
+        lines.append(f"D\t{job_id}\t{server.JobJournal._payload(entry)}\n")
+        lines.append(f"A\t{job_id}\tExample Company Ltd\t01234568\n")
+        if job_id <= jobs - live:
+            lines.append(f"X\t{job_id}\n")
+    path.write_text(''.join(lines[:entries]), encoding='utf-8')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=100_000)
+    parser.add_argument('--live', type=int, default=50)
+    parser.add_argument('--budget-ms', type=float, default=100.0)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix='scdo_bench_journal_'))
+    os.chdir(workdir)
+    import tm_sf_server as server
+
+    path = workdir / 'scdo_journal.log'
+    timings = []
+    for _ in range(args.repeat):
+        write_journal(server, path, args.entries, args.live)
+        size = path.stat().st_size
+        start = time.perf_counter()
+        journal = server.JobJournal(str(path))
+        timings.append((time.perf_counter() - start) * 1000)
+        journal.close()
+
+    best = min(timings)
+    print(f"{args.entries} lines ({size / 1e6:.1f} MB): replay + compaction best {best:.1f} ms, "
+          f"worst {max(timings):.1f} ms; {len(journal.resumable)} jobs to resume; "
+          f"compacted to {path.stat().st_size} bytes")
+    if best > args.budget_ms:
+        print(f"FAIL: over the {args.budget_ms:g} ms budget")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
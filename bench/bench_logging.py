@@ -0,0 +1,98 @@
+"""
+POST latency with synchronous vs queued logging.
+
+Sends case-change notifications straight to Handler (no sockets, debounce
+off, so every request applies a change and writes a log line) and measures
+how long each takes to handle, first with the RotatingFileHandler called
+inline and then through the bounded QueueHandler/QueueListener pipeline.
+--slow-io-ms adds a delay to every write to server.log to mimic a home
+directory on a network mount.
+
+Usage:
+    python bench/bench_logging.py [--requests 5000] [--rate 1000] [--slow-io-ms 2] [--queue-size 10000]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+def run(server, requests: int, rate: float) -> list:
+    """
+    Handle `requests` notifications at `rate` per second; return per-request latencies in seconds.
+    """
+    handler = server.Handler()
+    interval = 1 / rate if rate > 0 else 0
+    latencies = []
+    start = time.perf_counter()
+    for i in range(requests):
+        due = start + i * interval
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        body = json.dumps({"case_number": str(i), "company_name": f"Company {i % 7}"}).encode()
+        request = server.Request('POST', '/', {}, {}, body, True)
+        begin = time.perf_counter()
+        response = handler.handle(request)
+        latencies.append(time.perf_counter() - begin)
+        assert response.status == 200, response.status
+    return latencies
+
+def report(name: str, latencies: list, lines: int, dropped: int):
+    ordered = sorted(latencies)
+    p50 = statistics.median(ordered) * 1e6
+    p99 = ordered[int(len(ordered) * 0.99) - 1] * 1e6
+    print(f"{name:<8} p50 {p50:9.1f} us   p99 {p99:9.1f} us   max {ordered[-1] * 1e6:10.1f} us   "
+          f"lines {lines:6d}   dropped {dropped:6d}")
+
+def log_stats(path: Path) -> tuple:
+    lines = dropped = 0
+    with open(path, encoding='utf-8') as log:
+        for line in log:
+            lines += 1
+            if 'Logging fell behind; dropped' in line:
+                dropped += int(line.split('dropped ')[1].split()[0])
+    return lines, dropped
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--rate', type=float, default=1000, help='notifications per second (0: as fast as possible)')
+    parser.add_argument('--slow-io-ms', type=float, default=2.0, help='extra delay per log write')
+    parser.add_argument('--queue-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix='scdo_bench_logging_'))
+    os.chdir(workdir)
+    import tm_sf_server as server
+    server.settings = server.build_config_snapshot({
+        "downloads_dir": str(workdir), "case_debounce_ms": 0, "log_queue_size": args.queue_size,
+    })
+
+    emit = server.log_handler.emit
+
+    def slow_emit(record):
+        time.sleep(args.slow_io_ms / 1000)
+        emit(record)
+
+    server.log_handler.emit = slow_emit
+    log_path = workdir / 'server.log'
+
+    print(f"{args.requests} notifications at {args.rate:g}/s, {args.slow_io_ms:g} ms per log write")
+    for name in ('sync', 'queued'):
+        log_path.write_text('')
+        server.log_handler.close()  # Reopen the truncated file on the next write
+        if name == 'queued':
+            server.start_queued_logging(server.settings)
+        latencies = run(server, args.requests, args.rate)
+        server.stop_queued_logging()
+        report(name, latencies, *log_stats(log_path))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,458 @@
+"""
+End-to-end benchmark of the download-organizing pipeline.
+
+Runs the real startup sweep, monitor_downloads, Mover and cleanup_old_files
+in this process against a temporary downloads_dir, while
+- a replay thread sends case-change notifications to Handler, either a
+  recorded sequence (--replay) or a generated one (--cases, --case-interval),
+- a separate writer process generates download traffic: files written in
+  place, partial downloads (.crdownload / .download) that grow over time and
+  are renamed into place, and names that repeat.
+
+Reports
+- detection latency: the final file name appears -> the monitor tracks it,
+- move latency: the download is complete -> the file is in its folder,
+  overall and for partial downloads renamed into place,
+- CPU time of this process while traffic runs and while idle (the writer
+  process is not counted),
+- attribution accuracy: files that ended up in the folder of the case that
+  was active when their download started, overall and per kind,
+- startup sweep, index reconcile and cleanup runtime.
+
+--json writes the results. --baseline compares them with an earlier --json
+file and exits with status 1 on a regression, so the script can be used to
+gate changes to monitor_downloads, cleanup_old_files and the startup sweep.
+--save-replay writes the case changes that were sent, in the --replay format:
+one JSON object per line, {"at": seconds from the start, "case_number": ...,
+"company_name": ...} (NO_CASE / NO_COMPANY for no case). Linux only; works
+offline.
+
+Usage:
+    python bench/bench_pipeline.py [--downloads 300] [--duration 20] [--partial-ratio 0.4]
+        [--collision-ratio 0.1] [--sizes 4k,64k,1m,8m] [--cases 6] [--case-interval 2]
+        [--replay FILE] [--save-replay FILE] [--leftovers 2000] [--cleanup-files 20000]
+        [--set KEY=JSON ...] [--seed 1] [--json FILE] [--baseline FILE] [--tolerance 0.25]
+"""
+import argparse
+import bisect
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+NAME_PATTERNS = ('logs_{i:05d}.zip', 'system_log_{i:05d}.tar', 'report_{i:05d}.pdf', 'capture_{i:05d}.png',
+                 'run_script_{i:05d}.sh', 'export_{i:05d}.har', 'data_{i:05d}.bin')
+PARTIAL_SUFFIXES = ('.crdownload', '.download')
+CASE_GUARD = 0.4  # Seconds around a case change in which no download starts, so the expected case is unambiguous
+SETTLE_TIMEOUT = 60
+
+# Results compared against --baseline: (key, higher is better, absolute slack)
+GATED_RESULTS = (
+    ('detection_p95_ms', False, 50), ('move_p95_ms', False, 100), ('move_max_ms', False, 500),
+    ('move_partial_p95_ms', False, 100),
+    ('cpu_traffic_s', False, 0.5), ('cpu_idle_pct', False, 2), ('accuracy', True, 0.005),
+    ('missing', False, 0), ('sweep_s', False, 0.2), ('reconcile_s', False, 0.2), ('cleanup_s', False, 0.2),
+)
+
+def parse_size(text: str) -> int:
+    units = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+    text = text.strip().lower()
+    return int(float(text[:-1]) * units[text[-1]]) if text[-1] in units else int(text)
+
+def generate_case_changes(cases: int, interval: float, duration: float, rng: random.Random) -> list:
+    """
+    A case change every `interval` seconds (+-25%), cycling through `cases`
+    cases of three companies, with every fifth change leaving the case view.
+    """
+    changes, at, index = [], 0.0, 0
+    while at < duration:
+        if index % 5 == 4:
+            changes.append({"at": round(at, 3), "case_number": "NO_CASE", "company_name": "NO_COMPANY"})
+        else:
+            case = rng.randrange(cases)
+            changes.append({"at": round(at, 3), "case_number": f"{1000000 + case:08d}",
+                            "company_name": f"Company {case % 3} Ltd"})
+        index += 1
+        at += interval * rng.uniform(0.75, 1.25)
+    return changes
+
+def plan_downloads(args, change_times: list, rng: random.Random) -> list:
+    """
+    Plan the downloads: start time, name, size and kind ('direct' or a partial suffix).
+    """
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+    downloads, finished = [], []  # finished: (completion time, name) of planned downloads
+    for i in range(args.downloads):
+        while True:
+            start = rng.uniform(0.2, max(0.3, args.duration - 2.5))
+            slot = bisect.bisect(change_times, start)
+            nearby = change_times[max(0, slot - 1):slot + 1]
+            if all(abs(start - at) > CASE_GUARD for at in nearby):
+                break
+        partial = rng.random() < args.partial_ratio
+        kind = rng.choice(PARTIAL_SUFFIXES) if partial else 'direct'
+        write_time = rng.uniform(0.5, 2.0) if partial else 0.0
+        name = rng.choice(NAME_PATTERNS).format(i=i)
+        # Reuse the name of a download that was complete (and moved) well before this one starts
+        earlier = [old_name for done, old_name in finished if done < start - 5]
+        if earlier and rng.random() < args.collision_ratio:
+            name = rng.choice(earlier)
+        downloads.append({"id": i, "start": start, "name": name, "size": rng.choice(sizes), "kind": kind,
+                          "write_time": write_time, "token": f"scdo-bench-{i:06d}-{rng.getrandbits(32):08x}"})
+        finished.append((start + write_time, name))
+    downloads.sort(key=lambda download: download["start"])
+    return downloads
+
+def write_download(downloads_dir: Path, download: dict, base: float) -> dict:
+    """
+    Write one download as a browser would. Returns the wall-clock times it
+    started, its final name appeared and it was complete.
+    """
+    delay = base + download["start"] - time.time()
+    if delay > 0:
+        time.sleep(delay)
+    final = downloads_dir / download["name"]
+    header = (download["token"] + "\n").encode()
+    size = max(download["size"], len(header))
+    started = time.time()
+    if download["kind"] == 'direct':
+        with open(final, 'wb') as file:
+            file.write(header)
+            file.truncate(size)
+        appeared = started
+    else:
+        partial = final.with_name(final.name + download["kind"])
+        steps = 5
+        with open(partial, 'wb') as file:
+            file.write(header)
+            file.flush()
+            for step in range(1, steps + 1):
+                time.sleep(download["write_time"] / steps)
+                file.truncate(len(header) + (size - len(header)) * step // steps)
+                file.flush()
+        os.rename(partial, final)
+        appeared = time.time()
+    return {"id": download["id"], "started": started, "appeared": appeared, "complete": time.time()}
+
+def writer_process(downloads_dir: str, downloads: list, connection):
+    """
+    Generate the download traffic once the parent sends the start time, then send back the timings.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    base = connection.recv()
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        timings = list(pool.map(lambda download: write_download(Path(downloads_dir), download, base), downloads))
+    connection.send(timings)
+    connection.close()
+
+def replay_case_changes(server, handler, changes: list, base: float, sent: list):
+    for change in changes:
+        delay = base + change["at"] - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        body = json.dumps({"case_number": change["case_number"], "company_name": change["company_name"]}).encode()
+        response = handler.handle(server.Request('POST', '/', {}, {}, body, True))
+        sent.append((time.time(), change))
+        assert response.status in (200, 204), response.status
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def instrument(server) -> tuple:
+    """
+    Record when the monitor starts tracking each path and when each file is moved.
+    """
+    detected, moved = defaultdict(list), defaultdict(list)
+    track = server.StabilityTracker.track
+    process = server.process_downloaded_file
+
+    def timed_track(self, path, profile):
+        pending = track(self, path, profile)
+        if pending is not None:
+            detected[str(path)].append(time.time())
+        return pending
+
+    def timed_process(pending):
+        result = process(pending)
+        if result:
+            moved[str(pending.path)].append(time.time())
+        return result
+
+    server.StabilityTracker.track = timed_track
+    server.process_downloaded_file = timed_process
+    return detected, moved
+
+def first_after(times: list, moment: float):
+    for value in times:
+        if value >= moment - 0.01:
+            return value
+    return None
+
+def wait_until_settled(server, profile, downloads_dir: Path, timeout: float) -> bool:
+    """
+    Wait until the Downloads directory holds no regular files and nothing is in flight.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with os.scandir(downloads_dir) as entries:
+            leftover = any(entry.is_file() for entry in entries)
+        with server.assignments_lock:
+            in_flight = len(profile.file_assignments)
+        if not leftover and not in_flight:
+            return True
+        time.sleep(0.1)
+    return False
+
+def locate_tokens(root: Path) -> dict:
+    """
+    Map the token at the start of every file under root (hidden folders skipped) to its relative path.
+    """
+    found = {}
+    for directory, folders, files in os.walk(root):
+        folders[:] = [folder for folder in folders if not folder.startswith('.')]
+        for name in files:
+            path = Path(directory) / name
+            with open(path, 'rb') as file:
+                token = file.readline().strip().decode(errors='replace')
+            found[token] = path.relative_to(root).as_posix()
+    return found
+
+def attribution(server, cfg, downloads: list, timings: dict, sent: list, root: Path) -> dict:
+    """
+    Compare where each download ended up with the case that was active when it started.
+    """
+    change_times = [at for at, _ in sent]
+    found = locate_tokens(root)
+    expected_paths = {}
+    for download in downloads:
+        slot = bisect.bisect(change_times, timings[download["id"]]["started"]) - 1
+        change = sent[slot][1] if slot >= 0 else None
+        if change is None or change["case_number"] == 'NO_CASE':
+            expected = f"{cfg.no_case_folder}/{download['name']}"
+        else:
+            subfolder = server.determine_subfolder(download["name"], cfg)
+            expected = (f"{server.sanitize_filename(change['company_name'])}/"
+                        f"{server.sanitize_filename(change['case_number'])}/{subfolder}/{download['name']}")
+        expected_paths[download["id"]] = expected
+
+    outcome = defaultdict(lambda: defaultdict(int))
+    by_path = defaultdict(list)
+    for download in downloads:
+        by_path[expected_paths[download["id"]]].append(download)
+    for download in downloads:
+        kind = 'direct' if download["kind"] == 'direct' else 'partial'
+        actual = found.get(download["token"])
+        expected = expected_paths[download["id"]]
+        if actual == expected:
+            result = 'correct'
+        elif actual is not None:
+            result = 'misattributed'
+        elif any(other["start"] > download["start"] for other in by_path[expected]):
+            result = 'replaced'  # A later download of the same name replaced it in the same folder
+        else:
+            result = 'missing'
+        outcome[kind][result] += 1
+        outcome['all'][result] += 1
+
+    def accuracy(counts) -> float:
+        judged = counts['correct'] + counts['misattributed'] + counts['missing']
+        return round(counts['correct'] / judged, 4) if judged else 1.0
+
+    return {
+        "accuracy": accuracy(outcome['all']),
+        "accuracy_direct": accuracy(outcome['direct']),
+        "accuracy_partial": accuracy(outcome['partial']),
+        "misattributed": outcome['all']['misattributed'],
+        "missing": outcome['all']['missing'],
+        "replaced": outcome['all']['replaced'],
+    }
+
+def run_sweep(server, profile, downloads_dir: Path, leftovers: int) -> dict:
+    for i in range(leftovers):
+        (downloads_dir / f"leftover_{i:06d}.txt").write_bytes(b'leftover\n')
+    profile.startup_sweep = server.StartupSweep(profile, server.settings.mover_workers)
+    threading.Thread(target=server.move_existing_files_to_no_case_folder, args=(profile.startup_sweep,),
+                     daemon=True).start()
+    profile.startup_sweep.finished.wait()
+    progress = profile.startup_sweep.progress()
+    return {"sweep_files": progress["moved"], "sweep_s": round(progress["elapsed_seconds"], 3)}
+
+def run_cleanup(server, profile, base_config: dict, root: Path, count: int) -> dict:
+    """
+    Create `count` old files in case folders, bring the file index up to date
+    with reconcile steps and time a real cleanup of them.
+    """
+    old = time.time() - 3 * 365 * 86400
+    for i in range(count):
+        folder = root / f"Old_Company_{i % 20}" / f"{9000000 + i % 400:08d}" / "other"
+        folder.mkdir(parents=True, exist_ok=True)
+        path = folder / f"old_{i:06d}.bin"
+        path.write_bytes(b'old\n')
+        os.utime(path, (old, old))
+
+    cfg = profile.settings
+    started = time.perf_counter()
+    while not profile.file_index().reconcile_step(root, cfg.reconcile_budget, server.excluded_cleanup_folders(cfg)):
+        pass
+    reconcile = time.perf_counter() - started
+
+    with server.config_changed:
+        server.settings = server.build_config_snapshot({
+            **base_config, "cleanup_enabled": True, "cleanup_age_threshold": "1y", "cleanup_max_ops_per_sec": 0})
+        server.config_changed.notify_all()
+    started = time.perf_counter()
+    report = server.cleanup_old_files(dry_run=False, profile=server.get_profile())
+    return {"reconcile_s": round(reconcile, 3), "cleanup_s": round(time.perf_counter() - started, 3),
+            "cleanup_files": report["files"] if report else 0}
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    failures = []
+    for key, higher_is_better, slack in GATED_RESULTS:
+        if key not in baseline or key not in results:
+            continue
+        value, reference = results[key], baseline[key]
+        if higher_is_better:
+            limit = reference - slack
+            failed = value < limit
+        else:
+            limit = reference * (1 + tolerance) + slack
+            failed = value > limit
+        if failed:
+            failures.append(f"{key}: {value} (baseline {reference}, limit {round(limit, 4)})")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--downloads', type=int, default=300)
+    parser.add_argument('--duration', type=float, default=20, help='seconds of traffic')
+    parser.add_argument('--partial-ratio', type=float, default=0.4)
+    parser.add_argument('--collision-ratio', type=float, default=0.1)
+    parser.add_argument('--sizes', default='4k,64k,1m,8m')
+    parser.add_argument('--cases', type=int, default=6)
+    parser.add_argument('--case-interval', type=float, default=2.0)
+    parser.add_argument('--replay', help='JSON-lines file of case changes to send instead of generated ones')
+    parser.add_argument('--save-replay', help='write the case changes sent to this file')
+    parser.add_argument('--leftovers', type=int, default=2000, help='files left in Downloads for the startup sweep')
+    parser.add_argument('--cleanup-files', type=int, default=20000)
+    parser.add_argument('--idle', type=float, default=3.0, help='seconds of idle time to measure CPU over')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=JSON', help='override a config value')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='fail if the results regress from this --json file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown against --baseline')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.replay:
+        with open(args.replay, encoding='utf-8') as file:
+            changes = [json.loads(line) for line in file if line.strip()]
+        args.duration = max(args.duration, changes[-1]["at"] + 3 if changes else 0)
+    else:
+        changes = generate_case_changes(args.cases, args.case_interval, args.duration, rng)
+    downloads = plan_downloads(args, [change["at"] for change in changes], rng)
+
+    workdir = Path(tempfile.mkdtemp(prefix='scdo_bench_pipeline_'))
+    downloads_dir = workdir / 'Downloads'
+    downloads_dir.mkdir()
+    os.chdir(workdir)
+
+    # Fork the writer before any threads exist
+    parent_end, child_end = multiprocessing.Pipe()
+    writer = multiprocessing.get_context('fork').Process(
+        target=writer_process, args=(str(downloads_dir), downloads, child_end), daemon=True)
+    writer.start()
+
+    import tm_sf_server as server
+    base_config = {"downloads_dir": str(downloads_dir)}
+    for item in args.set:
+        key, _, value = item.partition('=')
+        base_config[key] = json.loads(value)
+    server.settings = server.build_config_snapshot(base_config)
+    server.start_queued_logging(server.settings)
+    profile = server.get_profile()
+    detected, moved = instrument(server)
+
+    results = {"downloads": len(downloads), "case_changes": len(changes)}
+    results.update(run_sweep(server, profile, downloads_dir, args.leftovers))
+    threading.Thread(target=server.monitor_downloads, args=(None,), daemon=True).start()
+    time.sleep(0.5)
+
+    base = time.time() + 0.5
+    sent: list = []
+    replay = threading.Thread(target=replay_case_changes, args=(server, server.Handler(), changes, base, sent))
+    cpu_start = cpu_seconds()
+    replay.start()
+    parent_end.send(base)
+    timings = {timing["id"]: timing for timing in parent_end.recv()}
+    replay.join()
+    settled = wait_until_settled(server, profile, downloads_dir, SETTLE_TIMEOUT)
+    results["cpu_traffic_s"] = round(cpu_seconds() - cpu_start, 3)
+
+    cpu_start = cpu_seconds()
+    time.sleep(args.idle)
+    results["cpu_idle_pct"] = round((cpu_seconds() - cpu_start) / args.idle * 100, 2)
+
+    detection, movement, movement_partial = [], [], []
+    for download in downloads:
+        timing = timings[download["id"]]
+        path = str(downloads_dir / download["name"])
+        seen = first_after(detected[path], timing["appeared"])
+        done = first_after(moved[path], timing["complete"])
+        if seen is not None:
+            detection.append(max(0.0, seen - timing["appeared"]))
+        if done is not None:
+            movement.append(done - timing["complete"])
+            if download["kind"] != 'direct':
+                movement_partial.append(done - timing["complete"])
+    results.update({
+        "detection_p50_ms": round(percentile(detection, 0.5) * 1000, 1),
+        "detection_p95_ms": round(percentile(detection, 0.95) * 1000, 1),
+        "move_p50_ms": round(percentile(movement, 0.5) * 1000, 1),
+        "move_p95_ms": round(percentile(movement, 0.95) * 1000, 1),
+        "move_max_ms": round(max(movement, default=0) * 1000, 1),
+        "move_partial_p50_ms": round(percentile(movement_partial, 0.5) * 1000, 1),
+        "move_partial_p95_ms": round(percentile(movement_partial, 0.95) * 1000, 1),
+    })
+    results.update(attribution(server, profile.settings, downloads, timings, sent, downloads_dir))
+    results.update(run_cleanup(server, profile, base_config, downloads_dir, args.cleanup_files))
+    server.stop_queued_logging()
+
+    if args.save_replay:
+        with open(args.save_replay, 'w', encoding='utf-8') as file:
+            for at, change in sent:
+                file.write(json.dumps({**change, "at": round(at - base, 3)}) + "\n")
+
+    width = max(len(key) for key in results)
+    for key, value in results.items():
+        print(f"{key:<{width}}  {value}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+    failures = [] if settled else [f"downloads still pending after {SETTLE_TIMEOUT}s"]
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            failures += compare(results, json.load(file), args.tolerance)
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
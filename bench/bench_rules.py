@@ -0,0 +1,109 @@
+"""
+Microbenchmark for determine_subfolder: the original linear rule scan versus
+the rules compiled by load_config (suffix index + Aho-Corasick matcher).
+
+Both matchers are run over the same synthetic filenames and rules, and their
+results are compared so the benchmark also checks that first-match-wins
+ordering is unchanged.
+
+Usage:
+    python bench/bench_rules.py [--files 10000] [--rules 500] [--seed 1]
+"""
+import argparse
+import random
+import string
+import sys
+import tempfile
+import time
+
+from _common import import_server
+
+EXTENSIONS = ['.zip', '.tar', '.gz', '.tar.gz', '.tgz', '.har', '.log', '.txt', '.pdf', '.png',
+              '.jpg', '.jpeg', '.gif', '.docx', '.xlsx', '.csv', '.json', '.xml', '.yml', '.yaml',
+              '.py', '.sh', '.ps1', '.pcap', '.cfg', '.conf', '.md', '.html', '.eml', '.msg']
+WORDS = ['log', 'logs', 'report', 'summary', 'script', 'run', 'debug', 'trace', 'dump', 'core',
+         'config', 'backup', 'export', 'techsupport', 'capture', 'screen', 'shot', 'invoice',
+         'case', 'customer', 'firewall', 'panorama', 'syslog', 'audit', 'crash', 'metrics']
+
+def legacy_determine_subfolder(filename: str, rules: list, default_subfolder: str) -> str:
+    """
+    The original determine_subfolder implementation.
+    """
+    filename_lower = filename.lower()
+    for rule in rules:
+        try:
+            extensions = rule.get('extensions', [])
+            if extensions:
+                if not any(filename_lower.endswith(ext.lower()) for ext in extensions):
+                    continue
+            filename_contains = rule.get('filename_contains', [])
+            if filename_contains:
+                if not isinstance(filename_contains, list):
+                    filename_contains = [filename_contains]
+                if not any(s.lower() in filename_lower for s in filename_contains):
+                    continue
+            return rule.get('subfolder', default_subfolder)
+        except Exception:
+            pass
+    return default_subfolder
+
+def make_rules(rng: random.Random, count: int) -> list:
+    rules = []
+    for i in range(count):
+        rule = {"subfolder": f"folder_{i}"}
+        if rng.random() < 0.97:
+            rule["extensions"] = [ext.upper() if rng.random() < 0.1 else ext
+                                  for ext in rng.sample(EXTENSIONS, rng.randint(1, 4))]
+        if rng.random() < 0.6:
+            needles = [rng.choice(WORDS) + (str(rng.randint(0, 99)) if rng.random() < 0.8 else '')
+                       for _ in range(rng.randint(1, 3))]
+            rule["filename_contains"] = needles if len(needles) > 1 else needles[0]
+        rules.append(rule)
+    return rules
+
+def make_filenames(rng: random.Random, count: int) -> list:
+    names = []
+    for _ in range(count):
+        parts = [rng.choice(WORDS) for _ in range(rng.randint(1, 3))]
+        parts.append(''.join(rng.choices(string.digits, k=rng.randint(0, 6))))
+        name = '_'.join(p for p in parts if p)
+        names.append(name + rng.choice(EXTENSIONS + ['', '.bin', '.7z']))
+    return names
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('--rules', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rules = make_rules(rng, args.rules)
+    filenames = make_filenames(rng, args.files)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server = import_server(workdir)
+        start = time.perf_counter()
+        server.settings = server.build_config_snapshot(
+            {"downloads_dir": workdir, "default_subfolder": "other", "rules": rules})
+        compile_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        legacy = [legacy_determine_subfolder(name, rules, "other") for name in filenames]
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        current = [server.determine_subfolder(name) for name in filenames]
+        compiled_time = time.perf_counter() - start
+
+    mismatches = sum(1 for a, b in zip(legacy, current) if a != b)
+    print(f"{args.files} filenames x {args.rules} rules")
+    print(f"legacy scan     {legacy_time * 1000:9.1f} ms  ({legacy_time / args.files * 1e6:7.2f} us/file)")
+    print(f"compiled rules  {compiled_time * 1000:9.1f} ms  ({compiled_time / args.files * 1e6:7.2f} us/file)"
+          f"  + {compile_time * 1000:.1f} ms compile")
+    print(f"speedup         {legacy_time / compiled_time:9.1f}x")
+    print(f"mismatches      {mismatches}")
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark the directory watcher backends used by monitor_downloads.
+
+For each backend this measures:
+  * idle CPU: process CPU time consumed while nothing happens in the directory
+  * detection latency: time from creating a file to the watcher waking up
+
+The legacy busy loop (iterdir() in a tight while True) is included for comparison.
+
+Usage:
+    python bench/bench_watcher.py [--idle-seconds 5] [--samples 50]
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from _common import import_server
+
+def measure_idle_cpu(wait_forever, stop, seconds: float) -> float:
+    thread = threading.Thread(target=wait_forever, daemon=True)
+    start_cpu = time.process_time()
+    thread.start()
+    time.sleep(seconds)
+    used = time.process_time() - start_cpu
+    stop()
+    thread.join(timeout=5)
+    return used / seconds * 100
+
+def measure_latency(watcher, directory: Path, samples: int) -> list:
+    latencies = []
+    for i in range(samples):
+        detected = threading.Event()
+        created_at = [0.0]
+
+        def waiter():
+            if watcher.wait(5):
+                detected.set()
+
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        time.sleep(0.02)
+        created_at[0] = time.perf_counter()
+        (directory / f"sample_{i}.bin").write_bytes(b"x")
+        thread.join()
+        if detected.is_set():
+            latencies.append((time.perf_counter() - created_at[0]) * 1000)
+        # Let a polling watcher settle back to its idle interval between samples
+        time.sleep(0.05)
+    return latencies
+
+def bench_backend(server, backend: str, idle_seconds: float, samples: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        watcher = server.create_watcher(backend)
+        watcher.add(directory)
+        stop_flag = threading.Event()
+
+        def wait_forever():
+            while not stop_flag.is_set():
+                watcher.wait(0.5)
+
+        cpu = measure_idle_cpu(wait_forever, stop_flag.set, idle_seconds)
+        watcher.close()
+
+        watcher = server.create_watcher(backend)
+        watcher.add(directory)
+        latencies = measure_latency(watcher, directory, samples)
+        watcher.close()
+        return watcher.name, cpu, latencies
+
+def bench_busy_loop(idle_seconds: float):
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        stop_flag = threading.Event()
+
+        def busy():
+            while not stop_flag.is_set():
+                for _ in directory.iterdir():
+                    pass
+
+        return measure_idle_cpu(busy, stop_flag.set, idle_seconds)
+
+def report(name: str, cpu: float, latencies: list):
+    if latencies:
+        latencies = sorted(latencies)
+        p50 = statistics.median(latencies)
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"{name:<10} idle CPU {cpu:6.2f}%   latency p50 {p50:8.2f} ms   p99 {p99:8.2f} ms")
+    else:
+        print(f"{name:<10} idle CPU {cpu:6.2f}%   latency n/a")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--idle-seconds', type=float, default=5.0)
+    parser.add_argument('--samples', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server = import_server(workdir)
+        server.settings = server.build_config_snapshot(
+            {"downloads_dir": workdir, "monitor_interval": 0.5, "monitor_max_interval": 5})
+
+        report("busy-loop", bench_busy_loop(args.idle_seconds), [])
+        backends = ["polling"]
+        if sys.platform.startswith('linux'):
+            backends.insert(0, "inotify")
+        for backend in backends:
+            name, cpu, latencies = bench_backend(server, backend, args.idle_seconds, args.samples)
+            report(name, cpu, latencies)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+# tm_sf_server writes server.log into the working directory on import
+_cwd = os.getcwd()
+os.chdir(tempfile.mkdtemp(prefix='scdo_tests_'))
+try:
+    import tm_sf_server
+finally:
+    os.chdir(_cwd)
+
+@pytest.fixture
+def server(tmp_path):
+    """
+    The server module with a default configuration whose downloads_dir is tmp_path.
+    """
+    saved = tm_sf_server.settings
+    tm_sf_server.settings = tm_sf_server.build_config_snapshot({"downloads_dir": str(tmp_path)})
+    try:
+        yield tm_sf_server
+    finally:
+        tm_sf_server.settings = saved
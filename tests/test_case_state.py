@@ -0,0 +1,17 @@
+import time
+
+def test_download_inside_debounce_window_gets_pending_case(server):
+    state = server.CaseState()
+    assert state.update('Example', '1', 0) == 'applied'
+    time.sleep(0.01)
+    before = time.time()
+    time.sleep(0.01)
+    assert state.update('Example', '2', 60) == 'debounced'
+    assert state.state_at(time.time()) == ('Example', '2')
+    assert state.state_at(before) == ('Example', '1')
+    assert state.current() == ('Example', '1')  # Not applied until the burst settles
+
+def test_duplicate_notification_is_a_no_op(server):
+    state = server.CaseState()
+    assert state.update('Example', '1', 0) == 'applied'
+    assert state.update('Example', '1', 0) == 'duplicate'
@@ -0,0 +1,27 @@
+import os
+import time
+
+def test_first_cleanup_with_empty_index_removes_existing_old_files(server, tmp_path):
+    downloads = tmp_path / 'Downloads'
+    cfg = server.build_config_snapshot({
+        "downloads_dir": str(downloads), "index_file": str(tmp_path / 'index.db'),
+        "cleanup_enabled": True, "cleanup_age_threshold": "1d", "cleanup_max_ops_per_sec": 0,
+    })
+    old = time.time() - 3 * 86400
+    stale = downloads / 'Example' / '01234567' / 'Logs' / 'old.log'
+    recent = downloads / 'Example' / '01234567' / 'new.log'
+    kept = downloads / cfg.no_case_folder / 'old.pdf'
+    for path in (stale, recent, kept):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('x')
+    for path in (stale, kept):
+        os.utime(path, (old, old))
+
+    profile = server.Profile(cfg)
+    assert not profile.file_index().reconciled
+    report = server.cleanup_old_files(profile=profile)
+    profile.file_index().close()
+
+    assert report["files"] == 1
+    assert not stale.exists()
+    assert recent.exists() and kept.exists()
@@ -0,0 +1,27 @@
+import os
+
+def test_identical_downloads_with_sub_second_mtimes_are_deduplicated(server, tmp_path):
+    downloads = tmp_path / 'Downloads'
+    downloads.mkdir()
+    cfg = server.build_config_snapshot({
+        "downloads_dir": str(downloads), "index_file": str(tmp_path / 'index.db'),
+        "journal_file": str(tmp_path / 'journal.log'), "dedup_mode": "skip",
+    })
+    profile = server.Profile(cfg)
+    case_dir = downloads / 'Example' / '01234567'
+    pairs = 40
+    for i in range(pairs):
+        data = os.urandom(8192)
+        for copy in ('first', 'second'):
+            path = downloads / f"{copy}-{i}.bin"
+            path.write_bytes(data)
+            mtime_ns = 1_700_000_000_000_000_000 + i * 1_000_003_117 + (copy == 'second') * 123_456_789
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+            pending = server.PendingFile(path, path.stat(), profile)
+            pending.assignment = ('Example', '01234567')
+            assert server.process_downloaded_file(pending)
+            assert not path.exists()
+    profile.file_index().close()
+
+    stored = sorted(path.name for path in case_dir.rglob('*.bin'))
+    assert stored == sorted(f"first-{i}.bin" for i in range(pairs))
@@ -0,0 +1,19 @@
+def request(server, method, path, body=b''):
+    endpoint, _ = server.Handler().resolve(server.Request(method, path, {}, {}, body))
+    return endpoint()
+
+def test_unknown_get_is_not_found(server):
+    assert request(server, 'GET', '/favicon.ico').status == 404
+    assert request(server, 'HEAD', '/statuz').status == 404
+
+def test_wrong_method_on_known_path(server):
+    assert request(server, 'GET', '/reload').status == 405
+
+def test_post_to_any_path_is_a_case_notification(server):
+    body = b'{"case_number": "01234567", "company_name": "Example"}'
+    assert request(server, 'POST', '/', body).status in (200, 204)  # Applied or debounced
+    assert request(server, 'POST', '/notify', b'{"case_number": "1"}').status == 400
+
+def test_profiler_endpoints(server):
+    assert request(server, 'GET', '/profiler').status == 200
+    assert request(server, 'GET', '/profile').status == 404
@@ -0,0 +1,26 @@
+import errno
+import os
+
+def refuse(error):
+    def primitive(*args):
+        raise OSError(error, os.strerror(error))
+    return primitive
+
+def test_cross_device_copy_falls_back_to_read_write(server, tmp_path, monkeypatch):
+    # As on macOS, where sendfile only writes to sockets
+    monkeypatch.setattr(server.os, 'copy_file_range', refuse(errno.EXDEV), raising=False)
+    monkeypatch.setattr(server.os, 'sendfile', refuse(errno.ENOTSOCK), raising=False)
+    monkeypatch.setattr(server, 'MOVE_CHUNK_SIZE', 4096)
+    data = os.urandom(3 * 4096 + 123)
+    source = tmp_path / 'download.bin'
+    source.write_bytes(data)
+    os.utime(source, ns=(1_000_000_000, 1_500_000_123))
+    target = tmp_path / 'case' / 'download.bin'
+    target.parent.mkdir()
+
+    server.copy_across_devices(source, target, 'never')
+
+    assert target.read_bytes() == data
+    assert target.stat().st_mtime_ns == 1_500_000_123
+    assert not source.exists()
+    assert os.listdir(target.parent) == ['download.bin']
@@ -1,7 +1,7 @@
 // ==UserScript==
 // @name         Salesforce Case Number Notifier
 // @namespace    http://tampermonkey.net/
-// @version      3.1
+// @version      3.2
 // @description  Sends the active Salesforce case number and company name to a local server when they change or when not viewing a case.
 // @author       Anton Neledov - Palo Alto Networks
 // @match        *://*.lightning.force.com/*
@@ -16,6 +16,13 @@
     // Identifier for logging
     const LOG_PREFIX = '[SCDO]';
 
+    // Address of the local SCDO server
+    const SERVER_URL = 'http://localhost:8000';
+
+    // Profile id of this browser profile when one server serves several profiles
+    // (the "id" of an entry in the server's "profiles" list); null for a single-profile server
+    const PROFILE_ID = null;
+
     // State variables
     let lastCaseNumber = null;
     let lastCompanyName = null;
@@ -28,13 +35,14 @@
     function sendNotification(caseNumber, companyName) {
         GM_xmlhttpRequest({
             method: 'POST',
-            url: 'http://localhost:8000',
+            url: SERVER_URL,
             headers: {
                 'Content-Type': 'application/json'
             },
             data: JSON.stringify({
                 case_number: caseNumber,
-                company_name: companyName
+                company_name: companyName,
+                ...(PROFILE_ID ? { profile_id: PROFILE_ID } : {})
             }),
             timeout: 5000, // 5 seconds timeout
             onload: function(response) {
@@ -1,17 +1,47 @@
-import http.server
-import socketserver
+import asyncio
+import functools
+import gzip
+import http
+import socket
 import threading
+import urllib.parse
 import json
 import time
 import logging
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Mapping, NamedTuple
+from types import MappingProxyType
 import re
 import signal
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 import datetime
 import os
+import queue
+import posixpath
 import sys
+import select
+import struct
+import errno
+import ctypes
+import ctypes.util
+import bisect
+import collections
+import hashlib
+import heapq
+import lzma
+import mmap
+import shutil
+import sqlite3
+import stat
+import tarfile
+import zipfile
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard  # Optional: faster cold storage compression
+except ImportError:
+    zstandard = None
 
 # ----------------------------- ASCII Art -----------------------------
 
@@ -75,11 +105,55 @@ DEFAULT_CONFIG: Dict[str, Any] = {
     ],
     "default_subfolder": "other",
     "file_check_interval": 0.5,  
+    "partial_download_suffixes": [".crdownload", ".part", ".download", ".opdownload", ".partial"],
     "monitor_interval": 0.5,     
+    "monitor_max_interval": 5,
+    "watcher_backend": "auto",
+    "mover_workers": 4,
     "error_sleep": 5,
+    "config_reload_interval": 2,
+    "http_max_request_size": 65536,
+    "http_request_timeout": 10,
+    "http_keepalive_timeout": 30,
+    "case_debounce_ms": 250,
     "cleanup_enabled": False,
     "cleanup_age_threshold": "6m",
-    "cleanup_interval": "1d"  # Optional: Clean up every day
+    "cleanup_interval": "1d",  # Optional: Clean up every day
+    "index_file": "scdo_index.db",
+    "reconcile_budget": 2000,
+    "reconcile_step_interval": 5,
+    "reconcile_interval": "1d",
+    "cleanup_workers": 2,
+    "cleanup_max_ops_per_sec": 200,
+    "cleanup_dry_run": False,
+    "fsync_policy": "cross-device",
+    "move_retries": 5,
+    "move_retry_base": 1,
+    "move_retry_max": 60,
+    "profiler_enabled": False,
+    "profiler_interval_ms": 10,
+    "log_queue_size": 10000,
+    "log_format": "text",
+    "log_file_events_per_sec": 20,
+    "journal_file": "scdo_journal.log",
+    "dedup_mode": "off",
+    "dedup_scope": "case",
+    "dedup_min_size": 4096,
+    "dedup_parallel_min_size": 268435456,
+    "dedup_workers": 4,
+    "archive_index_enabled": False,
+    "archive_index_subfolders": ["Logs"],
+    "quota_total": 0,
+    "quota_per_company": 0,
+    "quota_companies": {},
+    "quota_pinned_cases": [],
+    "quota_target_ratio": 0.9,
+    "cold_storage_enabled": False,
+    "cold_storage_after": "30d",
+    "cold_storage_interval": "1d",
+    "cold_storage_format": "auto",
+    "cold_storage_workers": 2,
+    "cold_storage_nice": 10
 }
 
 # ----------------------------- Logging Setup -----------------------------
@@ -93,24 +167,451 @@ log_handler.setLevel(logging.INFO)
 # Configure the root logger
 logging.basicConfig(level=logging.INFO, handlers=[log_handler])
 
+# Per-file messages (detected, moved) go through this logger so they can be rate-limited
+file_logger = logging.getLogger('scdo.files')
+log_listener: Optional['SummarizingQueueListener'] = None
+LOG_FORMATS = ('text', 'json')
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    Formats each record as one JSON object per line.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler over a bounded queue that never blocks the logging thread:
+    when the queue is full the record is dropped and counted, and the
+    listener writes one summary line for the drops once it catches up.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self._drop_lock = threading.Lock()
+        self._dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._drop_lock:
+                self._dropped += 1
+
+    def take_dropped(self) -> int:
+        with self._drop_lock:
+            dropped, self._dropped = self._dropped, 0
+        return dropped
+
+class SummarizingQueueListener(QueueListener):
+    """
+    QueueListener that writes the records queued by a DroppingQueueHandler and
+    reports how many were dropped in one line per SUMMARY_INTERVAL seconds.
+    """
+    SUMMARY_INTERVAL = 1.0
+
+    def __init__(self, queue_handler: DroppingQueueHandler, *handlers: logging.Handler):
+        super().__init__(queue_handler.queue, *handlers, respect_handler_level=True)
+        self.queue_handler = queue_handler
+        self._last_report = time.monotonic()
+
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        while True:
+            try:
+                return self.queue.get(block, self.SUMMARY_INTERVAL)
+            except queue.Empty:
+                self.report_dropped()
+                if not block:
+                    raise
+
+    def handle(self, record: logging.LogRecord):
+        super().handle(record)
+        if time.monotonic() - self._last_report >= self.SUMMARY_INTERVAL:
+            self.report_dropped()
+
+    def report_dropped(self):
+        self._last_report = time.monotonic()
+        dropped = self.queue_handler.take_dropped()
+        if dropped:
+            super().handle(logging.makeLogRecord({
+                "name": "scdo", "levelno": logging.WARNING, "levelname": "WARNING",
+                "msg": f"Logging fell behind; dropped {dropped} messages.",
+            }))
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)  # Wait for room; the queue may be full
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most log_file_events_per_sec records per second (with a
+    burst of the same size). The first record let through after some were
+    suppressed says how many. A rate of 0 disables the limit.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        self._last = 0.0
+        self._suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = settings.log_file_events_per_sec if settings is not None else 0
+        if rate <= 0:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(rate, self._tokens + (now - self._last) * rate)
+            self._last = now
+            if self._tokens < 1:
+                self._suppressed += 1
+                return False
+            self._tokens -= 1
+            suppressed, self._suppressed = self._suppressed, 0
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = None
+        return True
+
+file_logger.addFilter(RateLimitFilter())
+
+def start_queued_logging(cfg: 'ConfigSnapshot'):
+    """
+    Apply log_format and, unless log_queue_size is 0, take log I/O off the
+    calling threads: records go into a bounded queue and a QueueListener
+    thread writes them to server.log.
+    """
+    global log_listener
+    if cfg.log_format == 'json':
+        log_handler.setFormatter(JsonLinesFormatter())
+    if cfg.log_queue_size <= 0 or log_listener is not None:
+        return
+    queue_handler = DroppingQueueHandler(queue.Queue(cfg.log_queue_size))
+    log_listener = SummarizingQueueListener(queue_handler, log_handler)
+    root = logging.getLogger()
+    root.addHandler(queue_handler)
+    root.removeHandler(log_handler)
+    log_listener.start()
+
+def stop_queued_logging():
+    """
+    Write out the queued records and go back to logging synchronously.
+    """
+    global log_listener
+    if log_listener is None:
+        return
+    root = logging.getLogger()
+    root.addHandler(log_handler)
+    root.removeHandler(log_listener.queue_handler)
+    log_listener.stop()
+    log_listener.report_dropped()
+    log_listener = None
+
+# ----------------------------- Metrics ------------------------------------
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LOCK_BUCKETS = (1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1)
+MATCH_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 1e-3)
+DOWNLOAD_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 120, 300, 900, 1800, 3600)
+
+class MetricsRegistry:
+    """
+    Collects the server's metrics and renders them in the Prometheus text
+    exposition format for GET /metrics.
+    """
+
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+def format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def format_number(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Counter:
+    """
+    Monotonic counter, optionally split by label values.
+    """
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: Dict[tuple, float] = {} if labelnames else {(): 0}
+
+    def inc(self, amount: float = 1, labels: tuple = ()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> list:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{format_labels(self.labelnames, labels)} {format_number(value)}"
+                for labels, value in values]
+
+class Histogram:
+    """
+    Cumulative histogram with fixed buckets, optionally split by label values.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: tuple = LATENCY_BUCKETS,
+                 labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._series: Dict[tuple, list] = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, labels: tuple = ()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self) -> list:
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        lines = []
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                le = f'le="{bound if bound == "+Inf" else format_number(bound)}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {format_number(values[-1])}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+class GaugeFunction:
+    """
+    Gauge whose value is read from a callback at scrape time.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, function):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+
+    def samples(self) -> list:
+        return [f"{self.name} {format_number(self.function())}"]
+
+class InstrumentedLock:
+    """
+    threading.Lock that records how long callers wait for it and hold it.
+    """
+    __slots__ = ('_lock', '_wait', '_hold', '_acquired')
+
+    def __init__(self, wait: Histogram, hold: Histogram):
+        self._lock = threading.Lock()
+        self._wait = wait
+        self._hold = hold
+        self._acquired = 0.0
+
+    def __enter__(self):
+        start = time.perf_counter()
+        self._lock.acquire()
+        self._acquired = time.perf_counter()
+        self._wait.observe(self._acquired - start)
+        return self
+
+    def __exit__(self, *exc_info):
+        held = time.perf_counter() - self._acquired
+        self._lock.release()
+        self._hold.observe(held)
+
+class SamplingProfiler:
+    """
+    Opt-in statistical profiler for finding where time goes without a debugger.
+
+    While running, a background thread samples the stack of every other
+    thread with sys._current_frames() every interval and counts identical
+    stacks. report() returns them in collapsed-stack form
+    ("thread;outer;...;inner count"), which flame graph tools read directly.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stacks: Dict[str, int] = {}
+        self._samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.interval = 0.01
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float) -> bool:
+        """
+        Start sampling (clearing earlier samples). Returns False if already running.
+        """
+        with self._lock:
+            if self.running:
+                return False
+            self.interval = interval
+            self._stacks = {}
+            self._samples = 0
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+            self._thread.start()
+        logging.info(f"Sampling profiler started ({interval * 1000:g} ms interval).")
+        return True
+
+    def stop(self) -> bool:
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return False
+        self._stop.set()
+        thread.join()
+        logging.info(f"Sampling profiler stopped after {self._samples} samples.")
+        return True
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            collected = []
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                collected.append(';'.join(reversed(stack)))
+            del frames
+            with self._lock:
+                self._samples += 1
+                for key in collected:
+                    self._stacks[key] = self._stacks.get(key, 0) + 1
+
+    def report(self, limit: Optional[int] = None) -> str:
+        with self._lock:
+            stacks = sorted(self._stacks.items(), key=lambda item: item[1], reverse=True)
+        if limit:
+            stacks = stacks[:limit]
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def status(self) -> dict:
+        return {"running": self.running, "interval_ms": self.interval * 1000, "samples": self._samples}
+
+metrics = MetricsRegistry()
+profiler = SamplingProfiler()
+
+DETECTION_TO_MOVE = metrics.register(Histogram(
+    'scdo_detection_to_move_seconds', 'Time from first seeing a download to moving it.', DOWNLOAD_BUCKETS))
+STABILITY_WAIT = metrics.register(Histogram(
+    'scdo_stability_wait_seconds', 'Time a download was watched until its size and mtime settled.',
+    DOWNLOAD_BUCKETS))
+RENAMED_DOWNLOADS = metrics.register(Counter(
+    'scdo_renamed_downloads_total', 'Downloads moved as soon as the browser renamed them into place.'))
+SUBFOLDER_MATCH_TIME = metrics.register(Histogram(
+    'scdo_determine_subfolder_seconds', 'Time spent matching a filename against the rules.', MATCH_BUCKETS))
+FILES_MOVED = metrics.register(Counter(
+    'scdo_files_moved_total', 'Downloads moved into place, by move method.', ('method',)))
+BYTES_MOVED = metrics.register(Counter('scdo_bytes_moved_total', 'Bytes of downloads moved into place.'))
+MOVE_FAILURES = metrics.register(Counter('scdo_move_failures_total', 'Failed move attempts.'))
+DEDUP_HASH_TIME = metrics.register(Histogram(
+    'scdo_dedup_hash_seconds', 'Time spent hashing downloads for deduplication.', LATENCY_BUCKETS))
+DEDUP_SAVED_BYTES = metrics.register(Counter(
+    'scdo_dedup_saved_bytes_total', 'Bytes not stored again thanks to deduplication, by action.', ('action',)))
+ARCHIVE_INDEX_TIME = metrics.register(Histogram(
+    'scdo_archive_index_seconds', 'Time to read the member list of an archive and write its index.'))
+DIRECTORY_SCANS = metrics.register(Counter('scdo_directory_scans_total', 'Scans of the Downloads directory.'))
+CASE_UPDATES = metrics.register(Counter(
+    'scdo_case_updates_total', 'Case notifications received, by outcome.', ('result',)))
+HTTP_REQUEST_TIME = metrics.register(Histogram(
+    'scdo_http_request_duration_seconds', 'Time spent handling HTTP requests.', LATENCY_BUCKETS,
+    ('method', 'endpoint')))
+ASSIGNMENTS_LOCK_WAIT = metrics.register(Histogram(
+    'scdo_assignments_lock_wait_seconds', 'Time spent waiting for assignments_lock.', LOCK_BUCKETS))
+ASSIGNMENTS_LOCK_HOLD = metrics.register(Histogram(
+    'scdo_assignments_lock_hold_seconds', 'Time assignments_lock was held.', LOCK_BUCKETS))
+CLEANUP_DURATION = metrics.register(Histogram(
+    'scdo_cleanup_duration_seconds', 'Duration of cleanup runs.', (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)))
+CLEANUP_FILES_REMOVED = metrics.register(Counter('scdo_cleanup_files_removed_total', 'Files removed by cleanup.'))
+CLEANUP_BYTES_FREED = metrics.register(Counter('scdo_cleanup_bytes_freed_total', 'Bytes freed by cleanup.'))
+QUOTA_CASES_EVICTED = metrics.register(Counter(
+    'scdo_quota_cases_evicted_total', 'Case folders deleted to stay within the storage quota.'))
+QUOTA_BYTES_FREED = metrics.register(Counter(
+    'scdo_quota_bytes_freed_total', 'Bytes freed by evicting case folders.'))
+COLD_STORAGE_CASES = metrics.register(Counter(
+    'scdo_cold_storage_cases_total', 'Case folders moved to or from cold storage.', ('action',)))
+COLD_STORAGE_BYTES = metrics.register(Counter(
+    'scdo_cold_storage_bytes_total', 'Uncompressed bytes of the case folders moved to cold storage.'))
+metrics.register(GaugeFunction(
+    'scdo_files_in_flight', 'Downloads detected but not yet moved.', lambda: sum(len(profile.file_assignments) for profile in profile_list)))
+
 # ----------------------------- Global State -------------------------------
 
-current_company_name: Optional[str] = None
-current_case_number: Optional[str] = None
-config: Dict[str, Any] = {}
-DOWNLOADS_DIR = Path()
-NO_CASE_FOLDER = ''
-DEFAULT_SUBFOLDER = ''
-file_assignments: Dict[str, Optional[tuple]] = {}
-assignments_lock = threading.Lock()
-
-FILE_CHECK_INTERVAL = 0.5  # Default: 0.5 seconds
-MONITOR_INTERVAL = 0.5     # Default: 0.5 seconds
-ERROR_SLEEP = 5            # Default: 5 seconds
-PORT = 8000                # Default port
-CLEANUP_ENABLED = False
-CLEANUP_AGE_THRESHOLD = "6m"
-CLEANUP_INTERVAL = "1d"    # Optional
+profiles: Dict[str, 'Profile'] = {}  # Profile id -> Profile, kept in sync with settings by get_profiles()
+profile_list: list = []  # The same profiles in configuration order; the first one is the default
+profiles_source: Optional['ConfigSnapshot'] = None  # Snapshot profile_list was last synced with
+profiles_lock = threading.Lock()
+hash_pool: Optional[ThreadPoolExecutor] = None  # Created on first use by get_hash_pool()
+hash_pool_lock = threading.Lock()
+archive_indexer: Optional[ThreadPoolExecutor] = None  # Created on first use by get_archive_indexer()
+archive_indexer_lock = threading.Lock()
+archive_index_pending: set = set()  # Archives queued for (re)indexing, guarded by archive_indexer_lock
+quota_enforcer: Optional[ThreadPoolExecutor] = None  # Created on first use by get_quota_enforcer()
+quota_enforcer_lock = threading.Lock()
+quota_pending: set = set()  # Ids of profiles queued for quota enforcement, guarded by quota_enforcer_lock
+cold_storage_lock = threading.Lock()  # Held while a case folder is archived or restored
+cleanup_lock = threading.Lock()  # Held while a cleanup runs; one at a time
+assignments_lock = InstrumentedLock(ASSIGNMENTS_LOCK_WAIT, ASSIGNMENTS_LOCK_HOLD)
+
+# Current configuration snapshot; replaced as a whole by load_config/reload_config
+settings: 'ConfigSnapshot' = None
+config_changed = threading.Condition()
+
+# Profile used when the configuration has no "profiles" list
+DEFAULT_PROFILE_ID = 'default'
+PROFILE_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]+')
+
+# Number of case transitions remembered for attributing downloads
+CASE_HISTORY_SIZE = 4096
+
+# Settings that are only read at startup; changing them requires a restart
+RESTART_ONLY_KEYS = ('downloads_dir', 'server_port', 'watcher_backend', 'mover_workers', 'index_file',
+                     'log_queue_size', 'log_format', 'journal_file',
+                     'dedup_workers')
 
 # ----------------------------- Utility Functions --------------------------
 
@@ -134,86 +635,910 @@ def sanitize_filename(name: str) -> str:
         sanitized = f"{sanitized}_folder"
     return sanitized
 
-def move_file_with_retry(source: Path, target: Path, retries: int = 3, delay: int = 2) -> bool:
+class ConfigSnapshot(NamedTuple):
     """
-    Attempt to move a file with retries in case of transient errors.
+    Immutable view of the configuration.
+    load_config/reload_config build a new snapshot and swap the module-level
+    `settings` reference in a single assignment, so every reader sees one
+    consistent set of values and compiled rules.
     """
-    for attempt in range(1, retries + 1):
-        try:
-            source.rename(target)
-            logging.info(f"Moved {source.name} to {target}")
-            return True
-        except Exception as e:
-            logging.error(f"Attempt {attempt}: Error moving file {source.name} to {target}: {e}")
-            if attempt < retries:
-                time.sleep(delay)
-            else:
-                logging.error(f"Failed to move {source.name} after {retries} attempts.")
-                return False
+    raw: Mapping[str, Any]
+    profile_id: str
+    url_prefix: Optional[str]
+    downloads_dir: Path
+    no_case_folder: str
+    default_subfolder: str
+    rules: 'CompiledRules'
+    file_check_interval: float
+    partial_download_suffixes: tuple
+    monitor_interval: float
+    monitor_max_interval: float
+    watcher_backend: str
+    mover_workers: int
+    error_sleep: float
+    port: int
+    cleanup_enabled: bool
+    cleanup_age_threshold: str
+    cleanup_interval: str
+    index_file: str
+    reconcile_budget: int
+    reconcile_step_interval: float
+    reconcile_interval: str
+    cleanup_workers: int
+    cleanup_max_ops_per_sec: float
+    cleanup_dry_run: bool
+    fsync_policy: str
+    move_retries: int
+    move_retry_base: float
+    move_retry_max: float
+    profiler_enabled: bool
+    profiler_interval_ms: float
+    log_queue_size: int
+    log_format: str
+    log_file_events_per_sec: float
+    journal_file: str
+    dedup_mode: str
+    dedup_scope: str
+    dedup_min_size: int
+    dedup_parallel_min_size: int
+    dedup_workers: int
+    archive_index_enabled: bool
+    archive_index_subfolders: tuple
+    quota_total: int
+    quota_per_company: int
+    quota_companies: Mapping[str, int]
+    quota_pinned_cases: frozenset
+    quota_target_ratio: float
+    cold_storage_enabled: bool
+    cold_storage_after: str
+    cold_storage_interval: str
+    cold_storage_format: str
+    cold_storage_workers: int
+    cold_storage_nice: int
+    config_reload_interval: float
+    http_max_request_size: int
+    http_request_timeout: float
+    http_keepalive_timeout: float
+    case_debounce_ms: float
+    profiles: tuple = ()  # Top-level snapshot only: one snapshot per profile
+
+def build_config_snapshot(raw: Dict[str, Any]) -> ConfigSnapshot:
+    """
+    Merge raw config values over the defaults and compile them into a snapshot.
+    Each entry of the "profiles" list is merged over the top-level values and
+    compiled into its own snapshot (snapshot.profiles); without a list, the
+    top-level values form the single "default" profile.
+    """
+    values = {**DEFAULT_CONFIG, **raw}
+    snapshot = compile_config_values(values, DEFAULT_PROFILE_ID, None)
+    profile_entries = values.get('profiles')
+    if not profile_entries:
+        return snapshot._replace(profiles=(snapshot,))
+    if not isinstance(profile_entries, list):
+        raise ValueError("profiles must be a list of objects.")
+
+    shared = {key: value for key, value in values.items() if key != 'profiles'}
+    compiled = []
+    for entry in profile_entries:
+        if not isinstance(entry, dict) or not PROFILE_ID_PATTERN.fullmatch(str(entry.get('id', ''))):
+            raise ValueError("Every profile needs an 'id' made of letters, digits, '-' and '_'.")
+        profile_id = entry['id']
+        merged = {**shared, **{key: value for key, value in entry.items() if key not in ('id', 'url_prefix')}}
+        for key in ('index_file', 'journal_file'):
+            if key not in entry:
+                # Every profile keeps its own index and journal next to the shared ones
+                stem, extension = os.path.splitext(shared[key])
+                merged[key] = f"{stem}.{profile_id}{extension}"
+        url_prefix = entry.get('url_prefix')
+        if url_prefix is not None:
+            url_prefix = '/' + str(url_prefix).strip('/')
+            if url_prefix == '/':
+                raise ValueError(f"Invalid url_prefix for profile '{profile_id}'.")
+        compiled.append(compile_config_values(merged, profile_id, url_prefix))
+
+    for field, name in (('profile_id', 'id'), ('downloads_dir', 'downloads_dir'), ('url_prefix', 'url_prefix')):
+        taken = [getattr(profile, field) for profile in compiled if getattr(profile, field) is not None]
+        if len(taken) != len(set(taken)):
+            raise ValueError(f"Every profile needs a different {name}.")
+    own_ports = [profile.port for profile in compiled if profile.port != snapshot.port]
+    if len(own_ports) != len(set(own_ports)):
+        raise ValueError("Every profile needs a different server_port.")
+    return snapshot._replace(profiles=tuple(compiled))
+
+def compile_config_values(values: Dict[str, Any], profile_id: str, url_prefix: Optional[str]) -> ConfigSnapshot:
+    """
+    Validate merged config values and compile them into the snapshot of one profile.
+    """
+    monitor_interval = values.get('monitor_interval', 0.5)
+    fsync_policy = values.get('fsync_policy', "cross-device")
+    if fsync_policy not in FSYNC_POLICIES:
+        raise ValueError(f"Invalid fsync_policy '{fsync_policy}'. Expected one of: {', '.join(FSYNC_POLICIES)}.")
+    log_format = values.get('log_format', "text")
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"Invalid log_format '{log_format}'. Expected one of: {', '.join(LOG_FORMATS)}.")
+    dedup_mode = values.get('dedup_mode', "off")
+    if dedup_mode not in DEDUP_MODES:
+        raise ValueError(f"Invalid dedup_mode '{dedup_mode}'. Expected one of: {', '.join(DEDUP_MODES)}.")
+    dedup_scope = values.get('dedup_scope', "case")
+    if dedup_scope not in DEDUP_SCOPES:
+        raise ValueError(f"Invalid dedup_scope '{dedup_scope}'. Expected one of: {', '.join(DEDUP_SCOPES)}.")
+    cold_storage_format = values.get('cold_storage_format', "auto")
+    if cold_storage_format not in COLD_STORAGE_FORMATS:
+        raise ValueError(f"Invalid cold_storage_format '{cold_storage_format}'. "
+                         f"Expected one of: {', '.join(COLD_STORAGE_FORMATS)}.")
+    return ConfigSnapshot(
+        raw=MappingProxyType(values),
+        profile_id=profile_id,
+        url_prefix=url_prefix,
+        downloads_dir=Path(values['downloads_dir']).resolve(),
+        no_case_folder=values['no_case_folder'],
+        default_subfolder=values['default_subfolder'],
+        rules=CompiledRules(values.get('rules', [])),
+        file_check_interval=values.get('file_check_interval', 0.5),
+        partial_download_suffixes=tuple(suffix.lower() for suffix in values.get(
+            'partial_download_suffixes', [".crdownload", ".part", ".download", ".opdownload", ".partial"])),
+        monitor_interval=monitor_interval,
+        monitor_max_interval=max(values.get('monitor_max_interval', 5), monitor_interval),
+        watcher_backend=values.get('watcher_backend', "auto"),
+        mover_workers=max(1, int(values.get('mover_workers', 4))),
+        error_sleep=values.get('error_sleep', 5),
+        port=values.get('server_port', 8000),
+        cleanup_enabled=values.get('cleanup_enabled', False),
+        cleanup_age_threshold=values.get('cleanup_age_threshold', "6m"),
+        cleanup_interval=values.get('cleanup_interval', "1d"),  # Optional
+        index_file=values.get('index_file', "scdo_index.db"),
+        reconcile_budget=max(1, int(values.get('reconcile_budget', 2000))),
+        reconcile_step_interval=values.get('reconcile_step_interval', 5),
+        reconcile_interval=values.get('reconcile_interval', "1d"),
+        cleanup_workers=max(1, int(values.get('cleanup_workers', 2))),
+        cleanup_max_ops_per_sec=values.get('cleanup_max_ops_per_sec', 200),
+        cleanup_dry_run=bool(values.get('cleanup_dry_run', False)),
+        fsync_policy=fsync_policy,
+        move_retries=max(1, int(values.get('move_retries', 5))),
+        move_retry_base=values.get('move_retry_base', 1),
+        move_retry_max=values.get('move_retry_max', 60),
+        profiler_enabled=bool(values.get('profiler_enabled', False)),
+        profiler_interval_ms=max(1, values.get('profiler_interval_ms', 10)),
+        log_queue_size=max(0, int(values.get('log_queue_size', 10000))),
+        log_format=log_format,
+        log_file_events_per_sec=values.get('log_file_events_per_sec', 20),
+        journal_file=values.get('journal_file', "scdo_journal.log"),
+        dedup_mode=dedup_mode,
+        dedup_scope=dedup_scope,
+        dedup_min_size=max(1, int(values.get('dedup_min_size', 4096))),
+        dedup_parallel_min_size=int(values.get('dedup_parallel_min_size', 268435456)),
+        dedup_workers=max(1, int(values.get('dedup_workers', 4))),
+        archive_index_enabled=bool(values.get('archive_index_enabled', False)),
+        archive_index_subfolders=tuple(values.get('archive_index_subfolders', ["Logs"])),
+        quota_total=parse_byte_size(values.get('quota_total', 0)),
+        quota_per_company=parse_byte_size(values.get('quota_per_company', 0)),
+        quota_companies=MappingProxyType({sanitize_filename(company): parse_byte_size(budget)
+                                          for company, budget in values.get('quota_companies', {}).items()}),
+        quota_pinned_cases=pinned_case_folders(values.get('quota_pinned_cases', [])),
+        quota_target_ratio=min(1.0, max(0.1, float(values.get('quota_target_ratio', 0.9)))),
+        cold_storage_enabled=bool(values.get('cold_storage_enabled', False)),
+        cold_storage_after=values.get('cold_storage_after', "30d"),
+        cold_storage_interval=values.get('cold_storage_interval', "1d"),
+        cold_storage_format=cold_storage_format,
+        cold_storage_workers=max(1, int(values.get('cold_storage_workers', 2))),
+        cold_storage_nice=max(0, int(values.get('cold_storage_nice', 10))),
+        config_reload_interval=values.get('config_reload_interval', 2),
+        http_max_request_size=values.get('http_max_request_size', 65536),
+        http_request_timeout=values.get('http_request_timeout', 10),
+        http_keepalive_timeout=values.get('http_keepalive_timeout', 30),
+        case_debounce_ms=values.get('case_debounce_ms', 250),
+    )
+
+def read_config_file() -> Dict[str, Any]:
+    """
+    Read and parse the config.json file. Raises on missing or invalid files.
+    """
+    with open(CONFIG_FILE, 'r') as f:
+        raw = json.load(f)
+    if not isinstance(raw, dict):
+        raise ValueError("top-level JSON value must be an object")
+    return raw
 
 def load_config():
     """
     Load configuration from the config.json file.
     Overrides default values with those provided in the file.
     """
-    global config, DOWNLOADS_DIR, NO_CASE_FOLDER, DEFAULT_SUBFOLDER
-    global FILE_CHECK_INTERVAL, MONITOR_INTERVAL, ERROR_SLEEP, PORT
-    global CLEANUP_ENABLED, CLEANUP_AGE_THRESHOLD, CLEANUP_INTERVAL
+    global settings
 
     try:
-        with open(CONFIG_FILE, 'r') as f:
-            config = json.load(f)
-            logging.info(f"Configuration loaded from {CONFIG_FILE}")
+        raw = read_config_file()
+        logging.info(f"Configuration loaded from {CONFIG_FILE}")
     except FileNotFoundError:
         logging.warning(f"{CONFIG_FILE} not found. Using default configuration.")
-        config = DEFAULT_CONFIG.copy()
+        raw = {}
     except json.JSONDecodeError as e:
         logging.error(f"Invalid JSON in {CONFIG_FILE}: {e}. Using default configuration.")
-        config = DEFAULT_CONFIG.copy()
+        raw = {}
     except Exception as e:
         logging.error(f"Error loading {CONFIG_FILE}: {e}. Using default configuration.")
-        config = DEFAULT_CONFIG.copy()
+        raw = {}
+
+    with config_changed:
+        settings = build_config_snapshot(raw)
+        config_changed.notify_all()
+
+def reload_config() -> Dict[str, Any]:
+    """
+    Re-read config.json and atomically swap in a freshly compiled snapshot.
+    Unlike load_config, a missing or invalid file keeps the running configuration
+    (the error is raised to the caller). Settings in RESTART_ONLY_KEYS keep their
+    current values until the server is restarted.
+    Returns the changed and restart-only keys.
+    """
+    global settings
 
-    # Override defaults with config file values
-    config = {**DEFAULT_CONFIG, **config}
+    raw = read_config_file()
+    current = settings
+    new_values = {**DEFAULT_CONFIG, **raw}
+    restart_required = [key for key in RESTART_ONLY_KEYS if new_values.get(key) != current.raw.get(key)]
+    for key in restart_required:
+        new_values[key] = current.raw.get(key)
+    snapshot = build_config_snapshot(new_values)
+    if profile_identities(snapshot) != profile_identities(current):
+        # Adding, removing or moving a profile needs a restart; its other settings can be reloaded
+        restart_required.append('profiles')
+        new_values['profiles'] = current.raw.get('profiles')
+        snapshot = build_config_snapshot(new_values)
+    changed = sorted(key for key in set(snapshot.raw) | set(current.raw)
+                     if snapshot.raw.get(key) != current.raw.get(key))
 
-    # Set global variables from config
-    DOWNLOADS_DIR = Path(config['downloads_dir']).resolve()
-    NO_CASE_FOLDER = config['no_case_folder']
-    DEFAULT_SUBFOLDER = config['default_subfolder']
-    FILE_CHECK_INTERVAL = config.get('file_check_interval', 0.5)
-    MONITOR_INTERVAL = config.get('monitor_interval', 0.5)
-    ERROR_SLEEP = config.get('error_sleep', 5)
-    PORT = config.get('server_port', 8000)
-    CLEANUP_ENABLED = config.get('cleanup_enabled', False)
-    CLEANUP_AGE_THRESHOLD = config.get('cleanup_age_threshold', "6m")
-    CLEANUP_INTERVAL = config.get('cleanup_interval', "1d")  # Optional
+    with config_changed:
+        settings = snapshot
+        config_changed.notify_all()
+
+    # A lowered budget takes effect without waiting for the next download
+    for profile in get_profiles():
+        schedule_quota_check(profile)
+
+    if restart_required:
+        logging.warning(f"Configuration reloaded, but {', '.join(restart_required)} only take effect after a restart.")
+    logging.info(f"Configuration reloaded from {CONFIG_FILE}. Changed settings: {', '.join(changed) or 'none'}")
+    return {"changed": changed, "restart_required": restart_required}
+
+def profile_identities(cfg: ConfigSnapshot) -> tuple:
+    """
+    The per-profile settings that are only read at startup.
+    """
+    return tuple((profile.profile_id, profile.downloads_dir, profile.port, profile.url_prefix,
+                  profile.index_file, profile.journal_file) for profile in cfg.profiles)
+
+def wait_for_config_change(seen: ConfigSnapshot, timeout: Optional[float] = None) -> bool:
+    """
+    Block until a snapshot other than `seen` is installed or the timeout expires.
+    Returns True if the configuration changed.
+    """
+    with config_changed:
+        return config_changed.wait_for(lambda: settings is not seen, timeout)
+
+def config_file_signature() -> Optional[tuple]:
+    try:
+        st = os.stat(CONFIG_FILE)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def watch_config_file():
+    """
+    Reload config.json whenever its modification time or size changes.
+    Checks every config_reload_interval seconds; a value of 0 stops watching.
+    """
+    last_signature = config_file_signature()
+    logging.info(f"Watching {CONFIG_FILE} for changes.")
+    while settings.config_reload_interval > 0:
+        time.sleep(settings.config_reload_interval)
+        signature = config_file_signature()
+        if signature == last_signature or signature is None:
+            continue
+        last_signature = signature
+        try:
+            reload_config()
+        except Exception as e:
+            logging.error(f"Error reloading {CONFIG_FILE}: {e}. Keeping the current configuration.")
+    logging.info(f"Stopped watching {CONFIG_FILE} (config_reload_interval is 0).")
 
-def determine_subfolder(filename: str) -> str:
+def determine_subfolder(filename: str, cfg: Optional[ConfigSnapshot] = None) -> str:
     """
     Determine the appropriate subfolder for a file based on configured rules.
+    Uses the rules compiled into the config snapshot; the first matching rule wins.
     """
-    filename_lower = filename.lower()
-    for rule in config.get('rules', []):
-        try:
-            # Check extensions
-            extensions = rule.get('extensions', [])
-            if extensions:
-                if not any(filename_lower.endswith(ext.lower()) for ext in extensions):
-                    continue  # Extension doesn't match, check next rule
-            # Check filename_contains
-            filename_contains = rule.get('filename_contains', [])
-            if filename_contains:
-                if not isinstance(filename_contains, list):
-                    filename_contains = [filename_contains]
-                if not any(s.lower() in filename_lower for s in filename_contains):
+    cfg = cfg or settings
+    return cfg.rules.match(filename, cfg.default_subfolder)
+
+# ----------------------------- Rule Engine -------------------------------
+
+class SubstringMatcher:
+    """
+    Aho-Corasick automaton that finds every configured substring present in
+    a filename with a single pass over its characters.
+    """
+
+    def __init__(self, needles: list):
+        self._goto: list = [{}]
+        self._fail: list = [0]
+        self._output: list = [()]
+        for needle_id, needle in enumerate(needles):
+            state = 0
+            for ch in needle:
+                next_state = self._goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][ch] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = next_state
+            self._output[state] += (needle_id,)
+
+        # Breadth-first pass to compute failure links and merge outputs
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(ch, 0)
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def find_all(self, text: str) -> set:
+        """
+        Return the ids of all needles that occur in text.
+        """
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+class CompiledRule:
+    """
+    A single rule from config['rules'] with its strings normalised once.
+    """
+    __slots__ = ('index', 'subfolder', 'extensions', 'needle_ids', 'always_contains')
+
+    def __init__(self, index: int, subfolder: Optional[str], extensions: tuple,
+                 needle_ids: frozenset, always_contains: bool):
+        self.index = index
+        self.subfolder = subfolder
+        self.extensions = extensions
+        self.needle_ids = needle_ids
+        self.always_contains = always_contains
+
+class CompiledRules:
+    """
+    Rules compiled for fast matching.
+
+    Extensions that start with '.' are indexed by suffix, and each suffix
+    entry already contains the rules without extensions in their configured
+    position, so a filename only walks the rules that can apply to it and
+    stops at the first match. Rules with unusual extensions that don't start
+    with '.' are checked with endswith as before. All filename_contains
+    strings are matched together by one SubstringMatcher.
+    """
+
+    def __init__(self, rules: list):
+        self.rules: list = []
+        self._by_suffix: Dict[str, list] = {}
+        self._no_extensions: list = []
+        self._unindexed: list = []
+        needles: Dict[str, int] = {}
+
+        if not isinstance(rules, list):
+            logging.error(f"Invalid rules configuration (expected a list): {rules}")
+            rules = []
+
+        for index, rule in enumerate(rules):
+            try:
+                compiled = self._compile_rule(index, rule, needles)
+            except Exception as e:
+                logging.error(f"Error processing rule {rule}: {e}")
+                continue
+            self.rules.append(compiled)
+            if not compiled.extensions:
+                self._no_extensions.append(compiled)
+            elif all(ext.startswith('.') for ext in compiled.extensions):
+                for ext in set(compiled.extensions):
+                    self._by_suffix.setdefault(ext, []).append(compiled)
+            else:
+                self._unindexed.append(compiled)
+
+        # Rules without extensions apply to every suffix; merge them in order once
+        for ext, indexed in self._by_suffix.items():
+            self._by_suffix[ext] = sorted(indexed + self._no_extensions, key=lambda rule: rule.index)
+
+        self._matcher = SubstringMatcher(list(needles)) if needles else None
+
+    @staticmethod
+    def _compile_rule(index: int, rule: Dict[str, Any], needles: Dict[str, int]) -> CompiledRule:
+        extensions = rule.get('extensions', [])
+        extensions = tuple(ext.lower() for ext in extensions) if extensions else ()
+
+        filename_contains = rule.get('filename_contains', [])
+        needle_ids = set()
+        always_contains = False
+        if filename_contains:
+            if not isinstance(filename_contains, list):
+                filename_contains = [filename_contains]
+            for needle in filename_contains:
+                needle = needle.lower()
+                if not needle:
+                    always_contains = True  # '' is contained in every filename
+                    continue
+                needle_ids.add(needles.setdefault(needle, len(needles)))
+            if not needle_ids and not always_contains:
+                raise ValueError("filename_contains has no usable entries")
+
+        return CompiledRule(index, rule.get('subfolder'), extensions,
+                            frozenset(needle_ids), always_contains)
+
+    def candidates(self, filename_lower: str):
+        """
+        Return the rules whose extension check passes, in configured order.
+        A rule may be repeated when several suffixes match; that is harmless.
+        """
+        groups = []
+        by_suffix = self._by_suffix
+        dot = filename_lower.find('.')
+        while dot != -1:
+            matched = by_suffix.get(filename_lower[dot:])
+            if matched:
+                groups.append(matched)
+            dot = filename_lower.find('.', dot + 1)
+        if not groups:
+            groups.append(self._no_extensions)
+        if self._unindexed:
+            groups.append([rule for rule in self._unindexed if filename_lower.endswith(rule.extensions)])
+        if len(groups) == 1:
+            return groups[0]
+        return heapq.merge(*groups, key=lambda rule: rule.index)
+
+    def match(self, filename: str, default_subfolder: str) -> str:
+        """
+        Return the subfolder of the first matching rule, or default_subfolder
+        if no rule matches (or the matching rule has no subfolder).
+        """
+        filename_lower = filename.lower()
+        found = None
+        for rule in self.candidates(filename_lower):
+            if rule.needle_ids and not rule.always_contains:
+                if found is None:
+                    found = self._matcher.find_all(filename_lower)
+                if rule.needle_ids.isdisjoint(found):
                     continue  # Filename doesn't contain required string, check next rule
-            # If both checks pass or are not specified, return the subfolder
-            return rule.get('subfolder', DEFAULT_SUBFOLDER)
-        except Exception as e:
-            logging.error(f"Error processing rule {rule}: {e}")
-    # If no rules match, return the default subfolder
-    return DEFAULT_SUBFOLDER
+            return default_subfolder if rule.subfolder is None else rule.subfolder
+        return default_subfolder
+
+# ----------------------------- File Index ---------------------------------
+
+class FileIndex:
+    """
+    Persistent SQLite index of the files organized under downloads_dir.
+
+    monitor_downloads records every file it moves (relative path, mtime, size),
+    so cleanup becomes a range query on the mtime index instead of a walk over
+    the whole tree. A budgeted reconcile scan (reconcile_step) picks up files
+    that arrived some other way and forgets files deleted behind our back.
+    Paths are stored relative to downloads_dir with '/' separators. The
+    content hash of a file, if known, is kept until its size or mtime changes
+    (see find_by_hash).
+    """
+    UPSERT = ("INSERT INTO files (path, top, mtime, size, seen, hash) VALUES (?, ?, ?, ?, ?, ?) "
+              "ON CONFLICT (path) DO UPDATE SET top = excluded.top, mtime = excluded.mtime, "
+              "size = excluded.size, seen = excluded.seen, "
+              "hash = CASE WHEN excluded.hash IS NOT NULL THEN excluded.hash "
+              "WHEN files.mtime = excluded.mtime AND files.size = excluded.size THEN files.hash END")
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                top TEXT NOT NULL,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                seen INTEGER NOT NULL DEFAULT 0,
+                hash TEXT
+            ) WITHOUT ROWID""")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(files)")}
+        if 'hash' not in columns:
+            self._conn.execute("ALTER TABLE files ADD COLUMN hash TEXT")  # Index created before dedup
+        self._conn.execute("CREATE INDEX IF NOT EXISTS files_mtime ON files (mtime, path)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS files_hash ON files (hash) WHERE hash IS NOT NULL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS files_size ON files (size)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'reconcile_pass'").fetchone()
+        self._pass = int(row[0]) if row else 0
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'reconcile_completed'").fetchone()
+        self.reconciled = bool(row)  # A reconcile pass has completed, so the index covers files from before it
+        self._scan_stack: list = []  # [(directory, open scandir iterator)] of the running reconcile pass
+
+    def close(self):
+        with self._lock:
+            for _, iterator in self._scan_stack:
+                iterator.close()
+            self._scan_stack = []
+            self._conn.close()
+
+    @staticmethod
+    def relative_path(root: Path, path: Path) -> str:
+        return path.relative_to(root).as_posix()
+
+    def record(self, rel_path: str, mtime: float, size: int, content_hash: Optional[str] = None):
+        """
+        Add or update one file.
+        """
+        top = rel_path.split('/', 1)[0]
+        with self._lock:
+            self._conn.execute(self.UPSERT, (rel_path, top, mtime, size, self._pass, content_hash))
+
+    def find_by_hash(self, content_hash: Optional[str], size: int, top: Optional[str] = None, limit: int = 8) -> list:
+        """
+        Return up to `limit` (rel_path, mtime) of indexed files with this content
+        hash (None: not hashed yet) and size, optionally only under one
+        top-level (company) folder.
+        """
+        query = "SELECT path, mtime FROM files WHERE hash IS ? AND size = ?"
+        params: tuple = (content_hash, size)
+        if top is not None:
+            query += " AND top = ?"
+            params += (top,)
+        with self._lock:
+            return self._conn.execute(query + " LIMIT ?", params + (limit,)).fetchall()
+
+    def remove(self, rel_paths: list):
+        if not rel_paths:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("DELETE FROM files WHERE path = ?", ((p,) for p in rel_paths))
+            self._conn.execute("COMMIT")
+
+    def older_than(self, cutoff: float, excluded_tops: tuple, batch_size: int = 1000):
+        """
+        Yield (rel_path, mtime, size) for files with mtime < cutoff, oldest first,
+        skipping files under the excluded top-level folders.
+        """
+        placeholders = ','.join('?' * len(excluded_tops)) or "''"
+        query = (f"SELECT path, mtime, size FROM files "
+                 f"WHERE mtime < ? AND (mtime, path) > (?, ?) AND top NOT IN ({placeholders}) "
+                 f"ORDER BY mtime, path LIMIT ?")
+        last = (float('-inf'), '')
+        while True:
+            with self._lock:
+                rows = self._conn.execute(query, (cutoff, *last, *excluded_tops, batch_size)).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last = (rows[-1][1], rows[-1][0])
+
+    def reconcile_step(self, root: Path, budget: int, excluded_tops: tuple) -> bool:
+        """
+        Examine up to `budget` directory entries under root with os.scandir,
+        resuming where the previous step stopped. Files found are (re)indexed;
+        when a full pass completes, rows for files that no longer exist are
+        dropped. Returns True if this step completed a pass.
+        """
+        with self._lock:
+            if not self._scan_stack:
+                self._pass += 1
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('reconcile_pass', ?)",
+                                   (str(self._pass),))
+                self._scan_stack.append((root, os.scandir(root)))
+            current_pass = self._pass
+
+        examined = 0
+        found = []
+        root_prefix = len(os.path.join(root, ''))
+        while self._scan_stack and examined < budget:
+            directory, iterator = self._scan_stack[-1]
+            entry = next(iterator, None)
+            if entry is None:
+                iterator.close()
+                self._scan_stack.pop()
+                continue
+            examined += 1
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if directory == root and (entry.name in excluded_tops or entry.name.startswith('.')):
+                        continue
+                    self._scan_stack.append((Path(entry.path), os.scandir(entry.path)))
+                elif entry.is_file(follow_symlinks=False) and directory != root:
+                    st = entry.stat(follow_symlinks=False)
+                    rel_path = entry.path[root_prefix:].replace(os.sep, '/')
+                    found.append((rel_path, rel_path.split('/', 1)[0], st.st_mtime, st.st_size, current_pass, None))
+            except OSError as e:
+                logging.debug(f"Reconcile skipped {entry.path}: {e}")
+
+        with self._lock:
+            if found:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(self.UPSERT, found)
+                self._conn.execute("COMMIT")
+            if self._scan_stack:
+                return False
+            removed = self._conn.execute("DELETE FROM files WHERE seen < ?", (current_pass,)).rowcount
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('reconcile_completed', ?)",
+                               (str(current_pass),))
+            self.reconciled = True
+        logging.info(f"File index reconcile pass {current_pass} completed; dropped {removed} stale entries.")
+        return True
+
+def excluded_cleanup_folders(cfg: 'ConfigSnapshot') -> tuple:
+    """
+    Top-level folders that cleanup never touches.
+    """
+    return (cfg.no_case_folder, cfg.default_subfolder)
+
+def reconcile_file_index():
+    """
+    Keep the file indexes in sync with the disk in small, budgeted steps:
+    reconcile_budget entries every reconcile_step_interval seconds, and a new
+    full pass every reconcile_interval. Profiles take turns, one step each;
+    a profile that completed its pass waits for the next reconcile_interval.
+    Idle while cleanup is disabled for every profile.
+    """
+    next_pass: Dict[str, float] = {}  # Profile id -> monotonic time its next pass may start
+    while True:
+        cfg = settings
+        enabled = [profile for profile in get_profiles() if profile.settings.cleanup_enabled]
+        if not enabled:
+            wait_for_config_change(cfg)
+            continue
+        now = time.monotonic()
+        for profile in enabled:
+            if next_pass.get(profile.id, 0) > now:
+                continue
+            profile_cfg = profile.settings
+            try:
+                completed = profile.file_index().reconcile_step(profile_cfg.downloads_dir, profile_cfg.reconcile_budget,
+                                                                excluded_cleanup_folders(profile_cfg))
+            except Exception as e:
+                logging.error(f"Error reconciling file index of profile {profile.id}: {e}")
+                completed = False
+            if completed:
+                interval = parse_time_threshold(profile_cfg.reconcile_interval)
+                pause = interval.total_seconds() if interval else profile_cfg.reconcile_step_interval
+                next_pass[profile.id] = time.monotonic() + pause
+        pause = cfg.reconcile_step_interval
+        if all(next_pass.get(profile.id, 0) > time.monotonic() for profile in enabled):
+            pause = max(pause, min(next_pass[profile.id] for profile in enabled) - time.monotonic())
+        wait_for_config_change(cfg, pause)
+
+# ----------------------------- Job Journal --------------------------------
+
+class JournalEntry(NamedTuple):
+    """
+    An in-flight download as recorded in the job journal.
+    """
+    name: str
+    inode: int
+    started_at: float
+    company_name: Optional[str]
+    case_number: Optional[str]
+
+def escape_journal_field(value: Optional[str]) -> str:
+    if not value:
+        return ''
+    if '\\' not in value and value.isprintable():
+        return value
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+def unescape_journal_field(value: str) -> Optional[str]:
+    if not value:
+        return None
+    if '\\' not in value:
+        return value
+    return re.sub(r'\\(.)', lambda m: {'t': '\t', 'n': '\n', 'r': '\r'}.get(m.group(1), m.group(1)), value)
+
+class JobJournal:
+    """
+    Append-only journal of in-flight downloads, so a restart resumes moves to
+    the right case folders instead of sending everything to no_case_folder.
+
+    One line per state transition, tab-separated, keyed by a job id:
+        D <id> <inode> <started_at> <company> <case> <name>   detected (provisional case)
+        A <id> <company> <case>                               assigned at stability
+        X <id>                                                moved, vanished or given up
+        N <id>                                                next job id, written by compaction
+    Replay folds the lines into the set of unfinished jobs, parsing only the
+    jobs that survive. Whenever the file holds more than
+    max(COMPACT_MIN_RECORDS, 4 x live jobs) lines it is rewritten with just
+    the unfinished jobs (compaction). Lines are flushed as
+    they are written, and fsynced with fsync_policy 'always'. A line torn by
+    a crash is dropped by compacting on open, and malformed lines are skipped.
+    """
+    COMPACT_MIN_RECORDS = 1024
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._live: Dict[str, tuple] = {}  # name -> (job id, JournalEntry, escaped D-line payload)
+        self._next_id = 1
+        self._records = 0
+        self._torn = False  # The file did not end with a newline
+        self._file = None
+        # Unfinished jobs with a case, from the previous run, waiting to be resumed
+        self.resumable: Dict[str, JournalEntry] = {}
+        started = time.perf_counter()
+        entries = self._replay()
+        with self._lock:
+            for job_id, entry, payload in entries:
+                if entry.company_name and entry.case_number:
+                    self.resumable[entry.name] = entry
+                    self._live[entry.name] = (job_id, entry, payload)
+            # Compacting also drops a torn last line, so new lines are not appended to it
+            if self._records > max(self.COMPACT_MIN_RECORDS, 4 * len(self._live)) or not entries or self._torn:
+                self._compact()
+            else:
+                self._file = open(self.path, 'a', encoding='utf-8', newline='')
+        if entries:
+            logging.info(f"Job journal replayed in {(time.perf_counter() - started) * 1000:.1f} ms: "
+                         f"{len(self.resumable)} interrupted downloads to resume.")
+
+    def _replay(self) -> list:
+        try:
+            with open(self.path, 'rb') as journal:
+                text = journal.read().decode('utf-8', errors='replace')
+        except FileNotFoundError:
+            return []
+        live: Dict[str, str] = {}  # job id -> D-line payload
+        assigned: Dict[str, str] = {}  # job id -> latest A-line payload
+        pop = live.pop
+        lines = text.split('\n')
+        self._torn = lines.pop() != ''  # Empty after the last newline, or a torn final line
+        next_id = last_id = 0
+        for line in lines:
+            op = line[:1]
+            try:
+                if op == 'X':
+                    pop(line[2:], None)
+                elif op == 'D':
+                    _, job_id, rest = line.split('\t', 2)
+                    last_id = max(last_id, int(job_id))
+                    live[job_id] = rest
+                elif op == 'A':
+                    _, job_id, rest = line.split('\t', 2)
+                    assigned[job_id] = rest
+                elif op == 'N':
+                    next_id = int(line[2:])
+            except ValueError:
+                continue  # Malformed line
+        # Ids grow from the N header written by the last compaction
+        self._next_id = max(next_id, last_id + 1, 1)
+        self._records = len(lines)
+        entries = []
+        for job_id, detected in live.items():
+            try:
+                inode, started_at, company, case, name = detected.split('\t', 4)
+                assignment = assigned.get(job_id)
+                if assignment is not None:
+                    company, case = assignment.split('\t')
+                    detected = f"{inode}\t{started_at}\t{assignment}\t{name}"
+                entry = JournalEntry(unescape_journal_field(name), int(inode), float(started_at),
+                                     unescape_journal_field(company), unescape_journal_field(case))
+            except ValueError:
+                continue  # Malformed line
+            entries.append((int(job_id), entry, detected))
+        return entries
+
+    def _take_id(self) -> int:
+        job_id = self._next_id
+        self._next_id += 1
+        return job_id
+
+    @staticmethod
+    def _payload(entry: JournalEntry) -> str:
+        return (f"{entry.inode}\t{entry.started_at:.3f}\t{escape_journal_field(entry.company_name)}\t"
+                f"{escape_journal_field(entry.case_number)}\t{escape_journal_field(entry.name)}")
+
+    def _compact(self):
+        temp = f"{self.path}.tmp"
+        with open(temp, 'w', encoding='utf-8', newline='') as journal:
+            journal.write(f"N\t{self._next_id}\n")
+            journal.writelines(f"D\t{job_id}\t{payload}\n" for job_id, _, payload in self._live.values())
+            journal.flush()
+            os.fsync(journal.fileno())
+        if self._file is not None:
+            self._file.close()
+        os.replace(temp, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8', newline='')
+        self._records = len(self._live) + 1
+
+    def _append(self, line: str):
+        self._file.write(line)
+        self._file.flush()
+        if settings is not None and settings.fsync_policy == 'always':
+            os.fsync(self._file.fileno())
+        self._records += 1
+        if self._records >= max(self.COMPACT_MIN_RECORDS, 4 * len(self._live)):
+            self._compact()
+
+    def detected(self, name: str, inode: int, started_at: float, assignment: tuple):
+        """
+        Record a new download and the case it is provisionally attributed to.
+        """
+        entry = JournalEntry(name, inode, started_at, *assignment)
+        payload = self._payload(entry)
+        with self._lock:
+            job_id = self._take_id()
+            self._live[name] = (job_id, entry, payload)
+            self._append(f"D\t{job_id}\t{payload}\n")
+
+    def assigned(self, name: str, assignment: tuple):
+        """
+        Record the final case of a download, if it differs from the provisional one.
+        """
+        with self._lock:
+            job = self._live.get(name)
+            if job is None:
+                return
+            job_id, entry, _ = job
+            if (entry.company_name, entry.case_number) == tuple(assignment):
+                return
+            entry = entry._replace(company_name=assignment[0], case_number=assignment[1])
+            self._live[name] = (job_id, entry, self._payload(entry))
+            self._append(f"A\t{job_id}\t{escape_journal_field(assignment[0])}\t"
+                         f"{escape_journal_field(assignment[1])}\n")
+
+    def done(self, name: str):
+        """
+        Record that a download was moved, vanished or was given up on.
+        """
+        with self._lock:
+            self.resumable.pop(name, None)
+            job = self._live.pop(name, None)
+            if job is not None:
+                self._append(f"X\t{job[0]}\n")
+
+    def claim(self, name: str, inode: int) -> bool:
+        """
+        True if `name` is the same file as an interrupted job that will be
+        resumed. A different file under the same name ends the old job.
+        """
+        entry = self.resumable.get(name)
+        if entry is None:
+            return False
+        if entry.inode != inode:
+            self.done(name)
+            return False
+        return True
+
+    def resume(self, name: str, inode: int) -> Optional[JournalEntry]:
+        """
+        Hand over a claimed interrupted job. Returns None if there is none for this file.
+        """
+        if not self.claim(name, inode):
+            return None
+        with self._lock:
+            return self.resumable.pop(name, None)
+
+    def drop_unclaimed(self, present: set):
+        """
+        End the interrupted jobs whose file is no longer in the Downloads directory.
+        """
+        for name in [name for name in self.resumable if name not in present]:
+            self.done(name)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
 
 # ----------------------------- Cleanup Functions -------------------------
 
@@ -249,244 +1574,3211 @@ def parse_time_threshold(threshold_str: str) -> Optional[datetime.timedelta]:
         logging.error(f"Unsupported time unit in cleanup_age_threshold: '{unit}'.")
         return None
 
-def cleanup_old_files():
+CLEANUP_BATCH_SIZE = 64
+CLEANUP_MAX_LOGGED_ERRORS = 5
+
+class RateLimiter:
     """
-    Removes files in the downloads directory older than the configured threshold.
+    Paces callers of acquire() to at most `rate` operations per second across
+    all threads. A rate of 0 or less disables the limit.
     """
-    if not CLEANUP_ENABLED:
-        logging.info("File cleanup is disabled. Skipping cleanup process.")
-        return
-
-    threshold = parse_time_threshold(CLEANUP_AGE_THRESHOLD)
-    if not threshold:
-        logging.error("Failed to parse cleanup_age_threshold. Skipping cleanup process.")
-        return
 
-    cutoff_time = datetime.datetime.now() - threshold
-    logging.info(f"Starting cleanup: Removing files older than {CLEANUP_AGE_THRESHOLD} (before {cutoff_time})")
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
 
-    try:
-        removed_files = 0
-        for root, dirs, files in os.walk(DOWNLOADS_DIR):
-            for file in files:
-                file_path = Path(root) / file
-                try:
-                    # Skip system folders like no_case_folder and default_subfolder
-                    relative_path = file_path.relative_to(DOWNLOADS_DIR)
-                    if relative_path.parts[0] in [NO_CASE_FOLDER, DEFAULT_SUBFOLDER]:
-                        continue  # Skip system folders
-
-                    # Get file's last modification time
-                    file_mtime = datetime.datetime.fromtimestamp(file_path.stat().st_mtime)
-                    if file_mtime < cutoff_time:
-                        # Attempt to remove the file
-                        file_path.unlink()
-                        logging.info(f"Removed old file: {file_path}")
-                        removed_files += 1
-                except Exception as e:
-                    logging.error(f"Error removing file {file_path}: {e}")
-
-        logging.info(f"Cleanup completed. Total files removed: {removed_files}")
-    except Exception as e:
-        logging.error(f"Error during cleanup process: {e}")
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._next = max(self._next, now)
+            wait = self._next - now
+            self._next += 1 / self.rate
+        if wait > 0:
+            time.sleep(wait)
 
-def cleanup_scheduler():
+class CleanupCandidate(NamedTuple):
     """
-    Schedules periodic cleanup based on the configured interval.
+    A file selected for deletion, as seen when the cleanup was planned.
     """
-    if not CLEANUP_ENABLED:
-        logging.info("File cleanup is disabled. Cleanup scheduler not started.")
-        return
-
-    interval = parse_time_threshold(CLEANUP_INTERVAL)
-    if not interval:
-        logging.error("Failed to parse cleanup_interval. Cleanup scheduler not started.")
-        return
-
-    logging.info(f"Cleanup scheduler started. Next cleanup in {CLEANUP_INTERVAL}.")
-    while True:
-        time.sleep(interval.total_seconds())
-        cleanup_old_files()
-        logging.info(f"Next cleanup scheduled in {CLEANUP_INTERVAL}.")
+    rel_path: str
+    company: str
+    size: int
+    mtime: float
 
-# ----------------------------- Server Handler -----------------------------
+def scan_older_than(root: Path, cutoff: float, excluded_tops: tuple):
+    """
+    Yield (rel_path, mtime, size) for files under the case folders of root with
+    mtime < cutoff, walking the tree like a reconcile pass does.
+    """
+    root_prefix = len(os.path.join(root, ''))
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if directory != root or not (entry.name in excluded_tops or entry.name.startswith('.')):
+                                stack.append(Path(entry.path))
+                        elif entry.is_file(follow_symlinks=False) and directory != root:
+                            st = entry.stat(follow_symlinks=False)
+                            if st.st_mtime < cutoff:
+                                yield entry.path[root_prefix:].replace(os.sep, '/'), st.st_mtime, st.st_size
+                    except OSError as e:
+                        logging.debug(f"Cleanup skipped {entry.path}: {e}")
+        except OSError as e:
+            logging.debug(f"Cleanup skipped {directory}: {e}")
 
-class Handler(http.server.SimpleHTTPRequestHandler):
-    def do_POST(self):
-        global current_case_number, current_company_name
-        try:
-            content_length = int(self.headers.get('Content-Length', 0))
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data)
-            
-            received_case_number = data.get('case_number')
-            received_company_name = data.get('company_name')
-
-            if received_case_number is None or received_company_name is None:
-                logging.error('Both "case_number" and "company_name" must be provided in POST data.')
-                self.send_response(400)
-                self.end_headers()
-                self.wfile.write(b'Both "case_number" and "company_name" must be provided.')
-                return
+def plan_cleanup(profile: 'Profile', cfg: 'ConfigSnapshot', cutoff: float) -> tuple:
+    """
+    Select the files to delete: index rows older than cutoff that are still
+    old on disk. Until a reconcile pass has completed, the index may not know
+    the files that were already there, so the tree is walked instead.
+    Returns (candidates, forgotten) where forgotten lists index rows whose
+    file no longer exists.
+    """
+    index = profile.file_index()
+    candidates = []
+    forgotten = []
+    # System folders like no_case_folder and default_subfolder are excluded by the query
+    if index.reconciled:
+        rows = index.older_than(cutoff, excluded_cleanup_folders(cfg))
+    else:
+        rows = scan_older_than(cfg.downloads_dir, cutoff, excluded_cleanup_folders(cfg))
+    for rel_path, _, _ in rows:
+        try:
+            st = (cfg.downloads_dir / rel_path).stat()
+        except FileNotFoundError:
+            forgotten.append(rel_path)
+            continue
+        except OSError as e:
+            logging.debug(f"Cleanup skipped {rel_path}: {e}")
+            continue
+        if st.st_mtime >= cutoff:
+            # Touched since it was indexed
+            index.record(rel_path, st.st_mtime, st.st_size)
+            continue
+        candidates.append(CleanupCandidate(rel_path, rel_path.split('/', 1)[0], st.st_size, st.st_mtime))
+    return candidates, forgotten
 
-            logging.info(f"Received Case Number: {received_case_number}, Company Name: {received_company_name}")
+def prunable_directories(root: Path, rel_paths: list, removed: Optional[set] = None) -> list:
+    """
+    Return the directories (relative, deepest first) under root that are left
+    empty once rel_paths are deleted, up to and including the company folder.
+    If `removed` is None the deletion has not happened yet and the directory
+    contents are predicted from rel_paths.
+    """
+    parents = set()
+    for rel_path in rel_paths:
+        parent = posixpath.dirname(rel_path)
+        while parent:
+            parents.add(parent)
+            parent = posixpath.dirname(parent)
 
-            with assignments_lock:
-                if received_case_number == 'NO_CASE' and received_company_name == 'NO_COMPANY':
-                    current_case_number = None
-                    current_company_name = None
-                    logging.info("Set current_case_number and current_company_name to None (NO_CASE and NO_COMPANY).")
-                else:
-                    current_case_number = received_case_number
-                    current_company_name = received_company_name
-                    logging.info(f"Updated current_case_number to {current_case_number} and current_company_name to {current_company_name}.")
+    gone = set(rel_paths) if removed is None else removed
+    empty = set()
+    for directory in sorted(parents, key=lambda d: d.count('/'), reverse=True):
+        try:
+            with os.scandir(root / directory) as entries:
+                if all(f"{directory}/{entry.name}" in gone or f"{directory}/{entry.name}" in empty
+                       for entry in entries):
+                    empty.add(directory)
+        except OSError:
+            continue
+    return sorted(empty, key=lambda d: d.count('/'), reverse=True)
 
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(b'Case information received successfully.')
-            return
-        except json.JSONDecodeError:
-            logging.error('Invalid JSON in POST data.')
-            self.send_response(400)
-            self.end_headers()
-            self.wfile.write(b'Invalid JSON.')
-        except Exception as e:
-            logging.error(f"Error processing request: {e}")
-            self.send_response(500)
-            self.end_headers()
-            self.wfile.write(b'Internal server error.')
+def delete_cleanup_batch(root: Path, batch: list, limiter: RateLimiter) -> tuple:
+    """
+    Unlink one batch of candidates. Runs on the cleanup worker pool.
+    Returns (removed candidates, vanished paths, [(path, error)]).
+    """
+    removed, vanished, errors = [], [], []
+    for candidate in batch:
+        limiter.acquire()
+        file_path = root / candidate.rel_path
+        try:
+            file_path.unlink()
+            logging.debug(f"Removed old file: {file_path}")
+            removed.append(candidate)
+        except FileNotFoundError:
+            vanished.append(candidate.rel_path)
+        except OSError as e:
+            errors.append((candidate.rel_path, e))
+    return removed, vanished, errors
 
-    def log_message(self, format, *args):
-        # Override to prevent logging every GET request to stdout
-        return
+def cleanup_summary(candidates: list) -> dict:
+    """
+    Aggregate candidates into totals and per-company totals.
+    """
+    per_company: Dict[str, Dict[str, int]] = {}
+    for candidate in candidates:
+        totals = per_company.setdefault(candidate.company, {"files": 0, "bytes": 0})
+        totals["files"] += 1
+        totals["bytes"] += candidate.size
+    return {
+        "files": len(candidates),
+        "bytes": sum(totals["bytes"] for totals in per_company.values()),
+        "per_company": per_company,
+    }
 
-# ----------------------------- File Monitoring ----------------------------
+def format_bytes(size: int) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{size} B"
+        size /= 1024
 
-def is_file_fully_downloaded(filepath: Path) -> bool:
+def cleanup_old_files(dry_run: Optional[bool] = None, profile: Optional['Profile'] = None) -> Optional[dict]:
     """
-    Check if a file is fully downloaded by monitoring its size over time.
+    Removes files in the downloads directory of a profile (default: the
+    first one) older than the configured threshold.
+
+    Runs as a pipeline: candidates are planned from the file index (and
+    re-checked on disk), unlinked in batches on cleanup_workers threads at no
+    more than cleanup_max_ops_per_sec, and the case folders left empty are
+    pruned. A single summary line is logged instead of one line per file.
+    With dry_run (default: cleanup_dry_run), nothing is deleted and the plan
+    is returned. Returns the report, or None if cleanup did not run.
     """
-    try:
-        previous_size = -1
-        stable_count = 0
-        while stable_count < 3:
-            if not filepath.exists():
-                return False
-            current_size = filepath.stat().st_size
-            if current_size == previous_size:
-                stable_count += 1
+    profile = profile or get_profile()
+    cfg = profile.settings
+    if dry_run is None:
+        dry_run = cfg.cleanup_dry_run
+    if not cfg.cleanup_enabled and not dry_run:
+        logging.info("File cleanup is disabled. Skipping cleanup process.")
+        return None
+
+    threshold = parse_time_threshold(cfg.cleanup_age_threshold)
+    if not threshold:
+        logging.error("Failed to parse cleanup_age_threshold. Skipping cleanup process.")
+        return None
+
+    if not cleanup_lock.acquire(blocking=False):
+        logging.info("A cleanup is already running. Skipping cleanup process.")
+        return None
+    try:
+        return _run_cleanup(profile, cfg, datetime.datetime.now() - threshold, dry_run)
+    except Exception as e:
+        logging.error(f"Error during cleanup process: {e}")
+        return None
+    finally:
+        cleanup_lock.release()
+
+def _run_cleanup(profile: 'Profile', cfg: 'ConfigSnapshot', cutoff_time: datetime.datetime, dry_run: bool) -> dict:
+    started = time.monotonic()
+    mode = "Planning cleanup" if dry_run else "Starting cleanup"
+    logging.info(f"{mode}{profile.log_suffix}: Removing files older than {cfg.cleanup_age_threshold} (before {cutoff_time})")
+
+    root = cfg.downloads_dir
+    index = profile.file_index()
+    catalog = profile.catalog()
+    candidates, forgotten = plan_cleanup(profile, cfg, cutoff_time.timestamp())
+    index.remove(forgotten)
+    catalog.remove(forgotten)
+
+    if dry_run:
+        report = {
+            "dry_run": True,
+            "cutoff": cutoff_time.isoformat(timespec='seconds'),
+            **cleanup_summary(candidates),
+            "paths": [candidate.rel_path for candidate in candidates],
+            "directories": prunable_directories(root, [candidate.rel_path for candidate in candidates]),
+        }
+        logging.info(f"Cleanup plan: {report['files']} files ({format_bytes(report['bytes'])}) "
+                     f"and {len(report['directories'])} directories would be removed.")
+        return report
+
+    limiter = RateLimiter(cfg.cleanup_max_ops_per_sec)
+    batches = [candidates[i:i + CLEANUP_BATCH_SIZE] for i in range(0, len(candidates), CLEANUP_BATCH_SIZE)]
+    removed, errors = [], []
+    with ThreadPoolExecutor(max_workers=cfg.cleanup_workers, thread_name_prefix="cleanup") as pool:
+        for batch_removed, vanished, batch_errors in pool.map(
+                functools.partial(delete_cleanup_batch, root, limiter=limiter), batches):
+            gone = [candidate.rel_path for candidate in batch_removed] + vanished
+            index.remove(gone)
+            catalog.remove(gone)
+            removed.extend(batch_removed)
+            errors.extend(batch_errors)
+
+    pruned = 0
+    removed_paths = {candidate.rel_path for candidate in removed}
+    for directory in prunable_directories(root, list(removed_paths), removed_paths):
+        limiter.acquire()
+        try:
+            os.rmdir(root / directory)
+            pruned += 1
+        except OSError:
+            pass  # Something new arrived, or the folder is in use
+
+    report = {
+        "dry_run": False,
+        "cutoff": cutoff_time.isoformat(timespec='seconds'),
+        **cleanup_summary(removed),
+        "directories_pruned": pruned,
+        "errors": len(errors),
+        "duration": round(time.monotonic() - started, 3),
+    }
+    profile.last_cleanup_report = {key: value for key, value in report.items() if key != "per_company"}
+    CLEANUP_DURATION.observe(report["duration"])
+    CLEANUP_FILES_REMOVED.inc(report["files"])
+    CLEANUP_BYTES_FREED.inc(report["bytes"])
+
+    per_company = ", ".join(f"{company}: {totals['files']} files ({format_bytes(totals['bytes'])})"
+                            for company, totals in sorted(report["per_company"].items()))
+    logging.info(f"Cleanup completed{profile.log_suffix}. Total files removed: {report['files']} "
+                 f"({format_bytes(report['bytes'])} freed, {pruned} empty directories pruned, "
+                 f"{len(errors)} errors) in {report['duration']:.1f}s"
+                 + (f". Per company: {per_company}" if per_company else ""))
+    if errors:
+        sample = "; ".join(f"{path}: {error}" for path, error in errors[:CLEANUP_MAX_LOGGED_ERRORS])
+        logging.error(f"Failed to remove {len(errors)} files during cleanup, e.g. {sample}")
+    return report
+
+def cleanup_all_profiles():
+    """
+    Run a cleanup for every profile that has cleanup enabled, one after another.
+    """
+    for profile in get_profiles():
+        if profile.settings.cleanup_enabled:
+            cleanup_old_files(profile=profile)
+
+def cleanup_scheduler():
+    """
+    Runs the startup cleanup, then schedules periodic cleanup based on the configured
+    interval. Cleanup settings are re-read whenever the configuration is reloaded.
+    One scheduler serves every profile.
+    """
+    # Perform cleanup if enabled
+    if not any(profile.cleanup_enabled for profile in settings.profiles):
+        logging.info("File cleanup is disabled. Skipping cleanup process.")
+    cleanup_all_profiles()
+
+    next_run: Optional[float] = None
+    scheduled_interval = None
+    while True:
+        cfg = settings
+        interval = None
+        if any(profile.cleanup_enabled for profile in cfg.profiles) and cfg.cleanup_interval:
+            interval = parse_time_threshold(cfg.cleanup_interval)
+            if not interval:
+                logging.error("Failed to parse cleanup_interval. Periodic cleanup paused until the configuration changes.")
+
+        if interval is None:
+            next_run = scheduled_interval = None
+            wait_for_config_change(cfg)
+            continue
+
+        if next_run is None or interval != scheduled_interval:
+            next_run = time.monotonic() + interval.total_seconds()
+            scheduled_interval = interval
+            logging.info(f"Next cleanup scheduled in {cfg.cleanup_interval}.")
+
+        remaining = next_run - time.monotonic()
+        if remaining > 0 and wait_for_config_change(cfg, remaining):
+            continue  # Re-evaluate the schedule with the new settings
+
+        cleanup_all_profiles()
+        next_run = None
+
+# ----------------------------- Case State ---------------------------------
+
+class CaseHistory:
+    """
+    Bounded ring buffer of (timestamp, company_name, case_number) transitions.
+    Timestamps live in a compact array and are searched with a binary search,
+    so a file can be attributed to the case that was active at any recent
+    moment, however late it is processed. Not thread-safe on its own;
+    CaseState guards it with its lock.
+    """
+
+    def __init__(self, capacity: int = CASE_HISTORY_SIZE):
+        self.capacity = capacity
+        self._times = array('d', bytes(8 * capacity))
+        self._states: list = [None] * capacity
+        self._start = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def record(self, timestamp: float, state: tuple):
+        """
+        Append a transition; the oldest one is dropped once the buffer is full.
+        """
+        if self._count:
+            # Keep timestamps ordered even if the wall clock stepped backwards
+            timestamp = max(timestamp, self._times[(self._start + self._count - 1) % self.capacity])
+        if self._count < self.capacity:
+            slot = (self._start + self._count) % self.capacity
+            self._count += 1
+        else:
+            slot = self._start
+            self._start = (self._start + 1) % self.capacity
+        self._times[slot] = timestamp
+        self._states[slot] = state
+
+    def state_at(self, timestamp: float) -> Optional[tuple]:
+        """
+        Return the state in effect at `timestamp`, or None if it predates the buffer.
+        """
+        times, start, capacity = self._times, self._start, self.capacity
+        # bisect_right over the logical (oldest-first) order of the ring
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if times[(start + mid) % capacity] <= timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return None
+        return self._states[(start + lo - 1) % capacity]
+
+class CaseState:
+    """
+    The active company/case reported by the Tampermonkey script.
+
+    Notifications are coalesced: a payload identical to the last one received
+    is a lock-free no-op, and a burst of different payloads arriving within
+    case_debounce_ms collapses into a single state transition that is applied
+    (and logged) once the burst has settled. Every applied transition is
+    recorded in a CaseHistory, stamped with the time the settled notification
+    was received, so downloads are attributed by when they started.
+    on_apply(state), if given, is called with every applied transition.
+    """
+
+    def __init__(self, on_apply=None):
+        self._lock = threading.Lock()
+        self._on_apply = on_apply
+        self._last_received: tuple = (None, None)
+        self._applied: tuple = (None, None)
+        self._pending: Optional[tuple] = None
+        self._pending_since = 0.0
+        self._deadline = 0.0
+        self.history = CaseHistory()
+        self.history.record(time.time(), self._applied)
+
+    def update(self, company_name: Optional[str], case_number: Optional[str], debounce: float) -> str:
+        """
+        Record a notification. Returns 'duplicate', 'debounced' or 'applied'.
+        """
+        state = (company_name, case_number)
+        if state == self._last_received:
+            return 'duplicate'
+        now = time.monotonic()
+        received_at = time.time()
+        with self._lock:
+            self._flush_expired(now)
+            self._last_received = state
+            if debounce <= 0:
+                self._pending = None
+                self._apply(state, received_at)
+                return 'applied'
+            self._pending = state
+            self._pending_since = received_at
+            self._deadline = now + debounce
+        return 'debounced'
+
+    def current(self) -> tuple:
+        """
+        Return the (company_name, case_number) currently in effect.
+        """
+        if self._pending is not None and time.monotonic() >= self._deadline:
+            with self._lock:
+                self._flush_expired(time.monotonic())
+        return self._applied
+
+    def state_at(self, timestamp: float) -> tuple:
+        """
+        Return the (company_name, case_number) that was in effect at `timestamp`
+        (wall-clock seconds). Times older than the history map to no case.
+        A download started after a change that is still being debounced
+        belongs to that change.
+        """
+        with self._lock:
+            self._flush_expired(time.monotonic())
+            if self._pending is not None and timestamp >= self._pending_since:
+                return self._pending
+            state = self.history.state_at(timestamp)
+        return state if state is not None else (None, None)
+
+    def _flush_expired(self, now: float):
+        if self._pending is not None and now >= self._deadline:
+            state, self._pending = self._pending, None
+            self._apply(state, self._pending_since)
+
+    def _apply(self, state: tuple, received_at: float):
+        if state == self._applied:
+            return  # The burst ended where it started
+        self._applied = state
+        self.history.record(received_at, state)
+        if self._on_apply is not None:
+            self._on_apply(state)
+        company_name, case_number = state
+        if case_number is None:
+            logging.info("Set current_case_number and current_company_name to None (NO_CASE and NO_COMPANY).")
+        else:
+            logging.info(f"Updated current_case_number to {case_number} and current_company_name to {company_name}.")
+
+# ----------------------------- Case Catalog -------------------------------
+
+CATALOG_PAGE_SIZE = 100
+CATALOG_MAX_PAGE_SIZE = 1000
+CATALOG_ACCESS_RESOLUTION = 60  # Seconds; accesses closer together than this do not reorder the LRU heap
+
+class CatalogCase:
+    """
+    The files of one company/case folder, keyed by their path inside the case folder.
+    """
+    __slots__ = ('company', 'case_number', 'files', 'size', 'listing', 'accessed')
+
+    def __init__(self, company: str, case_number: str):
+        self.company = company
+        self.case_number = case_number
+        self.files: Dict[str, tuple] = {}  # path -> (size, mtime)
+        self.size = 0
+        self.listing: Optional[list] = None  # Sorted file list, built on demand until the next change
+        self.accessed = 0.0  # Last access: newest file, case notification or listing
+
+    def sorted_files(self) -> list:
+        if self.listing is None:
+            self.listing = [{"company": self.company, "path": path, "size": size, "mtime": mtime}
+                            for path, (size, mtime) in sorted(self.files.items())]
+        return self.listing
+
+class CaseCatalog:
+    """
+    In-memory catalog of the files in the company/case folders, so the
+    catalog endpoints answer without touching the disk.
+
+    Moves and cleanup update it as they happen; scan() fills in what was
+    already on disk when the server started. Folders are keyed by their
+    (sanitized) names, paths are relative to downloads_dir with '/'
+    separators, as in the FileIndex. Every change bumps `version`; together
+    with a per-process epoch it forms the ETags of the catalog endpoints.
+
+    The byte counts per case, per company and in total are kept up to date
+    by the same calls, for the storage quota. So is a heap of the cases by
+    last access, which yields the least recently accessed case in O(log n).
+    Entries are not removed from the heap when a case is accessed again or
+    deleted; they are skipped when popped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cases: Dict[tuple, CatalogCase] = {}  # (company, case) -> CatalogCase
+        self._companies: Dict[str, set] = {}  # case -> companies with a folder for it
+        self._case_versions: Dict[str, int] = {}  # case -> version of its last change
+        self._listing: Optional[list] = None
+        self._removed_while_scanning: Optional[set] = None
+        self._company_sizes: Dict[str, int] = {}
+        self._lru: list = []  # Heap of (accessed, company, case)
+        self.total_size = 0
+        self.epoch = format(time.time_ns(), 'x')  # ETags from an earlier run never match
+        self.version = 0
+        self.complete = False
+
+    @staticmethod
+    def _split(rel_path: str) -> Optional[tuple]:
+        parts = rel_path.split('/', 2)
+        return tuple(parts) if len(parts) == 3 else None
+
+    def _changed(self, case_number: str):
+        self.version += 1
+        self._case_versions[case_number] = self.version
+        self._listing = None
+
+    def _add(self, company: str, case_number: str, path: str, size: int, mtime: float):
+        entry = self._cases.get((company, case_number))
+        if entry is None:
+            entry = self._cases[(company, case_number)] = CatalogCase(company, case_number)
+            self._companies.setdefault(case_number, set()).add(company)
+        old = entry.files.get(path)
+        if old == (size, mtime):
+            return
+        entry.files[path] = (size, mtime)
+        delta = size - (old[0] if old else 0)
+        entry.size += delta
+        self._company_sizes[company] = self._company_sizes.get(company, 0) + delta
+        self.total_size += delta
+        self._touch(entry, mtime)
+        entry.listing = None
+        self._changed(case_number)
+
+    def _touch(self, entry: CatalogCase, when: float):
+        if when < entry.accessed + CATALOG_ACCESS_RESOLUTION and entry.accessed:
+            return
+        entry.accessed = when
+        heapq.heappush(self._lru, (when, entry.company, entry.case_number))
+        if len(self._lru) > 2 * len(self._cases) + 1024:
+            # Drop the stale entries
+            self._lru = [(case.accessed, case.company, case.case_number) for case in self._cases.values()]
+            heapq.heapify(self._lru)
+
+    def add(self, rel_path: str, size: int, mtime: float):
+        """
+        Record a file stored in a case folder.
+        """
+        key = self._split(rel_path)
+        if key is not None:
+            with self._lock:
+                self._add(*key, size, mtime)
+
+    def remove(self, rel_paths: list):
+        """
+        Forget deleted files; cases left without files are dropped.
+        """
+        with self._lock:
+            for rel_path in rel_paths:
+                key = self._split(rel_path)
+                if key is None:
+                    continue
+                if self._removed_while_scanning is not None:
+                    self._removed_while_scanning.add(rel_path)
+                company, case_number, path = key
+                entry = self._cases.get((company, case_number))
+                old = entry.files.pop(path, None) if entry is not None else None
+                if old is None:
+                    continue
+                entry.size -= old[0]
+                self.total_size -= old[0]
+                self._company_sizes[company] -= old[0]
+                entry.listing = None
+                if not entry.files:
+                    del self._cases[(company, case_number)]
+                    if not self._company_sizes[company]:
+                        del self._company_sizes[company]
+                    self._companies[case_number].discard(company)
+                    if not self._companies[case_number]:
+                        del self._companies[case_number]
+                self._changed(case_number)
+
+    def scan(self, root: Path, excluded_tops: tuple):
+        """
+        Walk the company/case folders once and add the files found, one case
+        folder at a time. Hidden files and folders (such as archive indexes)
+        are skipped. Files moved or deleted while the scan runs keep the state
+        set by add/remove.
+        """
+        with self._lock:
+            self._removed_while_scanning = set()
+        try:
+            with os.scandir(root) as companies:
+                company_names = [entry.name for entry in companies if entry.is_dir(follow_symlinks=False)
+                                 and not entry.name.startswith('.') and entry.name not in excluded_tops]
+            for company in company_names:
+                try:
+                    with os.scandir(root / company) as cases:
+                        case_names = [entry.name for entry in cases
+                                      if entry.is_dir() and not entry.name.startswith('.')]
+                except OSError as e:
+                    logging.debug(f"Catalog scan skipped {company}: {e}")
+                    continue
+                for case_number in case_names:
+                    found = self._scan_case(root / company / case_number)
+                    with self._lock:
+                        for path, size, mtime in found:
+                            entry = self._cases.get((company, case_number))
+                            if (entry is not None and path in entry.files) or \
+                                    f"{company}/{case_number}/{path}" in self._removed_while_scanning:
+                                continue
+                            self._add(company, case_number, path, size, mtime)
+        finally:
+            with self._lock:
+                self._removed_while_scanning = None
+                self.complete = True
+                self.version += 1
+                self._listing = None
+
+    @staticmethod
+    def _scan_case(case_dir: Path) -> list:
+        found = []
+        prefix = len(os.path.join(case_dir, ''))
+        stack = [case_dir]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.name.startswith('.'):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(Path(entry.path))
+                        elif entry.is_file(follow_symlinks=False):
+                            st = entry.stat(follow_symlinks=False)
+                            found.append((entry.path[prefix:].replace(os.sep, '/'), st.st_size, st.st_mtime))
+            except OSError as e:
+                logging.debug(f"Catalog scan skipped a folder in {case_dir}: {e}")
+        return found
+
+    def cases(self) -> tuple:
+        """
+        Return (ETag, all cases sorted by company and case).
+        """
+        with self._lock:
+            if self._listing is None:
+                self._listing = [{"company": entry.company, "case_number": entry.case_number,
+                                  "files": len(entry.files), "size": entry.size}
+                                 for _, entry in sorted(self._cases.items())]
+            return f'"{self.epoch}-{self.version}"', self._listing
+
+    def case(self, case_number: str, company: Optional[str] = None) -> tuple:
+        """
+        Return (ETag, [CatalogCase]) for a case folder under every company, or only `company`.
+        """
+        with self._lock:
+            companies = sorted(self._companies.get(case_number, ()))
+            if company is not None:
+                companies = [name for name in companies if name == company]
+            etag = f'"{self.epoch}-{self._case_versions.get(case_number, 0)}-{int(self.complete)}"'
+            return etag, [self._cases[(name, case_number)] for name in companies]
+
+    def files(self, entries: list) -> list:
+        """
+        Return the sorted files of the given case folders.
+        """
+        with self._lock:
+            if len(entries) == 1:
+                return entries[0].sorted_files()
+            return [file for entry in entries for file in entry.sorted_files()]
+
+    def inactive_cases(self, cutoff: float) -> list:
+        """
+        Return the case folders last accessed before cutoff, least recently accessed first.
+        """
+        with self._lock:
+            return sorted((entry for entry in self._cases.values() if entry.accessed < cutoff),
+                          key=lambda entry: entry.accessed)
+
+    def touch(self, case_number: str, company: Optional[str] = None, when: Optional[float] = None):
+        """
+        Mark a case folder (under every company, or only `company`) as accessed.
+        """
+        when = when or time.time()
+        with self._lock:
+            for name in self._companies.get(case_number, ()):
+                if company is None or name == company:
+                    self._touch(self._cases[(name, case_number)], when)
+
+    def usage(self, company: Optional[str] = None) -> tuple:
+        """
+        Return (total bytes, bytes of `company`) of the case folders.
+        """
+        return self.total_size, self._company_sizes.get(company, 0) if company is not None else 0
+
+    def company_sizes(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._company_sizes)
+
+    def least_recently_accessed(self, protected, company: Optional[str] = None) -> Optional[CatalogCase]:
+        """
+        Take the least recently accessed case folder (of `company`, if given)
+        for which protected(entry) is false off the heap and return it, or None.
+        It goes back on the heap when it is accessed again.
+        """
+        with self._lock:
+            skipped = []
+            victim = None
+            while self._lru:
+                item = heapq.heappop(self._lru)
+                accessed, company_name, case_number = item
+                entry = self._cases.get((company_name, case_number))
+                if entry is None or entry.accessed != accessed:
+                    continue  # Deleted or accessed again since
+                if (company is not None and company_name != company) or protected(entry):
+                    skipped.append(item)
+                    continue
+                victim = entry
+                break
+            for item in skipped:
+                heapq.heappush(self._lru, item)
+            return victim
+
+def scan_case_catalogs():
+    """
+    Fill each profile's catalog with the case folders already on disk.
+    Runs once, in the background, at startup.
+    """
+    for profile in get_profiles():
+        cfg = profile.settings
+        started = time.monotonic()
+        catalog = profile.catalog()
+        try:
+            catalog.scan(cfg.downloads_dir, excluded_cleanup_folders(cfg))
+        except Exception as e:
+            logging.error(f"Error scanning case folders for the catalog{profile.log_suffix}: {e}")
+            continue
+        logging.info(f"Case catalog ready{profile.log_suffix}: {len(catalog.cases()[1])} case folders "
+                     f"in {time.monotonic() - started:.1f}s.")
+        schedule_quota_check(profile)
+
+def page_parameters(query: Dict[str, str]) -> tuple:
+    """
+    Parse ?offset=&limit= into (offset, limit). Raises ValueError on invalid values.
+    """
+    offset = int(query.get('offset', 0))
+    limit = int(query.get('limit', CATALOG_PAGE_SIZE))
+    if offset < 0 or limit < 1:
+        raise ValueError("offset must be >= 0 and limit >= 1")
+    return offset, min(limit, CATALOG_MAX_PAGE_SIZE)
+
+# ----------------------------- Storage Quota ------------------------------
+
+BYTE_SIZE_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*([KMGT]?)B?', re.IGNORECASE)
+BYTE_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+QUOTA_MAX_LOGGED_CASES = 10
+
+def parse_byte_size(value: Any) -> int:
+    """
+    Parse a byte count given as a number or as a string such as "500MB" or
+    "1.5TB" (units of 1024). Raises ValueError on invalid values.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        size = value
+    else:
+        match = BYTE_SIZE_PATTERN.fullmatch(str(value).strip())
+        if match is None:
+            raise ValueError(f"Invalid size '{value}'. Expected a number of bytes or a value such as \"500MB\".")
+        size = float(match.group(1)) * BYTE_SIZE_UNITS[match.group(2).upper()]
+    if size < 0:
+        raise ValueError(f"Invalid size '{value}'. Sizes cannot be negative.")
+    return int(size)
+
+def pinned_case_folders(entries: list) -> frozenset:
+    """
+    Compile quota_pinned_cases: "<case>" pins the case under every company,
+    "<company>/<case>" only under that company. Names are sanitized like the folders.
+    """
+    pinned = set()
+    for entry in entries:
+        company, _, case_number = str(entry).rpartition('/')
+        case_number = sanitize_filename(case_number)
+        pinned.add((sanitize_filename(company), case_number) if company else case_number)
+    return frozenset(pinned)
+
+def quota_enabled(cfg: 'ConfigSnapshot') -> bool:
+    return bool(cfg.quota_total or cfg.quota_per_company or cfg.quota_companies)
+
+def company_budget(cfg: 'ConfigSnapshot', company: str) -> int:
+    return cfg.quota_companies.get(company, cfg.quota_per_company)
+
+def quota_exceeded(catalog: CaseCatalog, cfg: 'ConfigSnapshot', company: Optional[str] = None) -> bool:
+    """
+    Whether the case folders exceed the total budget or the budget of
+    `company` (of any company, if None).
+    """
+    total, company_size = catalog.usage(company)
+    if cfg.quota_total and total > cfg.quota_total:
+        return True
+    if company is not None:
+        budget = company_budget(cfg, company)
+        return bool(budget) and company_size > budget
+    return any(company_budget(cfg, name) and size > company_budget(cfg, name)
+               for name, size in catalog.company_sizes().items())
+
+def get_quota_enforcer() -> ThreadPoolExecutor:
+    """
+    Return the single background thread that evicts case folders, so moves never wait for an eviction.
+    """
+    global quota_enforcer
+    if quota_enforcer is None:
+        with quota_enforcer_lock:
+            if quota_enforcer is None:
+                quota_enforcer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='quota')
+    return quota_enforcer
+
+def schedule_quota_check(profile: 'Profile', company: Optional[str] = None) -> bool:
+    """
+    Queue quota enforcement for a profile if its case folders are over a
+    budget and it is not queued already. The check only reads the catalog's
+    running byte counts. Returns True if queued.
+    """
+    cfg = profile.settings
+    if not quota_enabled(cfg):
+        return False
+    catalog = profile.catalog()
+    if not catalog.complete or not quota_exceeded(catalog, cfg, company):
+        return False  # Before the startup scan the counts are incomplete; it checks once it is done
+    with quota_enforcer_lock:
+        if profile.id in quota_pending:
+            return False
+        quota_pending.add(profile.id)
+    get_quota_enforcer().submit(_run_quota_enforcement, profile)
+    return True
+
+def _run_quota_enforcement(profile: 'Profile'):
+    try:
+        with quota_enforcer_lock:
+            quota_pending.discard(profile.id)  # Changes from here on queue another pass
+        with cleanup_lock:
+            enforce_quota(profile)
+    except Exception as e:
+        logging.error(f"Error enforcing the storage quota{profile.log_suffix}: {e}")
+
+def enforce_quota(profile: 'Profile') -> Optional[dict]:
+    """
+    Delete the least recently accessed case folders of a profile until every
+    company over its budget, and then the total, is down to
+    quota_target_ratio of its budget. Pinned cases and the case the
+    profile's browser is showing are never evicted. Deletions are paced by
+    cleanup_max_ops_per_sec. Returns the report, or None if nothing was over
+    budget. The caller holds cleanup_lock.
+    """
+    cfg = profile.settings
+    catalog = profile.catalog()
+    if not quota_enabled(cfg) or not quota_exceeded(catalog, cfg):
+        return None
+    started = time.monotonic()
+    company_name, case_number = profile.case_state.current()
+    active = (sanitize_filename(company_name), sanitize_filename(case_number)) if case_number else None
+
+    def protected(entry: CatalogCase) -> bool:
+        folder = (entry.company, entry.case_number)
+        return folder == active or entry.case_number in cfg.quota_pinned_cases or folder in cfg.quota_pinned_cases
+
+    limiter = RateLimiter(cfg.cleanup_max_ops_per_sec)
+    evicted, removed, errors = [], [], []
+    over = []  # (company or None for the total, budget)
+    for company, size in sorted(catalog.company_sizes().items()):
+        budget = company_budget(cfg, company)
+        if budget and size > budget:
+            over.append((company, budget))
+    if cfg.quota_total and catalog.usage()[0] > cfg.quota_total:
+        over.append((None, cfg.quota_total))
+
+    def used(company: Optional[str]) -> int:
+        total, company_size = catalog.usage(company)
+        return company_size if company is not None else total
+
+    unresolved = []
+    for company, budget in over:
+        target = budget * cfg.quota_target_ratio
+        while used(company) > target:
+            entry = catalog.least_recently_accessed(protected, company)
+            if entry is None:
+                unresolved.append(company or "total")
+                break
+            case_removed, case_errors = evict_case_folder(profile, cfg, entry, limiter)
+            evicted.append(f"{entry.company}/{entry.case_number}")
+            removed.extend(case_removed)
+            errors.extend(case_errors)
+
+    summary = cleanup_summary(removed)
+    report = {
+        "cases": evicted,
+        "files": summary["files"],
+        "bytes": summary["bytes"],
+        "errors": len(errors),
+        "used": catalog.usage()[0],
+        "unresolved": unresolved,
+        "duration": round(time.monotonic() - started, 3),
+    }
+    profile.last_quota_report = report
+    QUOTA_CASES_EVICTED.inc(len(evicted))
+    QUOTA_BYTES_FREED.inc(report["bytes"])
+    logging.info(f"Storage quota{profile.log_suffix}: evicted {len(evicted)} case folders "
+                 f"({report['files']} files, {format_bytes(report['bytes'])}) in {report['duration']:.1f}s; "
+                 f"{format_bytes(report['used'])} now used"
+                 + (f". Evicted: {', '.join(evicted[:QUOTA_MAX_LOGGED_CASES])}" if evicted else ""))
+    if unresolved:
+        logging.warning(f"Storage quota{profile.log_suffix}: still over budget for {', '.join(unresolved)}; "
+                        f"the remaining case folders are pinned or active.")
+    if errors:
+        sample = "; ".join(f"{path}: {error}" for path, error in errors[:CLEANUP_MAX_LOGGED_ERRORS])
+        logging.error(f"Failed to remove {len(errors)} files while enforcing the storage quota, e.g. {sample}")
+    return report
+
+def evict_case_folder(profile: 'Profile', cfg: 'ConfigSnapshot', entry: CatalogCase, limiter: RateLimiter) -> tuple:
+    """
+    Delete the files of one case folder with its archive indexes, and the
+    folders left empty. Returns (removed candidates, [(path, error)]).
+    """
+    root = cfg.downloads_dir
+    prefix = f"{entry.company}/{entry.case_number}/"
+    candidates = [CleanupCandidate(prefix + file["path"], entry.company, file["size"], file["mtime"])
+                  for file in profile.catalog().files([entry])]
+    removed, vanished, errors = delete_cleanup_batch(root, candidates, limiter)
+    gone = [candidate.rel_path for candidate in removed] + vanished
+    profile.file_index().remove(gone)
+    profile.catalog().remove(gone)
+    shutil.rmtree(root / prefix / ARCHIVE_INDEX_DIR, ignore_errors=True)
+    gone_paths = set(gone) | {prefix + ARCHIVE_INDEX_DIR}
+    for directory in prunable_directories(root, list(gone_paths), gone_paths):
+        try:
+            os.rmdir(root / directory)
+        except OSError:
+            pass  # Something new arrived
+    logging.debug(f"Evicted case folder {prefix} ({len(removed)} files)")
+    return removed, errors
+
+def quota_status(profile: 'Profile') -> Optional[dict]:
+    cfg = profile.settings
+    if not quota_enabled(cfg):
+        return None
+    total, _ = profile.catalog().usage()
+    return {"used": total, "budget": cfg.quota_total or None, "last_eviction": profile.last_quota_report}
+
+# ----------------------------- Cold Storage -------------------------------
+
+COLD_STORAGE_DIR = '.scdo_cold'  # Hidden top-level folder holding the archived case folders
+COLD_STORAGE_FORMATS = ('auto', 'zstd', 'xz', 'gzip')
+COLD_STORAGE_EXTENSIONS = {'zstd': '.tar.zst', 'xz': '.tar.xz', 'gzip': '.tar.gz'}
+COLD_MANIFEST_SUFFIX = '.manifest.json'
+COLD_CHUNK_SIZE = 4 * 1024 * 1024  # Compressed independently; several are in flight per worker
+COLD_RETRY_DELAY = 60  # Seconds to wait for the startup catalog scan before tiering
+
+def cold_storage_codec(cfg: 'ConfigSnapshot') -> str:
+    """
+    The compression used for new archives: zstd when the zstandard package is
+    installed (for "auto" or "zstd"), otherwise xz, or gzip if configured.
+    """
+    if cfg.cold_storage_format in ('auto', 'zstd'):
+        if zstandard is not None:
+            return 'zstd'
+        if cfg.cold_storage_format == 'zstd':
+            logging.warning("cold_storage_format is zstd, but the zstandard package is not installed; using xz.")
+        return 'xz'
+    return cfg.cold_storage_format
+
+def compress_chunk(codec: str, chunk: bytes) -> bytes:
+    if codec == 'xz':
+        return lzma.compress(chunk, preset=3)
+    return gzip.compress(chunk, compresslevel=6, mtime=0)
+
+class ParallelCompressedWriter:
+    """
+    Write-only file object that compresses what is written to it in
+    COLD_CHUNK_SIZE pieces on a thread pool and writes the results to
+    `target` in order. Each piece becomes a separate xz stream or gzip
+    member; concatenated, they still form one valid .xz or .gz file, which
+    lzma.open and gzip.open read in one go. At most `max_pending` pieces
+    are held in memory.
+    """
+
+    def __init__(self, target, codec: str, pool: ThreadPoolExecutor, max_pending: int):
+        self._target = target
+        self._codec = codec
+        self._pool = pool
+        self._max_pending = max_pending
+        self._buffer = bytearray()
+        self._pending: collections.deque = collections.deque()
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= COLD_CHUNK_SIZE:
+            self._submit(bytes(self._buffer[:COLD_CHUNK_SIZE]))
+            del self._buffer[:COLD_CHUNK_SIZE]
+        return len(data)
+
+    def _submit(self, chunk: bytes):
+        self._pending.append(self._pool.submit(compress_chunk, self._codec, chunk))
+        while len(self._pending) > self._max_pending:
+            self._target.write(self._pending.popleft().result())
+
+    def close(self):
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        while self._pending:
+            self._target.write(self._pending.popleft().result())
+
+def lower_thread_priority(increment: int):
+    """
+    Lower the calling thread's CPU priority by `increment` nice levels. Linux
+    keeps a nice value per thread, and threads started by this one inherit
+    it. Elsewhere nice applies to the whole process, so it is not changed,
+    and cold_storage_workers alone bounds the CPU used.
+    """
+    if increment <= 0 or not sys.platform.startswith('linux'):
+        return
+    thread_id = threading.get_native_id()
+    try:
+        os.setpriority(os.PRIO_PROCESS, thread_id, min(19, os.getpriority(os.PRIO_PROCESS, thread_id) + increment))
+    except OSError as e:
+        logging.debug(f"Could not lower the priority of {threading.current_thread().name}: {e}")
+
+def cold_folder(cfg: 'ConfigSnapshot', company: str) -> Path:
+    return cfg.downloads_dir / COLD_STORAGE_DIR / company
+
+def read_cold_manifests(cfg: 'ConfigSnapshot', case_number: Optional[str] = None,
+                        company: Optional[str] = None) -> list:
+    """
+    Return the manifests of the archived case folders (of one case and/or
+    company, by folder name), oldest first, each with its "manifest" path added.
+    """
+    root = cfg.downloads_dir / COLD_STORAGE_DIR
+    try:
+        with os.scandir(root) as entries:
+            companies = [entry.name for entry in entries if entry.is_dir() and (company is None or entry.name == company)]
+    except FileNotFoundError:
+        return []
+    manifests = []
+    for name in companies:
+        with os.scandir(root / name) as entries:
+            paths = [Path(entry.path) for entry in entries if entry.name.endswith(COLD_MANIFEST_SUFFIX)]
+        for path in paths:
+            try:
+                manifest = json.loads(path.read_text(encoding='utf-8'))
+            except (OSError, ValueError) as e:
+                logging.warning(f"Skipping unreadable cold storage manifest {path}: {e}")
+                continue
+            if case_number is None or manifest.get("case_number") == case_number:
+                manifest["manifest"] = path
+                manifests.append(manifest)
+    return sorted(manifests, key=lambda manifest: (manifest["archived_at"], manifest["company"]))
+
+def case_folder_files(case_dir: Path) -> list:
+    """
+    List the regular files under a case folder, hidden ones included, as
+    sorted (path inside the case folder, size, mtime_ns) tuples.
+    """
+    files = []
+    for directory, _, names in os.walk(case_dir):
+        for name in names:
+            path = os.path.join(directory, name)
+            st = os.lstat(path)
+            if stat.S_ISREG(st.st_mode):
+                files.append((os.path.relpath(path, case_dir).replace(os.sep, '/'), st.st_size, st.st_mtime_ns))
+    return sorted(files)
+
+def archive_case_folder(profile: 'Profile', cfg: 'ConfigSnapshot', company: str, case_number: str,
+                        pool: ThreadPoolExecutor) -> Optional[dict]:
+    """
+    Pack one case folder into a compressed tar archive with a manifest under
+    COLD_STORAGE_DIR, then delete the archived files. The tar is streamed
+    straight into the compressor, so nothing is staged on disk. If any file
+    changed while it was packed, the archive is discarded and the folder is
+    left as it was. Returns the manifest, or None if the folder was left alone.
+    """
+    root = cfg.downloads_dir
+    case_dir = root / company / case_number
+    files = case_folder_files(case_dir)
+    if not files:
+        return None
+
+    codec = cold_storage_codec(cfg)
+    archived_at = time.time()
+    stem = f"{case_number}.{time.strftime('%Y%m%d%H%M%S', time.localtime(archived_at))}"
+    target_folder = cold_folder(cfg, company)
+    target_folder.mkdir(parents=True, exist_ok=True)
+    archive = target_folder / (stem + COLD_STORAGE_EXTENSIONS[codec])
+    partial = archive.with_name(archive.name + '.tmp')
+    started = time.monotonic()
+    try:
+        with open(partial, 'wb') as raw:
+            if codec == 'zstd':
+                # zstd splits the work over its own threads, which inherit this thread's priority
+                writer = zstandard.ZstdCompressor(level=3, threads=cfg.cold_storage_workers).stream_writer(
+                    raw, closefd=False)
+            else:
+                writer = ParallelCompressedWriter(raw, codec, pool, 2 * cfg.cold_storage_workers)
+            with tarfile.open(fileobj=writer, mode='w|', format=tarfile.PAX_FORMAT) as tar:
+                for rel_path, size, mtime_ns in files:
+                    with open(case_dir / rel_path, 'rb') as source:
+                        st = os.fstat(source.fileno())
+                        if st.st_size != size or st.st_mtime_ns != mtime_ns:
+                            raise FileExistsError(f"{rel_path} changed while it was archived")
+                        tar.addfile(tar.gettarinfo(arcname=rel_path, fileobj=source), source)
+            writer.close()
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(partial, archive)
+
+        # Only delete what was archived, and only if nothing changed or arrived meanwhile
+        if case_folder_files(case_dir) != files:
+            archive.unlink()
+            logging.info(f"Cold storage{profile.log_suffix}: {company}/{case_number} changed while it was "
+                         f"archived; leaving it in place.")
+            return None
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+
+    manifest = {
+        "version": 1,
+        "company": company,
+        "case_number": case_number,
+        "archive": archive.name,
+        "codec": codec,
+        "archived_at": round(archived_at, 3),
+        "size": sum(size for _, size, _ in files),
+        "compressed_size": archive.stat().st_size,
+        "files": [{"path": rel_path, "size": size, "mtime": mtime_ns / 1e9} for rel_path, size, mtime_ns in files],
+    }
+    manifest_path = target_folder / (stem + COLD_MANIFEST_SUFFIX)
+    temp_manifest = manifest_path.with_name(manifest_path.name + '.tmp')
+    temp_manifest.write_text(json.dumps(manifest), encoding='utf-8')
+    os.replace(temp_manifest, manifest_path)
+
+    gone = [f"{company}/{case_number}/{rel_path}" for rel_path, _, _ in files]
+    for rel_path in gone:
+        try:
+            os.unlink(root / rel_path)
+        except FileNotFoundError:
+            pass
+    profile.file_index().remove(gone)
+    profile.catalog().remove(gone)
+    for directory in prunable_directories(root, gone, set(gone)):
+        try:
+            os.rmdir(root / directory)
+        except OSError:
+            pass  # Something new arrived
+    COLD_STORAGE_CASES.inc(labels=('archived',))
+    COLD_STORAGE_BYTES.inc(manifest["size"])
+    logging.info(f"Cold storage{profile.log_suffix}: archived {company}/{case_number} ({len(files)} files, "
+                 f"{format_bytes(manifest['size'])} -> {format_bytes(manifest['compressed_size'])}, {codec}) "
+                 f"in {time.monotonic() - started:.1f}s.")
+    return manifest
+
+def restore_case_folder(profile: 'Profile', manifest: dict) -> int:
+    """
+    Unpack an archived case folder back into place and delete its archive.
+    Files that exist again in the case folder (downloaded since) are kept.
+    Returns the number of files restored.
+    """
+    cfg = profile.settings
+    company, case_number = manifest["company"], manifest["case_number"]
+    case_dir = cfg.downloads_dir / company / case_number
+    archive = manifest["manifest"].with_name(manifest["archive"])
+    if manifest["codec"] == 'zstd':
+        if zstandard is None:
+            raise RuntimeError(f"{archive.name} needs the zstandard package to be restored")
+        source = zstandard.ZstdDecompressor().stream_reader(open(archive, 'rb'))
+    elif manifest["codec"] == 'xz':
+        source = lzma.open(archive, 'rb')
+    else:
+        source = gzip.open(archive, 'rb')
+
+    restored = []
+    with source, tarfile.open(fileobj=source, mode='r|') as tar:
+        for member in tar:
+            name = member.name
+            if not member.isfile() or name.startswith('/') or '..' in name.split('/'):
+                continue
+            if (case_dir / name).exists():
+                continue
+            tar.extract(member, case_dir, set_attrs=True, **({'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}))
+            restored.append((f"{company}/{case_number}/{name}", member.size, float(member.mtime)))
+
+    catalog = profile.catalog()
+    index = profile.file_index()
+    for rel_path, size, mtime in restored:
+        catalog.add(rel_path, size, mtime)
+        index.record(rel_path, mtime, size)
+    catalog.touch(case_number, company)  # Restored for use; not archived again right away
+    archive.unlink()
+    manifest["manifest"].unlink()
+    schedule_quota_check(profile, company)
+    COLD_STORAGE_CASES.inc(labels=('restored',))
+    logging.info(f"Cold storage{profile.log_suffix}: restored {len(restored)} files of {company}/{case_number}.")
+    return len(restored)
+
+def restore_cold_cases(profile: 'Profile', manifests: list):
+    """
+    Restore archived case folders, oldest archive first. Runs on its own thread.
+    """
+    with cold_storage_lock:
+        for manifest in manifests:
+            if not manifest["manifest"].exists():
+                continue  # Restored by an earlier request
+            try:
+                restore_case_folder(profile, manifest)
+            except Exception as e:
+                logging.error(f"Error restoring {manifest['company']}/{manifest['case_number']} from cold storage: {e}")
+
+def tier_inactive_cases(profile: 'Profile') -> Optional[dict]:
+    """
+    Archive every case folder of a profile that has not been accessed for
+    cold_storage_after (see CaseCatalog), except the case open in the
+    browser. Returns the report, or None if the catalog is not loaded yet.
+    """
+    cfg = profile.settings
+    catalog = profile.catalog()
+    if not catalog.complete:
+        return None
+    threshold = parse_time_threshold(cfg.cold_storage_after)
+    if not threshold:
+        logging.error("Failed to parse cold_storage_after. Skipping cold storage.")
+        return None
+    cutoff = time.time() - threshold.total_seconds()
+    company_name, case_number = profile.case_state.current()
+    active = (sanitize_filename(company_name), sanitize_filename(case_number)) if case_number else None
+    inactive = [(entry.company, entry.case_number) for entry in catalog.inactive_cases(cutoff)
+                if (entry.company, entry.case_number) != active]
+
+    started = time.monotonic()
+    archived, size, compressed, errors = [], 0, 0, 0
+    # The compressor threads inherit the lowered priority of the scheduler thread
+    with ThreadPoolExecutor(max_workers=cfg.cold_storage_workers, thread_name_prefix='cold') as pool:
+        for company, case in inactive:
+            try:
+                with cold_storage_lock:
+                    manifest = archive_case_folder(profile, cfg, company, case, pool)
+            except Exception as e:
+                errors += 1
+                logging.error(f"Error archiving {company}/{case} to cold storage{profile.log_suffix}: {e}")
+                continue
+            if manifest is not None:
+                archived.append(f"{company}/{case}")
+                size += manifest["size"]
+                compressed += manifest["compressed_size"]
+    report = {"cases": len(archived), "bytes": size, "compressed_bytes": compressed, "errors": errors,
+              "duration": round(time.monotonic() - started, 3)}
+    profile.last_cold_storage_report = report
+    if archived or errors:
+        logging.info(f"Cold storage run{profile.log_suffix}: archived {len(archived)} inactive case folders "
+                     f"({format_bytes(size)} -> {format_bytes(compressed)}, {errors} errors) in {report['duration']:.1f}s.")
+    return report
+
+def cold_storage_scheduler():
+    """
+    Archive inactive case folders of every profile with cold storage enabled,
+    every cold_storage_interval. Runs on its own low-priority thread.
+    """
+    lower_thread_priority(settings.cold_storage_nice)
+    while True:
+        cfg = settings
+        enabled = [profile for profile in get_profiles() if profile.settings.cold_storage_enabled]
+        if not enabled:
+            wait_for_config_change(cfg)
+            continue
+        interval = parse_time_threshold(cfg.cold_storage_interval)
+        if not interval:
+            logging.error("Failed to parse cold_storage_interval. Cold storage paused until the configuration changes.")
+            wait_for_config_change(cfg)
+            continue
+        pause = interval.total_seconds()
+        for profile in enabled:
+            try:
+                if tier_inactive_cases(profile) is None:
+                    pause = min(pause, COLD_RETRY_DELAY)  # Catalog still loading
+            except Exception as e:
+                logging.error(f"Error during cold storage run{profile.log_suffix}: {e}")
+        wait_for_config_change(cfg, pause)
+
+# ----------------------------- Profiles -----------------------------------
+
+class Profile:
+    """
+    One browser profile served by this process: its Downloads directory and
+    rules (settings), the case its browser last reported, its downloads in
+    flight, and the file index, job journal and case catalog of its
+    directory, opened on first use. The HTTP server, directory watcher, mover
+    pool and cleanup scheduler are shared by all profiles, so an extra
+    profile costs a few small tables instead of a whole process.
+    """
+
+    def __init__(self, cfg: ConfigSnapshot):
+        self.id = cfg.profile_id
+        self.settings = cfg  # Replaced by get_profiles() when the configuration is reloaded
+        self.case_state = CaseState(self._case_applied)
+        self.file_assignments: Dict[str, Optional[tuple]] = {}  # Guarded by assignments_lock
+        self.partial_downloads: Dict[str, float] = {}  # Final name -> start time; monitor thread only
+        self.startup_sweep: Optional['StartupSweep'] = None  # Set by main() while leftovers are moved
+        self.last_cleanup_report: Optional[dict] = None
+        self.last_quota_report: Optional[dict] = None
+        self.last_cold_storage_report: Optional[dict] = None
+        self.log_suffix = '' if self.id == DEFAULT_PROFILE_ID else f" [profile {self.id}]"
+        self._lock = threading.Lock()
+        self._file_index: Optional[FileIndex] = None
+        self._job_journal: Optional[JobJournal] = None
+        self._catalog: Optional[CaseCatalog] = None
+
+    def file_index(self) -> FileIndex:
+        """
+        Return the profile's FileIndex, opening its index_file on first use.
+        """
+        if self._file_index is None:
+            with self._lock:
+                if self._file_index is None:
+                    self._file_index = FileIndex(self.settings.index_file)
+        return self._file_index
+
+    def job_journal(self) -> JobJournal:
+        """
+        Return the profile's JobJournal, replaying its journal_file on first use.
+        """
+        if self._job_journal is None:
+            with self._lock:
+                if self._job_journal is None:
+                    self._job_journal = JobJournal(self.settings.journal_file)
+        return self._job_journal
+
+    def catalog(self) -> CaseCatalog:
+        if self._catalog is None:
+            with self._lock:
+                if self._catalog is None:
+                    self._catalog = CaseCatalog()
+        return self._catalog
+
+    def _case_applied(self, state: tuple):
+        # Keeps the case opened in the browser at the back of the storage quota's eviction order
+        company_name, case_number = state
+        if case_number is not None:
+            self.catalog().touch(sanitize_filename(case_number), sanitize_filename(company_name))
+
+def get_profiles() -> list:
+    """
+    Return every configured Profile in configuration order, first handing
+    each one its snapshot of the current configuration.
+    """
+    global profile_list, profiles_source
+    cfg = settings
+    if profiles_source is not cfg:
+        with profiles_lock:
+            if profiles_source is not cfg:
+                synced = []
+                for profile_cfg in cfg.profiles:
+                    profile = profiles.get(profile_cfg.profile_id)
+                    if profile is None:
+                        profile = profiles[profile_cfg.profile_id] = Profile(profile_cfg)
+                    profile.settings = profile_cfg
+                    synced.append(profile)
+                profile_list = synced
+                profiles_source = cfg
+    return profile_list
+
+def get_profile(profile_id: Optional[str] = None) -> Optional[Profile]:
+    """
+    Return the profile with this id, or the default (first) profile for None.
+    Returns None for an unknown id.
+    """
+    current = get_profiles()
+    if profile_id is None:
+        return current[0]
+    profile = profiles.get(profile_id)
+    return profile if profile in current else None
+
+# ----------------------------- Server Handler -----------------------------
+
+class HTTPError(Exception):
+    """
+    Raised while reading a request to answer with an error status and close the connection.
+    """
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class Request(NamedTuple):
+    """
+    A parsed HTTP request as seen by Handler endpoints.
+    """
+    method: str
+    path: str
+    query: Dict[str, str]
+    headers: Dict[str, str]  # Lower-cased header names
+    body: bytes = b''
+    keep_alive: bool = True
+    profile: Optional[str] = None  # Profile id from the listening port, URL prefix or ?profile=
+
+class Response:
+    """
+    An HTTP response produced by a Handler endpoint.
+    """
+    __slots__ = ('status', 'body', 'content_type', 'headers')
+
+    def __init__(self, status: int, body: bytes = b'', content_type: str = 'text/plain; charset=utf-8',
+                 headers: Optional[Dict[str, str]] = None):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+        self.headers = headers or {}
+
+    @classmethod
+    def json(cls, status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> 'Response':
+        return cls(status, json.dumps(payload).encode('utf-8'), 'application/json', headers)
+
+class Handler:
+    """
+    Routes parsed HTTP requests to the server endpoints.
+    The Handler knows nothing about sockets, so it can also be driven directly.
+    """
+
+    def __init__(self):
+        # (method, path pattern, endpoint, does blocking I/O)
+        self.routes = [
+            ('POST', re.compile(r'/reload/?'), self.handle_reload, True),
+            ('POST', re.compile(r'/cleanup/?'), self.handle_cleanup, True),
+            ('GET', re.compile(r'/status/?'), self.handle_status, False),
+            ('GET', re.compile(r'/metrics/?'), self.handle_metrics, False),
+            ('GET', re.compile(r'/profiler/?'), self.handle_profiler, False),
+            ('GET', re.compile(r'/case/(?P<case>[^/]+)/search/?'), self.handle_case_search, True),
+            ('GET', re.compile(r'/cases/?'), self.handle_cases, False),
+            ('GET', re.compile(r'/cases/(?P<case>[^/]+)/files/?'), self.handle_case_files, True),
+            ('GET', re.compile(r'/cases/(?P<case>[^/]+)/size/?'), self.handle_case_size, False),
+            ('GET', re.compile(r'/cold/?'), self.handle_cold_cases, True),
+            ('POST', re.compile(r'/cases/(?P<case>[^/]+)/restore/?'), self.handle_case_restore, True),
+            ('POST', re.compile(r'/profiler/(?P<action>start|stop)/?'), self.handle_profiler_toggle, False),
+        ]
+        # Any other POST is a case notification, as the listener posts to the server root
+        self.fallback_post = self.handle_case_update
+
+    def resolve(self, request: Request) -> tuple:
+        """
+        Find the endpoint for a request.
+        Returns (callable producing a Response, whether it should run off the event loop).
+        A profile's url_prefix is stripped from the path before routing.
+        """
+        profile_id, path = request.profile, request.path
+        if profile_id is None:
+            for profile_cfg in settings.profiles:
+                prefix = profile_cfg.url_prefix
+                if prefix and (path == prefix or path.startswith(prefix + '/')):
+                    profile_id, path = profile_cfg.profile_id, path[len(prefix):] or '/'
+                    break
+            else:
+                profile_id = request.query.get('profile')
+        if profile_id is not None and get_profile(profile_id) is None:
+            return (lambda: Response(404, b'Unknown profile.')), False
+        request = request._replace(path=path, profile=profile_id)
+
+        path_known = False
+        for method, pattern, endpoint, blocking in self.routes:
+            match = pattern.fullmatch(request.path)
+            if not match:
+                continue
+            path_known = True
+            if method == request.method:
+                return functools.partial(self._call, endpoint, request, match.groupdict()), blocking
+        if request.method == 'POST':
+            return functools.partial(self._call, self.fallback_post, request, {}), False
+        if path_known:
+            return (lambda: Response(405, b'Method not allowed.')), False
+        return (lambda: Response(404, b'Not found.')), False
+
+    def handle(self, request: Request) -> Response:
+        endpoint, _ = self.resolve(request)
+        return endpoint()
+
+    @staticmethod
+    def _call(endpoint, request: Request, params: Dict[str, str]) -> Response:
+        start = time.perf_counter()
+        try:
+            return endpoint(request, **params)
+        except Exception as e:
+            logging.error(f"Error processing request: {e}")
+            return Response(500, b'Internal server error.')
+        finally:
+            HTTP_REQUEST_TIME.observe(time.perf_counter() - start, (request.method, endpoint.__name__))
+
+    def handle_case_update(self, request: Request) -> Response:
+        """
+        Receive the active case number and company name from the Tampermonkey script.
+        """
+        try:
+            data = json.loads(request.body)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            logging.error('Invalid JSON in POST data.')
+            return Response(400, b'Invalid JSON.')
+
+        received_case_number = data.get('case_number') if isinstance(data, dict) else None
+        received_company_name = data.get('company_name') if isinstance(data, dict) else None
+        profile_id = (data.get('profile_id') if isinstance(data, dict) else None) or request.profile
+        profile = get_profile(profile_id)
+        if profile is None:
+            logging.error(f'Case notification for unknown profile "{profile_id}".')
+            return Response(404, b'Unknown profile.')
+
+        if received_case_number is None or received_company_name is None:
+            logging.error('Both "case_number" and "company_name" must be provided in POST data.')
+            return Response(400, b'Both "case_number" and "company_name" must be provided.')
+
+        logging.debug(f"Received Case Number: {received_case_number}, Company Name: {received_company_name}")
+
+        if received_case_number == 'NO_CASE' and received_company_name == 'NO_COMPANY':
+            received_case_number = received_company_name = None
+
+        outcome = profile.case_state.update(received_company_name, received_case_number,
+                                            profile.settings.case_debounce_ms / 1000)
+        CASE_UPDATES.inc(labels=(outcome,))
+        if outcome != 'applied':
+            return Response(204)  # Duplicate or debounced: nothing to report back
+        return Response(200, b'Case information received successfully.')
+
+    def handle_status(self, request: Request) -> Response:
+        """
+        Report the active case, in-flight files, startup sweep progress, last cleanup and quota usage of a profile.
+        """
+        profile = get_profile(request.profile)
+        company_name, case_number = profile.case_state.current()
+        with assignments_lock:
+            in_flight = len(profile.file_assignments)
+        return Response.json(200, {
+            "profile": profile.id,
+            "profiles": [other.id for other in get_profiles()],
+            "company_name": company_name,
+            "case_number": case_number,
+            "files_in_flight": in_flight,
+            "startup_sweep": profile.startup_sweep.progress() if profile.startup_sweep is not None else None,
+            "last_cleanup": profile.last_cleanup_report,
+            "quota": quota_status(profile),
+            "cold_storage": profile.last_cold_storage_report,
+        })
+
+    def handle_metrics(self, request: Request) -> Response:
+        """
+        Expose counters and timing histograms in the Prometheus text format.
+        """
+        return Response(200, metrics.render().encode('utf-8'),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    def handle_profiler(self, request: Request) -> Response:
+        """
+        Return the sampling profiler's stacks in collapsed-stack form, most frequent first.
+        ?limit=N keeps only the N most frequent stacks.
+        """
+        limit = request.query.get('limit', '')
+        return Response(200, profiler.report(int(limit) if limit.isdigit() else None).encode('utf-8'))
+
+    def handle_profiler_toggle(self, request: Request, action: str) -> Response:
+        """
+        Start (POST /profiler/start[?interval_ms=N]) or stop (POST /profiler/stop) the sampling profiler.
+        """
+        if action == 'start':
+            interval_ms = request.query.get('interval_ms', '')
+            try:
+                interval_ms = float(interval_ms) if interval_ms else settings.profiler_interval_ms
+            except ValueError:
+                return Response(400, b'Invalid interval_ms.')
+            profiler.start(max(1.0, interval_ms) / 1000)
+        else:
+            profiler.stop()
+        return Response.json(200, profiler.status())
+
+    def handle_case_search(self, request: Request, case: str) -> Response:
+        """
+        Search the member names of the archives stored for a case:
+        GET /case/<case>/search?q=<text or glob>[&company=<name>][&limit=N].
+        """
+        query = request.query.get('q', '').strip()
+        if not query:
+            return Response(400, b'Missing search query (q).')
+        cfg = get_profile(request.profile).settings
+        if not cfg.archive_index_enabled:
+            return Response.json(409, {"status": "error", "error": "Archive indexing is disabled."})
+        limit = request.query.get('limit', '')
+        limit = min(int(limit), ARCHIVE_SEARCH_LIMIT) if limit.isdigit() else ARCHIVE_SEARCH_DEFAULT_LIMIT
+        return Response.json(200, search_case_archives(cfg, case, query,
+                                                       request.query.get('company'), limit))
+
+    @staticmethod
+    def _not_modified(request: Request, etag: str) -> Optional[Response]:
+        """
+        Answer 304 if the client's cached copy (If-None-Match) is still current.
+        """
+        candidates = request.headers.get('if-none-match', '')
+        if candidates and any(tag.strip().removeprefix('W/') in (etag, '*') for tag in candidates.split(',')):
+            return Response(304, headers={"ETag": etag})
+        return None
+
+    def handle_cases(self, request: Request) -> Response:
+        """
+        List the company/case folders with their file counts and sizes: GET /cases[?offset=N&limit=N].
+        """
+        try:
+            offset, limit = page_parameters(request.query)
+        except ValueError:
+            return Response(400, b'Invalid offset or limit.')
+        catalog = get_profile(request.profile).catalog()
+        etag, cases = catalog.cases()
+        not_modified = self._not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        return Response.json(200, {"total": len(cases), "offset": offset, "limit": limit,
+                                   "complete": catalog.complete, "cases": cases[offset:offset + limit]},
+                             headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    def handle_case_files(self, request: Request, case: str) -> Response:
+        """
+        List the files of a case, under every company or only ?company=:
+        GET /cases/<case>/files[?company=<name>&offset=N&limit=N].
+        """
+        try:
+            offset, limit = page_parameters(request.query)
+        except ValueError:
+            return Response(400, b'Invalid offset or limit.')
+        company = request.query.get('company')
+        catalog = get_profile(request.profile).catalog()
+        etag, entries = catalog.case(sanitize_filename(case), sanitize_filename(company) if company else None)
+        catalog.touch(sanitize_filename(case), sanitize_filename(company) if company else None)
+        not_modified = self._not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        if not entries and catalog.complete:
+            return Response(404, b'Unknown case.')
+        files = catalog.files(entries)
+        return Response.json(200, {"case_number": case, "total": len(files), "offset": offset, "limit": limit,
+                                   "complete": catalog.complete, "files": files[offset:offset + limit]},
+                             headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    def handle_case_size(self, request: Request, case: str) -> Response:
+        """
+        Total size of a case, overall and per company: GET /cases/<case>/size[?company=<name>].
+        """
+        company = request.query.get('company')
+        catalog = get_profile(request.profile).catalog()
+        etag, entries = catalog.case(sanitize_filename(case), sanitize_filename(company) if company else None)
+        not_modified = self._not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        if not entries and catalog.complete:
+            return Response(404, b'Unknown case.')
+        per_company = {entry.company: {"files": len(entry.files), "size": entry.size} for entry in entries}
+        return Response.json(200, {"case_number": case, "complete": catalog.complete,
+                                   "files": sum(totals["files"] for totals in per_company.values()),
+                                   "size": sum(totals["size"] for totals in per_company.values()),
+                                   "per_company": per_company},
+                             headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    def handle_cold_cases(self, request: Request) -> Response:
+        """
+        List the case folders in cold storage: GET /cold[?case=<case>&company=<name>].
+        The archived files are listed when a case is given.
+        """
+        case = request.query.get('case')
+        company = request.query.get('company')
+        manifests = read_cold_manifests(get_profile(request.profile).settings,
+                                        sanitize_filename(case) if case else None,
+                                        sanitize_filename(company) if company else None)
+        archives = []
+        for manifest in manifests:
+            entry = {key: value for key, value in manifest.items() if key not in ("manifest", "files")}
+            entry["file_count"] = len(manifest["files"])
+            if case:
+                entry["files"] = manifest["files"]
+            archives.append(entry)
+        return Response.json(200, {"total": len(archives), "archives": archives})
+
+    def handle_case_restore(self, request: Request, case: str) -> Response:
+        """
+        Restore a case from cold storage in the background and answer 202:
+        POST /cases/<case>/restore[?company=<name>].
+        """
+        profile = get_profile(request.profile)
+        company = request.query.get('company')
+        manifests = read_cold_manifests(profile.settings, sanitize_filename(case),
+                                        sanitize_filename(company) if company else None)
+        if not manifests:
+            return Response(404, b'No archived folders for this case.')
+        threading.Thread(target=restore_cold_cases, args=(profile, manifests), name='cold-restore', daemon=True).start()
+        return Response.json(202, {"status": "restoring",
+                                   "archives": [f"{manifest['company']}/{manifest['archive']}" for manifest in manifests]})
+
+    def handle_reload(self, request: Request) -> Response:
+        """
+        Re-read config.json and swap in the new configuration without a restart.
+        """
+        try:
+            result = reload_config()
+            return Response.json(200, {"status": "reloaded", **result})
+        except (OSError, ValueError) as e:
+            logging.error(f"Error reloading {CONFIG_FILE}: {e}. Keeping the current configuration.")
+            return Response.json(400, {"status": "error", "error": str(e)})
+
+    def handle_cleanup(self, request: Request) -> Response:
+        """
+        With ?dry_run=1, return the cleanup plan as JSON without deleting anything.
+        Otherwise start a cleanup in the background and answer 202.
+        """
+        profile = get_profile(request.profile)
+        dry_run = request.query.get('dry_run', '').lower() in ('1', 'true', 'yes')
+        if dry_run:
+            report = cleanup_old_files(dry_run=True, profile=profile)
+            if report is None:
+                return Response.json(409, {"status": "error", "error": "Cleanup is already running or misconfigured."})
+            return Response.json(200, report)
+        if not profile.settings.cleanup_enabled:
+            return Response.json(409, {"status": "error", "error": "File cleanup is disabled."})
+        if cleanup_lock.locked():
+            return Response.json(409, {"status": "error", "error": "Cleanup is already running."})
+        threading.Thread(target=cleanup_old_files, kwargs={"dry_run": False, "profile": profile}, daemon=True).start()
+        return Response.json(202, {"status": "started"})
+
+# ----------------------------- HTTP Server --------------------------------
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_HEADER_COUNT = 100
+
+class AsyncHTTPServer:
+    """
+    Minimal asyncio HTTP/1.1 server for the Tampermonkey notifications.
+    Supports keep-alive, enforces http_max_request_size and per-request
+    timeouts, and never lets one slow client hold up the others. Endpoints
+    doing blocking I/O run on a small thread pool instead of the event loop.
+    Mirrors the socketserver API used by main(): serve_forever(), shutdown()
+    and server_close(). profile_ports maps extra ports to the profile whose
+    requests they receive; all ports are served by the same event loop.
+    """
+
+    def __init__(self, server_address: tuple, handler: Handler, profile_ports: Optional[Dict[int, str]] = None):
+        self.server_address = server_address
+        self.handler = handler
+        self.socket = socket.create_server(server_address)
+        self.profile_sockets: Dict[str, socket.socket] = {}
+        try:
+            for port, profile_id in (profile_ports or {}).items():
+                self.profile_sockets[profile_id] = socket.create_server((server_address[0], port))
+        except OSError:
+            self.server_close()
+            raise
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='http')
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._shutdown_requested = False
+        self._is_shut_down = threading.Event()
+        self._connections: set = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.server_close()
+
+    def serve_forever(self):
+        """
+        Run the event loop in the calling thread until shutdown() is called.
+        """
+        self._is_shut_down.clear()
+        try:
+            asyncio.run(self._serve())
+        finally:
+            self._is_shut_down.set()
+
+    def shutdown(self):
+        """
+        Stop serve_forever() and wait for it to return. Safe to call from any thread.
+        """
+        self._shutdown_requested = True
+        loop, stop = self._loop, self._stop
+        if loop is not None and stop is not None:
+            try:
+                loop.call_soon_threadsafe(stop.set)
+            except RuntimeError:
+                pass  # Loop already closed
+            self._is_shut_down.wait()
+
+    def server_close(self):
+        self._executor.shutdown(wait=False)
+        self.socket.close()
+        for profile_socket in self.profile_sockets.values():
+            profile_socket.close()
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        if self._shutdown_requested:
+            return
+        servers = [await asyncio.start_server(self._handle_connection, sock=self.socket, limit=MAX_HEADER_BYTES)]
+        for profile_id, profile_socket in self.profile_sockets.items():
+            servers.append(await asyncio.start_server(
+                functools.partial(self._handle_connection, profile=profile_id), sock=profile_socket,
+                limit=MAX_HEADER_BYTES))
+        try:
+            await self._stop.wait()
+            for writer in list(self._connections):
+                writer.close()
+        finally:
+            for server in servers:
+                server.close()
+            for server in servers:
+                await server.wait_closed()
+        self._loop = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                                 profile: Optional[str] = None):
+        self._connections.add(writer)
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while True:
+                cfg = settings
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), cfg.http_keepalive_timeout)
+                except asyncio.TimeoutError:
+                    break  # Idle keep-alive connection
+                if not request_line:
+                    break  # Client closed the connection
+                if request_line in (b'\r\n', b'\n'):
+                    continue  # Tolerate stray line breaks between requests
+
+                try:
+                    request = await asyncio.wait_for(
+                        self._read_request(reader, writer, request_line, cfg, profile), cfg.http_request_timeout)
+                except asyncio.TimeoutError:
+                    await self._send(writer, Response(408, b'Request timed out.'), keep_alive=False)
+                    break
+                except HTTPError as e:
+                    await self._send(writer, Response(e.status, e.message.encode('utf-8')), keep_alive=False)
+                    break
+
+                response = await self._dispatch(request, cfg)
+                await self._send(writer, response, request.keep_alive, head=request.method == 'HEAD')
+                if not request.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass  # Client went away or sent an oversized line
+        except Exception as e:
+            logging.error(f"Error handling connection: {e}")
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                            request_line: bytes, cfg: 'ConfigSnapshot', profile: Optional[str] = None) -> Request:
+        parts = request_line.decode('latin-1').split()
+        if len(parts) != 3 or not parts[2].startswith('HTTP/1.'):
+            raise HTTPError(400, 'Bad request.')
+        method, target, version = parts
+
+        headers: Dict[str, str] = {}
+        header_bytes = 0
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise asyncio.IncompleteReadError(line, None)
+            if line in (b'\r\n', b'\n'):
+                break
+            header_bytes += len(line)
+            if header_bytes > MAX_HEADER_BYTES or len(headers) >= MAX_HEADER_COUNT:
+                raise HTTPError(431, 'Request headers too large.')
+            name, sep, value = line.decode('latin-1').partition(':')
+            if not sep:
+                raise HTTPError(400, 'Bad request.')
+            headers[name.strip().lower()] = value.strip()
+
+        if 'transfer-encoding' in headers:
+            raise HTTPError(411, 'Content-Length required.')
+        try:
+            content_length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HTTPError(400, 'Invalid Content-Length.')
+        if content_length < 0:
+            raise HTTPError(400, 'Invalid Content-Length.')
+        if content_length > cfg.http_max_request_size:
+            raise HTTPError(413, 'Request too large.')
+        if content_length and headers.get('expect', '').lower() == '100-continue':
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        body = await reader.readexactly(content_length) if content_length else b''
+
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.0':
+            keep_alive = connection == 'keep-alive'
+        else:
+            keep_alive = connection != 'close'
+
+        url = urllib.parse.urlsplit(target)
+        query = {key: values[0] for key, values in urllib.parse.parse_qs(url.query).items()}
+        return Request(method.upper(), urllib.parse.unquote(url.path) or '/', query, headers, body, keep_alive, profile)
+
+    async def _dispatch(self, request: Request, cfg: 'ConfigSnapshot') -> Response:
+        endpoint, blocking = self.handler.resolve(request)
+        if not blocking:
+            return endpoint()
+        try:
+            future = self._loop.run_in_executor(self._executor, endpoint)
+            return await asyncio.wait_for(future, cfg.http_request_timeout)
+        except asyncio.TimeoutError:
+            logging.error(f"Request {request.method} {request.path} timed out.")
+            return Response(503, b'Request timed out.')
+
+    async def _send(self, writer: asyncio.StreamWriter, response: Response, keep_alive: bool, head: bool = False):
+        status = response.status
+        try:
+            reason = http.HTTPStatus(status).phrase
+        except ValueError:
+            reason = ''
+        lines = [f"HTTP/1.1 {status} {reason}"]
+        has_body = status not in (204, 304) and status >= 200
+        if has_body:
+            lines.append(f"Content-Type: {response.content_type}")
+            lines.append(f"Content-Length: {len(response.body)}")
+        for name, value in response.headers.items():
+            lines.append(f"{name}: {value}")
+        if keep_alive:
+            lines.append("Connection: keep-alive")
+            lines.append(f"Keep-Alive: timeout={int(settings.http_keepalive_timeout)}")
+        else:
+            lines.append("Connection: close")
+        data = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        if has_body and not head:
+            data += response.body
+        # One write per response so small replies go out in a single segment
+        writer.write(data)
+        await writer.drain()
+
+# ----------------------------- Directory Watchers -------------------------
+
+# inotify event masks (see inotify(7))
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000  # O_NONBLOCK on Linux; os.O_NONBLOCK does not exist on Windows
+IN_CLOEXEC = 0o2000000
+
+INOTIFY_EVENT_HEADER = struct.Struct('iIII')
+
+class PollingWatcher:
+    """
+    Portable watcher that compares directory modification times.
+    Sleeps for monitor_interval between checks and doubles the interval
+    (up to monitor_max_interval) while nothing changes.
+    """
+    name = "polling"
+
+    def __init__(self, interval: float, max_interval: float):
+        self.set_intervals(interval, max_interval)
+        self.current_interval = self.base_interval
+        self._dirs: Dict[Path, int] = {}
+        self._closed = threading.Event()
+
+    def set_intervals(self, interval: float, max_interval: float):
+        """
+        Apply new monitor_interval/monitor_max_interval values (e.g. after a config reload).
+        """
+        self.base_interval = max(interval, 0.01)
+        self.max_interval = max(max_interval, self.base_interval)
+        self.current_interval = getattr(self, 'current_interval', self.base_interval)
+        self.current_interval = min(max(self.current_interval, self.base_interval), self.max_interval)
+
+    def add(self, path: Path):
+        """
+        Start watching a directory.
+        """
+        self._dirs[path] = self._mtime(path)
+
+    def wait(self, timeout: Optional[float] = None) -> set:
+        """
+        Block until a watched directory changes or the timeout expires.
+        Returns the set of directories that changed (empty on timeout).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._closed.is_set():
+            delay = self.current_interval
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return set()
+                delay = min(delay, remaining)
+            self._closed.wait(delay)
+
+            changed = set()
+            for path, last_mtime in self._dirs.items():
+                mtime = self._mtime(path)
+                if mtime != last_mtime:
+                    self._dirs[path] = mtime
+                    changed.add(path)
+            if changed:
+                self.current_interval = self.base_interval
+                return changed
+            self.current_interval = min(self.current_interval * 2, self.max_interval)
+        return set()
+
+    def close(self):
+        self._closed.set()
+
+    @staticmethod
+    def _mtime(path: Path) -> int:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return -1
+
+class InotifyWatcher:
+    """
+    Linux watcher backed by inotify, called through ctypes so no extra
+    dependency is needed. Blocks in select() until the kernel reports a
+    change, so an idle watcher costs no CPU at all.
+    """
+    name = "inotify"
+    EVENT_MASK = (IN_CREATE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE | IN_CLOSE_WRITE
+                  | IN_ATTRIB | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        self._libc = ctypes.CDLL(libc_name or 'libc.so.6', use_errno=True)
+        self._libc.inotify_init1.argtypes = [ctypes.c_int]
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1 failed: {os.strerror(err)}")
+        self._watches: Dict[int, Path] = {}
+
+    def add(self, path: Path):
+        """
+        Start watching a directory.
+        """
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(str(path)), self.EVENT_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_add_watch failed for {path}: {os.strerror(err)}")
+        self._watches[wd] = path
+
+    def set_intervals(self, interval: float, max_interval: float):
+        pass  # Event driven; polling intervals don't apply
+
+    def wait(self, timeout: Optional[float] = None) -> set:
+        """
+        Block until a watched directory changes or the timeout expires.
+        Returns the set of directories that changed (empty on timeout).
+        """
+        try:
+            readable, _, _ = select.select([self._fd], [], [], timeout)
+        except (OSError, ValueError):
+            # The descriptor was closed from another thread
+            return set()
+        if not readable:
+            return set()
+
+        changed = set()
+        while True:
+            try:
+                buffer = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                break
+            offset = 0
+            while offset + INOTIFY_EVENT_HEADER.size <= len(buffer):
+                wd, mask, _cookie, name_len = INOTIFY_EVENT_HEADER.unpack_from(buffer, offset)
+                offset += INOTIFY_EVENT_HEADER.size + name_len
+                if mask & IN_Q_OVERFLOW:
+                    # Events were lost; report every directory so callers rescan
+                    changed.update(self._watches.values())
+                elif wd in self._watches:
+                    changed.add(self._watches[wd])
+                if mask & IN_IGNORED:
+                    self._watches.pop(wd, None)
+        return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+def create_watcher(backend: Optional[str] = None):
+    """
+    Create the directory watcher selected by the 'watcher_backend' setting.
+    'auto' prefers inotify on Linux and falls back to polling elsewhere.
+    """
+    cfg = settings
+    backend = (backend or cfg.watcher_backend or "auto").lower()
+    if backend in ("auto", "inotify") and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError) as e:
+            logging.warning(f"inotify watcher unavailable ({e}). Falling back to polling.")
+    elif backend == "inotify":
+        logging.warning("inotify watcher is only available on Linux. Falling back to polling.")
+    elif backend not in ("auto", "polling"):
+        logging.warning(f"Unknown watcher_backend '{backend}'. Falling back to polling.")
+    return PollingWatcher(cfg.monitor_interval, cfg.monitor_max_interval)
+
+# ----------------------------- File Mover ---------------------------------
+
+MOVE_CHUNK_SIZE = 8 * 1024 * 1024
+FSYNC_POLICIES = ('never', 'cross-device', 'always')
+# errno values meaning "this copy primitive does not work for these two files"
+COPY_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EBADF,
+                        getattr(errno, 'EOPNOTSUPP', errno.EINVAL), getattr(errno, 'ENOTSUP', errno.EINVAL),
+                        getattr(errno, 'ENOTSOCK', errno.EINVAL)}
+
+def fsync_directory(directory: Path):
+    """
+    Flush a directory entry change (rename, create) to disk. No-op where
+    directories cannot be opened (Windows).
+    """
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def copy_file_data(src_fd: int, dst_fd: int, size: int):
+    """
+    Stream size bytes from src_fd to dst_fd in MOVE_CHUNK_SIZE chunks, using
+    copy_file_range or sendfile to keep the data in the kernel where they
+    work, and a plain read/write loop otherwise. Only Linux can sendfile
+    between two regular files; macOS and BSD need a socket as the target.
+    """
+    methods = [name for name in ('copy_file_range', 'sendfile') if hasattr(os, name)
+               and (name != 'sendfile' or sys.platform.startswith('linux'))]
+    offset = 0
+    while offset < size:
+        count = min(MOVE_CHUNK_SIZE, size - offset)
+        method = methods[0] if methods else None
+        try:
+            if method == 'copy_file_range':
+                copied = os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+            elif method == 'sendfile':
+                copied = os.sendfile(dst_fd, src_fd, offset, count)
             else:
-                stable_count = 0
-                previous_size = current_size
-            time.sleep(FILE_CHECK_INTERVAL)
-        return True
+                chunk = memoryview(os.pread(src_fd, count, offset) if hasattr(os, 'pread') else os.read(src_fd, count))
+                copied = len(chunk)
+                written = 0
+                while written < copied:
+                    written += os.write(dst_fd, chunk[written:])
+        except OSError as e:
+            if method is None or e.errno not in COPY_FALLBACK_ERRNOS:
+                raise
+            methods.pop(0)  # Try the next primitive from the same offset
+            os.lseek(src_fd, offset, os.SEEK_SET)
+            os.lseek(dst_fd, offset, os.SEEK_SET)
+            continue
+        if copied == 0:
+            break  # Source shrank; caught by the size check
+        offset += copied
+
+def copy_across_devices(source: Path, target: Path, fsync_policy: str):
+    """
+    Copy source next to target under a temporary name, verify it, rename it
+    over target and unlink source. The copy keeps the source's mode and
+    timestamps. Raises OSError (leaving source untouched) on failure.
+    """
+    temp = target.with_name(f".{target.name}.scdo-tmp")
+    src_fd = os.open(source, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        before = os.fstat(src_fd)
+        dst_fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o600)
+        try:
+            copy_file_data(src_fd, dst_fd, before.st_size)
+            if fsync_policy != 'never':
+                os.fsync(dst_fd)
+            copied = os.fstat(dst_fd)
+        finally:
+            os.close(dst_fd)
+        after = os.stat(source)
+    except BaseException:
+        os.close(src_fd)
+        try:
+            os.unlink(temp)
+        except OSError:
+            pass
+        raise
+    os.close(src_fd)
+
+    try:
+        if copied.st_size != before.st_size:
+            raise OSError(errno.EIO, f"Copied {copied.st_size} of {before.st_size} bytes", str(source))
+        if (after.st_size, after.st_mtime_ns) != (before.st_size, before.st_mtime_ns):
+            raise OSError(errno.EAGAIN, "Source changed while it was being copied", str(source))
+        os.chmod(temp, before.st_mode & 0o7777)
+        os.utime(temp, ns=(before.st_atime_ns, before.st_mtime_ns))
+        os.replace(temp, target)
+    except BaseException:
+        try:
+            os.unlink(temp)
+        except OSError:
+            pass
+        raise
+    if fsync_policy != 'never':
+        fsync_directory(target.parent)
+    os.unlink(source)
+
+def move_file(source: Path, target: Path, fsync_policy: str = 'cross-device') -> str:
+    """
+    Move source to target, replacing an existing target.
+
+    Same-device moves are a single rename. Cross-device moves (case folders on
+    another mount) stream the data with copy_across_devices. fsync_policy:
+    'never' leaves flushing to the OS, 'cross-device' flushes copies before
+    the source is removed, 'always' also flushes the directory after renames.
+    Returns 'rename' or 'copy'; raises OSError on failure.
+    """
+    same_device = os.stat(source).st_dev == os.stat(target.parent).st_dev
+    if same_device:
+        try:
+            os.replace(source, target)
+            if fsync_policy == 'always':
+                fsync_directory(target.parent)
+            return 'rename'
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise  # Overlay and bind mounts can report EXDEV on the same st_dev
+    copy_across_devices(source, target, fsync_policy)
+    return 'copy'
+
+class Mover:
+    """
+    Runs process_downloaded_file for stable downloads on a worker pool.
+
+    A failed move is re-queued with exponential backoff (move_retry_base
+    seconds, doubling up to move_retry_max, for at most move_retries attempts)
+    on a timer heap served by one thread, so neither the workers nor the
+    monitor thread sleep between attempts. The file keeps its file_assignments
+    entry until it is moved or given up on.
+    """
+
+    def __init__(self, workers: int):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mover')
+        self._retries: list = []  # heap of (due, seq, pending)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._retry_thread = threading.Thread(target=self._run_retries, name='mover-retry', daemon=True)
+        self._retry_thread.start()
+
+    def submit(self, pending: 'PendingFile'):
+        self._pool.submit(self._move, pending)
+
+    def retrying(self) -> int:
+        with self._cond:
+            return len(self._retries)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._retries.clear()
+            self._cond.notify_all()
+        self._pool.shutdown(wait=True)
+
+    def _move(self, pending: 'PendingFile'):
+        pending.attempts += 1
+        try:
+            moved = process_downloaded_file(pending)
+        except Exception as e:
+            logging.error(f"Error processing file {pending.name}: {e}")
+            moved = False
+
+        profile = pending.profile
+        cfg = profile.settings
+        if not moved and os.path.lexists(pending.path):
+            if pending.attempts < cfg.move_retries:
+                delay = min(cfg.move_retry_base * 2 ** (pending.attempts - 1), cfg.move_retry_max)
+                logging.warning(f"Retrying move of {pending.name} in {delay:g}s "
+                                f"(attempt {pending.attempts + 1} of {cfg.move_retries}).")
+                self._schedule(pending, delay)
+                return
+            logging.error(f"Failed to move {pending.name} after {pending.attempts} attempts.")
+
+        # Release the file once it is handled so a later change picks it up again
+        profile.job_journal().done(pending.name)
+        with assignments_lock:
+            profile.file_assignments.pop(pending.name, None)
+
+    def _schedule(self, pending: 'PendingFile', delay: float):
+        with self._cond:
+            if self._closed:
+                return
+            self._seq += 1
+            heapq.heappush(self._retries, (time.monotonic() + delay, self._seq, pending))
+            self._cond.notify()
+
+    def _run_retries(self):
+        with self._cond:
+            while not self._closed:
+                if not self._retries:
+                    self._cond.wait()
+                    continue
+                remaining = self._retries[0][0] - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                _, _, pending = heapq.heappop(self._retries)
+                self._pool.submit(self._move, pending)
+
+# ----------------------------- Deduplication ------------------------------
+
+HASH_CHUNK_SIZE = 64 * 1024 * 1024  # Part of the hash definition; changing it invalidates stored hashes
+DEDUP_MODES = ('off', 'hardlink', 'skip')
+DEDUP_SCOPES = ('case', 'all')
+
+def get_hash_pool() -> ThreadPoolExecutor:
+    """
+    Return the shared pool that hashes the chunks of large files in parallel.
+    """
+    global hash_pool
+    if hash_pool is None:
+        with hash_pool_lock:
+            if hash_pool is None:
+                hash_pool = ThreadPoolExecutor(max_workers=settings.dedup_workers, thread_name_prefix='hash')
+    return hash_pool
+
+def hash_chunk(view: memoryview, offset: int) -> bytes:
+    chunk = view[offset:offset + HASH_CHUNK_SIZE]
+    try:
+        return hashlib.blake2b(chunk, digest_size=32).digest()
+    finally:
+        chunk.release()
+
+def content_hash(path: Path, parallel_min_size: int) -> Optional[str]:
+    """
+    Hash a file through mmap without copying it into Python: BLAKE2b over the
+    BLAKE2b digests of its HASH_CHUNK_SIZE chunks. Files of at least
+    parallel_min_size bytes have their chunks hashed on the hash pool
+    (hashlib releases the GIL), smaller ones on the calling thread.
+    Returns None for empty files.
+    """
+    with open(path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return None
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                offsets = range(0, size, HASH_CHUNK_SIZE)
+                if size >= parallel_min_size and len(offsets) > 1:
+                    digests = list(get_hash_pool().map(functools.partial(hash_chunk, view), offsets))
+                else:
+                    digests = [hash_chunk(view, offset) for offset in offsets]
+            finally:
+                view.release()
+    return hashlib.blake2b(b''.join(digests), digest_size=32).hexdigest()
+
+def find_duplicate(pending: 'PendingFile', cfg: 'ConfigSnapshot') -> Optional[Path]:
+    """
+    Return an organized file (within dedup_scope) whose content is identical
+    to the pending download, checking that it has not changed since it was
+    hashed. Indexed files of the same size that were never hashed are hashed
+    now. Sets pending.content_hash.
+    """
+    company, case = pending.assignment
+    if pending.content_hash is None:
+        started = time.perf_counter()
+        pending.content_hash = content_hash(pending.path, cfg.dedup_parallel_min_size)
+        DEDUP_HASH_TIME.observe(time.perf_counter() - started)
+    if pending.content_hash is None:
+        return None
+
+    index = pending.profile.file_index()
+    scope_top = sanitize_filename(company) if cfg.dedup_scope == 'case' else None
+    case_prefix = f"{sanitize_filename(company)}/{sanitize_filename(case)}/"
+    for rel_path, mtime in index.find_by_hash(pending.content_hash, pending.size, scope_top):
+        if cfg.dedup_scope == 'case' and not rel_path.startswith(case_prefix):
+            continue
+        existing = cfg.downloads_dir / rel_path
+        try:
+            st = existing.stat()
+        except OSError:
+            continue
+        if st.st_size == pending.size and st.st_mtime == mtime:
+            return existing
+
+    # Files organized before dedup was enabled have no hash yet; hash the ones of the same size
+    for rel_path, _ in index.find_by_hash(None, pending.size, scope_top):
+        if cfg.dedup_scope == 'case' and not rel_path.startswith(case_prefix):
+            continue
+        existing = cfg.downloads_dir / rel_path
+        try:
+            st = existing.stat()
+            existing_hash = content_hash(existing, cfg.dedup_parallel_min_size)
+        except OSError:
+            continue
+        index.record(rel_path, st.st_mtime, st.st_size, existing_hash)
+        if existing_hash == pending.content_hash:
+            return existing
+    return None
+
+def store_duplicate(pending: 'PendingFile', existing: Path, target: Path, cfg: 'ConfigSnapshot') -> Optional[str]:
+    """
+    Store a download whose content already exists at `existing` without
+    another copy: 'skip' removes the download, 'hardlink' links target to
+    the existing file and removes the download. Returns 'skipped' or
+    'linked', or None if the file should be moved normally.
+    """
+    # A target already linked to the existing file needs nothing more, and
+    # renaming a link over another link to the same inode does nothing
+    if (cfg.dedup_mode == 'skip' or existing == target
+            or (target.exists() and os.path.samefile(target, existing))):
+        os.unlink(pending.path)
+        DEDUP_SAVED_BYTES.inc(pending.size, labels=('skipped',))
+        file_logger.info(f"Skipped {pending.name}: identical to {existing}")
+        return 'skipped'
+
+    temp = target.with_name(f".{target.name}.scdo-tmp")
+    try:
+        os.link(existing, temp)
+    except OSError as e:
+        # Different volume, or a file system without hard links
+        logging.debug(f"Cannot hard-link {target} to {existing}: {e}")
+        return None
+    try:
+        os.replace(temp, target)
+    finally:
+        # Left behind if target became a link to the same inode meanwhile
+        try:
+            os.unlink(temp)
+        except FileNotFoundError:
+            pass
+    os.unlink(pending.path)
+    DEDUP_SAVED_BYTES.inc(pending.size, labels=('linked',))
+    file_logger.info(f"Linked {pending.name} to {target}: identical to {existing}")
+    return 'linked'
+
+# ----------------------------- Archive Index ------------------------------
+
+ARCHIVE_INDEX_DIR = '.scdo_archives'  # Hidden folder in each case folder holding the archive indexes
+ARCHIVE_INDEX_HEADER = '#scdo-archive-index'
+ARCHIVE_SEARCH_DEFAULT_LIMIT = 200
+ARCHIVE_SEARCH_LIMIT = 5000
+
+def archive_format(name: str) -> Optional[str]:
+    """
+    Return 'zip', 'tar' or 'gz' for file names the archive index can read, else None.
+    A '.gz' may hold a tar archive or a single compressed file.
+    """
+    name = name.lower()
+    if name.endswith('.zip'):
+        return 'zip'
+    if name.endswith('.tar'):
+        return 'tar'
+    if name.endswith(('.gz', '.tgz')):
+        return 'gz'
+    return None
+
+def gzip_single_member(path: Path) -> tuple:
+    """
+    Describe a gzip file that is not a tar archive from its header and
+    trailer alone: (original name, uncompressed size modulo 4 GiB).
+    Raises ValueError if it is empty or not a gzip file.
+    """
+    with open(path, 'rb') as file:
+        header = file.read(10)
+        if len(header) < 10 or header[:2] != b'\x1f\x8b':
+            raise ValueError("not a gzip file")
+        name = None
+        if header[3] & 0x04:  # FEXTRA
+            extra_length = struct.unpack('<H', file.read(2))[0]
+            file.seek(extra_length, os.SEEK_CUR)
+        if header[3] & 0x08:  # FNAME, zero-terminated Latin-1
+            raw = bytearray()
+            while (byte := file.read(1)) not in (b'', b'\0'):
+                raw += byte
+            name = raw.decode('latin-1')
+        if file.seek(0, os.SEEK_END) < 18:  # Header and trailer
+            raise ValueError("truncated gzip file")
+        file.seek(-4, os.SEEK_END)
+        size = struct.unpack('<I', file.read(4))[0]
+    return name or path.name[:-3], size
+
+def read_archive_members(path: Path, kind: str):
+    """
+    Yield (name, size, offset) for the files in an archive without extracting
+    anything. Zip archives are read from their central directory and plain
+    tar archives by seeking from header to header; compressed tar archives
+    have to be decompressed as a stream, but their contents are skipped.
+    Offsets are those of a zip member's local header, or of a tar member's
+    data (in the decompressed stream for tar.gz).
+    """
+    if kind == 'zip':
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, info.file_size, info.header_offset
+        return
+    if kind == 'gz':
+        with gzip.open(path, 'rb') as stream:
+            block = stream.read(tarfile.BLOCKSIZE)
+        try:
+            tarfile.TarInfo.frombuf(block, tarfile.ENCODING, 'surrogateescape')
+        except (tarfile.HeaderError, EOFError):
+            name, size = gzip_single_member(path)
+            yield name, size, 0
+            return
+    with tarfile.open(path, 'r:' if kind == 'tar' else 'r|gz') as archive:
+        for member in archive:
+            if member.isreg():
+                yield member.name, member.size, member.offset_data
+            archive.members = []  # Nothing is extracted; do not keep every header in memory
+
+def archive_index_path(case_dir: Path, archive: Path) -> Path:
+    return case_dir / ARCHIVE_INDEX_DIR / archive.relative_to(case_dir).parent / f"{archive.name}.idx"
+
+def archive_error_path(index_path: Path) -> Path:
+    return index_path.with_suffix('.error')
+
+def index_archive(archive: Path, case_dir: Path) -> int:
+    """
+    Write the index of an archive stored in a case folder: a header line with
+    the archive's size and mtime (to detect a replaced archive), then one
+    "name<TAB>size<TAB>offset" line per member. The index gets the archive's
+    mtime so cleanup removes both together. Returns the number of members.
+    """
+    started = time.perf_counter()
+    st = archive.stat()
+    index_path = archive_index_path(case_dir, archive)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    temp = index_path.with_name(f".{index_path.name}.scdo-tmp")
+    count = 0
+    try:
+        with open(temp, 'w', encoding='utf-8', errors='backslashreplace', newline='\n') as out:
+            out.write(f"{ARCHIVE_INDEX_HEADER}\t{st.st_size}\t{st.st_mtime_ns}\n")
+            for name, size, offset in read_archive_members(archive, archive_format(archive.name)):
+                out.write(f"{escape_journal_field(name)}\t{size}\t{offset}\n")
+                count += 1
+        os.utime(temp, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(temp, index_path)
+    except BaseException:
+        temp.unlink(missing_ok=True)
+        raise
+    archive_error_path(index_path).unlink(missing_ok=True)
+    ARCHIVE_INDEX_TIME.observe(time.perf_counter() - started)
+    return count
+
+def record_archive_error(archive: Path, case_dir: Path, error: Exception):
+    """
+    Write why an archive could not be indexed next to where its index would
+    be, with the same header, so searches report it instead of queueing it
+    again until the archive is replaced.
+    """
+    st = archive.stat()
+    error_path = archive_error_path(archive_index_path(case_dir, archive))
+    error_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(error_path, 'w', encoding='utf-8', errors='backslashreplace', newline='\n') as out:
+        out.write(f"{ARCHIVE_INDEX_HEADER}\t{st.st_size}\t{st.st_mtime_ns}\n{error}\n")
+    os.utime(error_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+def archive_index_is_current(index_path: Path, st: os.stat_result) -> bool:
+    try:
+        with open(index_path, encoding='utf-8') as file:
+            header = file.readline()
+    except OSError:
+        return False
+    return header == f"{ARCHIVE_INDEX_HEADER}\t{st.st_size}\t{st.st_mtime_ns}\n"
+
+def get_archive_indexer() -> ThreadPoolExecutor:
+    """
+    Return the single background thread that indexes archives, so reading a
+    large archive never delays moving other downloads.
+    """
+    global archive_indexer
+    if archive_indexer is None:
+        with archive_indexer_lock:
+            if archive_indexer is None:
+                archive_indexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='archive-index')
+    return archive_indexer
+
+def schedule_archive_index(archive: Path, case_dir: Path) -> bool:
+    """
+    Queue an archive for indexing unless it is already queued. Returns True if queued.
+    """
+    with archive_indexer_lock:
+        if archive in archive_index_pending:
+            return False
+        archive_index_pending.add(archive)
+    get_archive_indexer().submit(_run_archive_index, archive, case_dir)
+    return True
+
+def _run_archive_index(archive: Path, case_dir: Path):
+    try:
+        count = index_archive(archive, case_dir)
+        logging.debug(f"Indexed {count} members of {archive}")
+    except FileNotFoundError:
+        pass  # Removed or replaced before it was indexed
     except Exception as e:
-        logging.error(f"Error checking if file is complete: {e}")
+        logging.warning(f"Could not index archive {archive}: {e}")
+        try:
+            record_archive_error(archive, case_dir, e)
+        except OSError as record_error:
+            logging.debug(f"Could not record the indexing error of {archive}: {record_error}")
+    finally:
+        with archive_indexer_lock:
+            archive_index_pending.discard(archive)
+
+def should_index_archive(filename: str, subfolder: str, cfg: 'ConfigSnapshot') -> bool:
+    return cfg.archive_index_enabled and subfolder in cfg.archive_index_subfolders and archive_format(filename) is not None
+
+def archive_search_pattern(query: str) -> 're.Pattern':
+    """
+    Compile a case-insensitive pattern matching the index lines whose member
+    name contains `query`, or, when it has * or ? wildcards, whose full name
+    or base name matches it.
+    """
+    name_char = r'[^\t\n]'
+    if '*' in query or '?' in query:
+        wildcards = {'*': f'{name_char}*', '?': name_char}
+        name = f'(?:{name_char}*/)?' + ''.join(wildcards.get(c) or re.escape(c) for c in query)
+    else:
+        name = f'{name_char}*{re.escape(query)}{name_char}*'
+    return re.compile(rf'^({name})\t(\d+)\t(\d+)$', re.MULTILINE | re.IGNORECASE)
+
+def search_case_archives(cfg: 'ConfigSnapshot', case_number: str, query: str,
+                         company_name: Optional[str] = None, limit: int = ARCHIVE_SEARCH_DEFAULT_LIMIT) -> dict:
+    """
+    Search the indexes of the archives stored for a case (under every company,
+    or only company_name). Archives without a current index are queued for
+    indexing and listed under "pending" instead, and archives that could not
+    be indexed are listed under "failed" with the reason.
+    """
+    pattern = archive_search_pattern(query)
+    case_folder = sanitize_filename(case_number)
+    if company_name is not None:
+        companies = [sanitize_filename(company_name)]
+    else:
+        with os.scandir(cfg.downloads_dir) as entries:
+            companies = sorted(entry.name for entry in entries
+                               if entry.is_dir() and not entry.name.startswith('.')
+                               and entry.name not in excluded_cleanup_folders(cfg))
+
+    matches, pending, failed = [], [], []
+    searched = 0
+    truncated = False
+    for company in companies:
+        case_dir = cfg.downloads_dir / company / case_folder
+        for subfolder in cfg.archive_index_subfolders:
+            try:
+                with os.scandir(case_dir / subfolder) as entries:
+                    archives = sorted((entry for entry in entries if entry.is_file()
+                                       and archive_format(entry.name) is not None), key=lambda e: e.name)
+                    archives = [(Path(entry.path), entry.stat()) for entry in archives]
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            for archive, st in archives:
+                rel_archive = f"{subfolder}/{archive.name}"
+                index_path = archive_index_path(case_dir, archive)
+                if not archive_index_is_current(index_path, st):
+                    error_path = archive_error_path(index_path)
+                    if archive_index_is_current(error_path, st):
+                        error = error_path.read_text(encoding='utf-8').split('\n', 1)[1].strip()
+                        failed.append({"company": company, "archive": rel_archive, "error": error})
+                        continue
+                    schedule_archive_index(archive, case_dir)
+                    pending.append({"company": company, "archive": rel_archive})
+                    continue
+                searched += 1
+                if truncated:
+                    continue
+                text = index_path.read_text(encoding='utf-8')
+                for match in pattern.finditer(text):
+                    if len(matches) == limit:
+                        truncated = True
+                        break
+                    matches.append({"company": company, "archive": rel_archive,
+                                    "member": unescape_journal_field(match.group(1)),
+                                    "size": int(match.group(2)), "offset": int(match.group(3))})
+    return {"case_number": case_number, "query": query, "archives_searched": searched,
+            "matches": matches, "truncated": truncated, "pending": pending, "failed": failed}
+
+# ----------------------------- File Monitoring ----------------------------
+
+def download_start_time(st: os.stat_result, first_seen: float) -> float:
+    """
+    Best estimate of when a download started: the file's creation time where the
+    platform records one (macOS/BSD st_birthtime, Windows st_ctime), otherwise
+    the time the monitor first saw it.
+    """
+    created = getattr(st, 'st_birthtime', None)
+    if created is None and os.name == 'nt':
+        created = st.st_ctime
+    if created is None or created <= 0:
+        return first_seen
+    return min(created, first_seen)
+
+def partial_download_target(name: str, cfg: 'ConfigSnapshot') -> Optional[str]:
+    """
+    If name is a browser's name for a download in progress (Chrome, Edge and
+    Brave .crdownload, Firefox .part, Safari .download, Opera .opdownload,
+    legacy Edge .partial), the name the finished file will be renamed to.
+    Otherwise None.
+    """
+    lowered = name.lower()
+    for suffix in cfg.partial_download_suffixes:
+        if lowered.endswith(suffix) and len(name) > len(suffix):
+            return name[:-len(suffix)]
+    return None
+
+def is_partial_placeholder(entry: os.DirEntry, cfg: 'ConfigSnapshot') -> bool:
+    """
+    Whether entry is the empty file Firefox creates under the final name while
+    the download is still being written to a partial file next to it.
+    """
+    if entry.stat().st_size:
         return False
+    return any(os.path.lexists(entry.path + suffix) for suffix in cfg.partial_download_suffixes)
+
+class PendingFile:
+    """
+    A download waiting to become stable.
+    The case assignment is looked up from the profile's case history once it is stable.
+    """
+    __slots__ = ('path', 'name', 'size', 'mtime', 'mtime_ns', 'stable_count', 'first_seen', 'started_at', 'assignment',
+                 'attempts', 'inode', 'content_hash', 'profile')
+
+    def __init__(self, path: Path, st: os.stat_result, profile: 'Profile'):
+        self.path = path
+        self.profile = profile
+        self.name = path.name
+        self.size = st.st_size
+        self.mtime = st.st_mtime  # As os.stat reports it, so the file index can compare it exactly
+        self.mtime_ns = st.st_mtime_ns
+        self.stable_count = 0
+        self.first_seen = time.time()
+        self.started_at = download_start_time(st, self.first_seen)
+        self.assignment: Optional[tuple] = None
+        self.attempts = 0  # Move attempts so far
+        self.inode = st.st_ino
+        self.content_hash: Optional[str] = None
+
+class StabilityTracker:
+    """
+    Tracks the (size, mtime) of every pending download, of every profile, in
+    one shared table keyed by path. Each tick stats all pending files once, so
+    many simultaneous downloads are checked in parallel instead of blocking on
+    each other.
+    """
+
+    def __init__(self, required_checks: int = 3):
+        self.required_checks = required_checks
+        self._pending: Dict[str, PendingFile] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def __contains__(self, path: Path) -> bool:
+        return str(path) in self._pending
+
+    def track(self, path: Path, profile: 'Profile') -> Optional[PendingFile]:
+        """
+        Start tracking a file. Returns None if it vanished before the first stat.
+        """
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        pending = self._pending[str(path)] = PendingFile(path, st, profile)
+        return pending
+
+    def complete(self, path: Path, profile: 'Profile', started_at: float) -> Optional[PendingFile]:
+        """
+        A browser renamed a finished download into place, so it needs no
+        stability wait: stop tracking it (if it was) and return it, dated to
+        when its partial file appeared. Returns None if it vanished; a file
+        that was tracked is then left for tick() to report.
+        """
+        key = str(path)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            pending = PendingFile(path, st, profile)
+        else:
+            pending.size = st.st_size
+            pending.mtime = st.st_mtime
+            pending.mtime_ns = st.st_mtime_ns
+            pending.inode = st.st_ino
+        pending.started_at = min(pending.started_at, started_at)
+        RENAMED_DOWNLOADS.inc()
+        return pending
+
+    def tick(self) -> tuple:
+        """
+        Stat every pending file once.
+        Returns (stable, vanished): files that have not changed for
+        `required_checks` consecutive ticks and files that disappeared.
+        """
+        stable, vanished = [], []
+        for key, pending in list(self._pending.items()):
+            try:
+                st = os.stat(pending.path)
+            except FileNotFoundError:
+                vanished.append(self._pending.pop(key))
+                continue
+            except OSError as e:
+                logging.error(f"Error checking if file is complete: {e}")
+                continue
+            if st.st_size == 0 and pending.name in pending.profile.partial_downloads:
+                continue  # Placeholder of a download still in progress; complete() releases it
+            if st.st_size == pending.size and st.st_mtime_ns == pending.mtime_ns:
+                pending.stable_count += 1
+                if pending.stable_count >= self.required_checks:
+                    stable.append(self._pending.pop(key))
+                    STABILITY_WAIT.observe(time.time() - pending.first_seen)
+            else:
+                pending.size = st.st_size
+                pending.mtime = st.st_mtime
+                pending.mtime_ns = st.st_mtime_ns
+                pending.stable_count = 0
+        return stable, vanished
+
+class StartupSweep:
+    """
+    Moves files left in a profile's Downloads directory at startup to its no_case_folder.
+    Files of downloads interrupted by a restart (see JobJournal) are left to
+    monitor_downloads, which moves them to the case they were attributed to.
+
+    Runs in the background after the listener is up. The directory is streamed
+    with os.scandir (using the cached DirEntry type information), every
+    leftover is registered in file_assignments so monitor_downloads leaves it
+    alone, and the moves run in batches on a thread pool with os.replace, which
+    overwrites an existing target in a single call. Progress is available
+    through progress() and GET /status.
+    """
+    BATCH_SIZE = 256
+    PROGRESS_LOG_INTERVAL = 10  # Seconds between progress lines in server.log
+
+    def __init__(self, profile: 'Profile', workers: int = 4):
+        self.profile = profile
+        self.workers = workers
+        self.registered = threading.Event()  # Set once every leftover is registered
+        self.finished = threading.Event()
+        self._lock = threading.Lock()
+        self.found = 0
+        self.moved = 0
+        self.failed = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._last_log = 0.0
+
+    def progress(self) -> Dict[str, Any]:
+        with self._lock:
+            end = self.finished_at or time.time()
+            return {
+                "running": self.started_at is not None and not self.finished.is_set(),
+                "listing_complete": self.registered.is_set(),
+                "found": self.found,
+                "moved": self.moved,
+                "failed": self.failed,
+                "elapsed_seconds": round(end - self.started_at, 3) if self.started_at else 0.0,
+            }
+
+    def run(self):
+        """
+        List, register and move the leftover files. Returns when all moves are done.
+        """
+        cfg = self.profile.settings
+        self.started_at = time.time()
+        target_folder = cfg.downloads_dir / cfg.no_case_folder
+        try:
+            target_folder.mkdir(parents=True, exist_ok=True)
+            journal = self.profile.job_journal()
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='sweep') as pool:
+                batch = []
+                present = set()
+                try:
+                    with os.scandir(cfg.downloads_dir) as entries:
+                        for entry in entries:
+                            name = entry.name
+                            # Downloads still in progress are left to monitor_downloads
+                            if (name.startswith('.') or partial_download_target(name, cfg) is not None
+                                    or not entry.is_file() or is_partial_placeholder(entry, cfg)):
+                                continue
+                            present.add(name)
+                            if journal.resumable and journal.claim(name, entry.inode()):
+                                continue  # Interrupted job; monitor_downloads resumes it
+                            batch.append(name)
+                            if len(batch) >= self.BATCH_SIZE:
+                                self._submit(pool, batch, cfg.downloads_dir, target_folder)
+                                batch = []
+                    if batch:
+                        self._submit(pool, batch, cfg.downloads_dir, target_folder)
+                    journal.drop_unclaimed(present)
+                finally:
+                    # Let monitor_downloads start even if listing failed part-way
+                    self.registered.set()
+        except Exception as e:
+            logging.error(f"Error during initial file move to '{cfg.no_case_folder}' folder{self.profile.log_suffix}: {e}")
+        finally:
+            self.registered.set()
+            with self._lock:
+                self.finished_at = time.time()
+            self.finished.set()
+
+        summary = self.progress()
+        logging.info(f"Startup sweep completed{self.profile.log_suffix}: moved {summary['moved']} of {summary['found']} existing files "
+                     f"to '{cfg.no_case_folder}' ({summary['failed']} failed) in {summary['elapsed_seconds']}s.")
 
-def move_existing_files_to_no_case_folder():
+    def _submit(self, pool: ThreadPoolExecutor, names: list, source_dir: Path, target_folder: Path):
+        with assignments_lock:
+            # Skip anything monitor_downloads is already handling
+            file_assignments = self.profile.file_assignments
+            names = [name for name in names if name not in file_assignments]
+            for name in names:
+                file_assignments[name] = (None, None)
+        with self._lock:
+            self.found += len(names)
+        if names:
+            pool.submit(self._move_batch, names, source_dir, target_folder)
+
+    def _move_batch(self, names: list, source_dir: Path, target_folder: Path):
+        moved = failed = 0
+        source_prefix = os.path.join(source_dir, '')
+        target_prefix = os.path.join(target_folder, '')
+        for name in names:
+            try:
+                try:
+                    os.replace(source_prefix + name, target_prefix + name)
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+                    # no_case_folder lives on another mount
+                    move_file(Path(source_prefix + name), Path(target_prefix + name),
+                              self.profile.settings.fsync_policy)
+                moved += 1
+                logging.debug(f"Moved existing file {name} to {target_folder}")
+            except Exception as e:
+                failed += 1
+                logging.error(f"Error moving file {name} to '{target_folder.name}' folder: {e}")
+        with assignments_lock:
+            for name in names:
+                self.profile.file_assignments.pop(name, None)
+        with self._lock:
+            self.moved += moved
+            self.failed += failed
+            now = time.monotonic()
+            log_progress = now - self._last_log >= self.PROGRESS_LOG_INTERVAL
+            if log_progress:
+                self._last_log = now
+        if log_progress:
+            logging.info(f"Startup sweep progress{self.profile.log_suffix}: {self.moved + self.failed}/{self.found} files processed.")
+
+def move_existing_files_to_no_case_folder(sweep: Optional[StartupSweep] = None) -> StartupSweep:
     """
     Move existing files in the Downloads directory to the 'no_case_folder' at startup.
     """
+    sweep = sweep or StartupSweep(get_profile())
+    sweep.run()
+    return sweep
+
+def process_downloaded_file(pending: PendingFile) -> bool:
+    """
+    Move a stable download into its company/case folder (or the no_case_folder).
+    Runs on the Mover pool, which retries it on failure and releases the file's
+    file_assignments entry afterwards. Returns True if the file was moved.
+    """
+    profile = pending.profile
+    cfg = profile.settings
+    file = pending.path
+    filename = pending.name
     try:
-        target_folder = DOWNLOADS_DIR / NO_CASE_FOLDER
+        if pending.assignment is None:
+            # Attribute the file to the case that was active when its download started
+            pending.assignment = profile.case_state.state_at(pending.started_at)
+            with assignments_lock:
+                profile.file_assignments[filename] = pending.assignment
+            profile.job_journal().assigned(filename, pending.assignment)
+            file_logger.info(f"Detected new file: {filename}")
+        assigned_company, assigned_case = pending.assignment
+
+        if assigned_company and assigned_case:
+            # Determine subfolder based on rules
+            match_start = time.perf_counter()
+            subfolder = determine_subfolder(filename, cfg)
+            SUBFOLDER_MATCH_TIME.observe(time.perf_counter() - match_start)
+            target_folder = cfg.downloads_dir / sanitize_filename(assigned_company) / sanitize_filename(assigned_case) / subfolder
+        else:
+            # Move directly to no_case_folder without subfolders
+            target_folder = cfg.downloads_dir / cfg.no_case_folder
+
+        # Create target folder if it doesn't exist
         target_folder.mkdir(parents=True, exist_ok=True)
 
-        for file in DOWNLOADS_DIR.iterdir():
-            if file.is_file() and not file.name.startswith('.') and not file.name.endswith('.crdownload'):
-                try:
-                    destination = target_folder / file.name
-                    if destination.exists():
-                        destination.unlink()  # Remove existing file
-                        logging.info(f"Removed existing file: {destination.name}")
-                    file.rename(destination)
-                    logging.info(f"Moved existing file {file.name} to {target_folder}")
-                except Exception as e:
-                    logging.error(f"Error moving file {file.name} to '{NO_CASE_FOLDER}' folder: {e}")
+        target_filepath = target_folder / filename
+
+        # Identical content already stored for this case: link or skip instead of storing it again
+        if cfg.dedup_mode != 'off' and assigned_company and assigned_case and pending.size >= cfg.dedup_min_size:
+            existing = find_duplicate(pending, cfg)
+            outcome = store_duplicate(pending, existing, target_filepath, cfg) if existing is not None else None
+            if outcome is not None:
+                if outcome == 'linked':
+                    st = os.stat(target_filepath)
+                    rel_path = FileIndex.relative_path(cfg.downloads_dir, target_filepath)
+                    profile.file_index().record(rel_path, st.st_mtime, st.st_size, pending.content_hash)
+                    profile.catalog().add(rel_path, st.st_size, st.st_mtime)
+                    schedule_quota_check(profile, sanitize_filename(assigned_company))
+                    if should_index_archive(filename, subfolder, cfg):
+                        schedule_archive_index(target_filepath, target_folder.parent)
+                DETECTION_TO_MOVE.observe(time.time() - pending.first_seen)
+                return True
+
+        # An existing file in the target is replaced by the move itself
+        if target_filepath.exists():
+            file_logger.info(f"Replacing existing file in target: {target_filepath.name}")
+
+        method = move_file(file, target_filepath, cfg.fsync_policy)
+        file_logger.info(f"Moved {filename} to {target_filepath}" + (" (copied across devices)" if method == 'copy' else ""))
+        FILES_MOVED.inc(labels=(method,))
+        BYTES_MOVED.inc(pending.size)
+        DETECTION_TO_MOVE.observe(time.time() - pending.first_seen)
+        if assigned_company and assigned_case:
+            # The move keeps the mtime, so the tracker's last stat is still accurate
+            rel_path = FileIndex.relative_path(cfg.downloads_dir, target_filepath)
+            profile.file_index().record(rel_path, pending.mtime, pending.size, pending.content_hash)
+            profile.catalog().add(rel_path, pending.size, pending.mtime)
+            schedule_quota_check(profile, sanitize_filename(assigned_company))
+            if should_index_archive(filename, subfolder, cfg):
+                schedule_archive_index(target_filepath, target_folder.parent)
+        return True
     except Exception as e:
-        logging.error(f"Error during initial file move to '{NO_CASE_FOLDER}' folder: {e}")
+        logging.error(f"Attempt {pending.attempts}: Error moving file {filename}: {e}")
+        MOVE_FAILURES.inc()
+        return False
+
+def scan_downloads_dir(profile: 'Profile', tracker: StabilityTracker) -> list:
+    """
+    Register every new file in a profile's Downloads directory with the stability tracker.
+    Files are attributed to a case later, from the time their download started.
+
+    Browsers write a download under a partial name (see partial_download_target)
+    and rename it into place when it is finished. Partial files are never moved;
+    the time each one appeared is remembered, and a file renamed into place from
+    one is complete: it is returned, ready to move, and keeps the partial file's
+    start time. Files that appear without a partial file go through the
+    stability wait.
+    """
+    DIRECTORY_SCANS.inc()
+    cfg = profile.settings
+    file_assignments = profile.file_assignments
+    partial_downloads = profile.partial_downloads
+    with os.scandir(cfg.downloads_dir) as entries:
+        entries = [entry for entry in entries if not entry.name.startswith('.')]
+
+    in_progress = set()
+    finished = []
+    for entry in entries:
+        target = partial_download_target(entry.name, cfg)
+        if target is None:
+            if entry.is_file():
+                finished.append(entry)
+            continue
+        in_progress.add(target)
+        if target not in partial_downloads:
+            try:
+                partial_downloads[target] = download_start_time(entry.stat(), time.time())
+            except FileNotFoundError:
+                in_progress.discard(target)
+
+    ready = []
+    for entry in finished:
+        name = entry.name
+        if name in in_progress:
+            continue  # Placeholder under the final name while the download is in progress (Firefox)
+        file = Path(entry.path)
+        started_at = partial_downloads.pop(name, None)
+
+        with assignments_lock:
+            handled = name in file_assignments
+            if not handled:
+                file_assignments[name] = None  # Detected, not yet attributed
+        if handled:
+            # A placeholder that was already tracked is now the finished file
+            if started_at is not None and file in tracker:
+                pending = tracker.complete(file, profile, started_at)
+                if pending is not None:
+                    ready.append(pending)
+            continue  # Otherwise already being handled
+
+        if started_at is not None:
+            pending = tracker.complete(file, profile, started_at)
+        else:
+            pending = tracker.track(file, profile)
+        if pending is None:
+            with assignments_lock:
+                file_assignments.pop(name, None)
+            continue
 
-def monitor_downloads(server: socketserver.TCPServer):
+        journal = profile.job_journal()
+        resumed = journal.resume(name, pending.inode)
+        if resumed is not None:
+            # Interrupted by a restart; keep the case it was attributed to
+            pending.assignment = (resumed.company_name, resumed.case_number)
+            pending.started_at = resumed.started_at
+            with assignments_lock:
+                file_assignments[name] = pending.assignment
+            logging.info(f"Resuming interrupted download {name} for case {resumed.case_number}{profile.log_suffix}.")
+        else:
+            journal.detected(name, pending.inode, pending.started_at,
+                             profile.case_state.state_at(pending.started_at))
+        if started_at is not None:
+            ready.append(pending)
+
+    # Forget partial files that went away without being renamed into place (cancelled downloads)
+    for target in [target for target in partial_downloads if target not in in_progress]:
+        del partial_downloads[target]
+    return ready
+
+def monitor_downloads(server: 'AsyncHTTPServer'):
     """
-    Monitor the Downloads directory for new files and move them accordingly.
-    Each file is assigned to the current company_name and case_number at the time of detection.
+    Monitor the Downloads directories of all profiles for new files and move them accordingly.
+    Each file is assigned to the company_name and case_number that were active in its profile
+    when its download started. One watcher, one stability tracker and one mover pool serve every
+    profile: all pending files are checked for stability together on every tick, and each one is
+    handed to the mover pool as soon as it is stable.
     """
+    # Leave the files present at startup to the startup sweeps
+    for profile in get_profiles():
+        if profile.startup_sweep is not None:
+            profile.startup_sweep.registered.wait()
+
+    cfg = settings
+    watcher = create_watcher()
+    watched: Dict[Path, Profile] = {}
+    for profile in get_profiles():
+        downloads_dir = profile.settings.downloads_dir
+        watcher.add(downloads_dir)
+        watched[downloads_dir] = profile
+        logging.info(f"Watching {downloads_dir} with the {watcher.name} backend{profile.log_suffix}.")
+
+    tracker = StabilityTracker()
+    mover = Mover(cfg.mover_workers)
+
+    rescan = set(watched)
+    next_tick = time.monotonic()
     while True:
         try:
-            for file in DOWNLOADS_DIR.iterdir():
-                if file.is_file() and not file.name.startswith('.') and not file.name.endswith('.download'):
-                    # Skip files already in no_case_folder or company/case folders
-                    if file.parent == (DOWNLOADS_DIR / NO_CASE_FOLDER):
-                        continue
-                    if current_company_name and current_case_number:
-                        target_folder = DOWNLOADS_DIR / sanitize_filename(current_company_name) / sanitize_filename(current_case_number)
-                        if file.parent == target_folder:
-                            continue  # Already in the correct folder
-                    else:
-                        # If not assigned to a case, skip if already in no_case_folder
-                        if file.parent == (DOWNLOADS_DIR / NO_CASE_FOLDER):
-                            continue
+            if settings is not cfg:
+                # Configuration was reloaded; pick up the new intervals
+                cfg = settings
+                watcher.set_intervals(cfg.monitor_interval, cfg.monitor_max_interval)
 
-                    # Acquire lock to assign case and company
+            if rescan:
+                for downloads_dir in rescan:
+                    # Downloads renamed into place are complete; move them right away
+                    for pending in scan_downloads_dir(watched[downloads_dir], tracker):
+                        mover.submit(pending)
+                rescan = set()
+
+            now = time.monotonic()
+            if tracker and now >= next_tick:
+                stable, vanished = tracker.tick()
+                next_tick = now + cfg.file_check_interval
+                if vanished:
+                    for pending in vanished:
+                        pending.profile.job_journal().done(pending.name)
                     with assignments_lock:
-                        if file.name in file_assignments:
-                            continue  # Already assigned
-                        assigned_company = current_company_name  # Capture current company
-                        assigned_case = current_case_number    # Capture current case
-                        file_assignments[file.name] = (assigned_company, assigned_case)
-
-                    # Check if file is fully downloaded
-                    if is_file_fully_downloaded(file):
-                        filename = file.name
-                        logging.info(f"Detected new file: {filename}")
-
-                        if assigned_company and assigned_case:
-                            # Determine subfolder based on rules
-                            subfolder = determine_subfolder(filename)
-                            target_folder = DOWNLOADS_DIR / sanitize_filename(assigned_company) / sanitize_filename(assigned_case) / subfolder
-                        else:
-                            # Move directly to no_case_folder without subfolders
-                            target_folder = DOWNLOADS_DIR / NO_CASE_FOLDER
-
-                        # Create target folder if it doesn't exist
-                        target_folder.mkdir(parents=True, exist_ok=True)
-
-                        target_filepath = target_folder / filename
-
-                        # If the file already exists in the target, remove it
-                        if target_filepath.exists():
-                            try:
-                                target_filepath.unlink()
-                                logging.info(f"Removed existing file in target: {target_filepath.name}")
-                            except Exception as e:
-                                logging.error(f"Error removing existing file {target_filepath.name}: {e}")
-                                # Remove assignment since move failed
-                                with assignments_lock:
-                                    del file_assignments[file.name]
-                                continue  # Skip moving this file
-
-                        # Move the file with retry
-                        success = move_file_with_retry(file, target_filepath)
-                        if not success:
-                            with assignments_lock:
-                                del file_assignments[file.name]
-                            continue  # Skip to the next file
-
-                        # Remove assignment after moving
-                        with assignments_lock:
-                            del file_assignments[file.name]
+                        for pending in vanished:
+                            pending.profile.file_assignments.pop(pending.name, None)
+                for pending in stable:
+                    mover.submit(pending)
+
+            # Failed moves are retried by the mover with backoff
+            timeout = max(0.0, next_tick - time.monotonic()) if tracker else None
+
+            # Sleep until a directory changes or the next stability check is due
+            rescan = watcher.wait(timeout) & watched.keys()
         except Exception as e:
             logging.error(f"Error in monitor_downloads loop: {e}")
-            time.sleep(ERROR_SLEEP)  # Configurable error sleep intervals
+            time.sleep(settings.error_sleep)  # Configurable error sleep intervals
+            rescan = set(watched)
 
 # ----------------------------- Server Initialization ----------------------
 
-def run_server(server: socketserver.TCPServer):
+def run_server(server: AsyncHTTPServer):
     """
     Start the HTTP server to receive case number and company name notifications.
     """
     try:
-        logging.info(f"Serving at port {PORT} on localhost only.")
+        logging.info(f"Serving at port {settings.port} on localhost only.")
+        for profile_id, profile_socket in server.profile_sockets.items():
+            logging.info(f"Serving profile {profile_id} at port {profile_socket.getsockname()[1]}.")
         server.serve_forever()
     except Exception as e:
         logging.error(f"Error running server: {e}")
@@ -500,33 +4792,60 @@ def main():
     try:
         # Load the configuration at startup
         load_config()
+        start_queued_logging(settings)
 
-        # Ensure the downloads directory exists
-        if not DOWNLOADS_DIR.exists():
-            logging.error(f"Downloads directory does not exist: {DOWNLOADS_DIR}")
-            raise FileNotFoundError(f"Downloads directory does not exist: {DOWNLOADS_DIR}")
+        # Ensure the downloads directories exist
+        for profile_cfg in settings.profiles:
+            downloads_dir = profile_cfg.downloads_dir
+            if not downloads_dir.exists():
+                logging.error(f"Downloads directory does not exist: {downloads_dir}")
+                raise FileNotFoundError(f"Downloads directory does not exist: {downloads_dir}")
 
-        # Move existing files to 'no_case_folder'
-        move_existing_files_to_no_case_folder()
+        # Start cleanup scheduler in a separate thread; it runs the startup cleanup first
+        # and stays idle while cleanup is disabled
+        cleanup_scheduler_thread = threading.Thread(target=cleanup_scheduler, daemon=True)
+        cleanup_scheduler_thread.start()
 
-        # Perform cleanup if enabled
-        cleanup_old_files()
+        # Load the case folders already on disk into the catalog
+        catalog_thread = threading.Thread(target=scan_case_catalogs, daemon=True)
+        catalog_thread.start()
 
-        # Start cleanup scheduler in a separate thread if periodic cleanup is desired
-        if CLEANUP_ENABLED and CLEANUP_INTERVAL:
-            cleanup_scheduler_thread = threading.Thread(target=cleanup_scheduler, daemon=True)
-            cleanup_scheduler_thread.start()
+        # Keep the cleanup file index in sync with the disk in budgeted steps
+        reconcile_thread = threading.Thread(target=reconcile_file_index, daemon=True)
+        reconcile_thread.start()
 
-        # Create the server object
-        with socketserver.TCPServer(("127.0.0.1", PORT), Handler) as httpd:
-            # Start monitoring downloads in a separate thread
-            monitor_thread = threading.Thread(target=monitor_downloads, args=(httpd,), daemon=True)
-            monitor_thread.start()
+        # Archive inactive case folders at a lower priority; idle while cold storage is disabled
+        cold_storage_thread = threading.Thread(target=cold_storage_scheduler, name='cold-storage', daemon=True)
+        cold_storage_thread.start()
+
+        if settings.profiler_enabled:
+            profiler.start(settings.profiler_interval_ms / 1000)
 
+        # Reload config.json when it changes on disk
+        if settings.config_reload_interval > 0:
+            config_watcher_thread = threading.Thread(target=watch_config_file, daemon=True)
+            config_watcher_thread.start()
+
+        # Create the server object
+        # Profiles with a server_port of their own get an extra listener on the same event loop
+        profile_ports = {profile_cfg.port: profile_cfg.profile_id for profile_cfg in settings.profiles
+                         if profile_cfg.port != settings.port}
+        with AsyncHTTPServer(("127.0.0.1", settings.port), Handler(), profile_ports) as httpd:
             # Start the server in a separate thread
             server_thread = threading.Thread(target=run_server, args=(httpd,), daemon=True)
             server_thread.start()
 
+            # Move existing files to 'no_case_folder' in the background
+            for profile in get_profiles():
+                profile.startup_sweep = StartupSweep(profile, settings.mover_workers)
+                sweep_thread = threading.Thread(target=move_existing_files_to_no_case_folder,
+                                                args=(profile.startup_sweep,), daemon=True)
+                sweep_thread.start()
+
+            # Start monitoring downloads in a separate thread
+            monitor_thread = threading.Thread(target=monitor_downloads, args=(httpd,), daemon=True)
+            monitor_thread.start()
+
             # Notify the user that the server is running
             print("SCDO server is up and running.")
             print(ASCII_ART)
@@ -549,6 +4868,8 @@ def main():
         logging.critical(f"Critical error: {e}")
         logging.critical("Exiting script due to critical error.")
         sys.exit(1)
+    finally:
+        stop_queued_logging()
 
 if __name__ == '__main__':
     main()